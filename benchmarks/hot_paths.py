@@ -0,0 +1,201 @@
+"""Benchmark dos caminhos mais usados da plataforma com dados sintéticos.
+
+Gera bases com N usuários (e várias tentativas de quiz por usuário), executa
+login(), register(), run_quiz() e os relatórios do administrador simulando as
+respostas do teclado (input) e mede latência (p50/p90/p99), vazão e pico de
+memória de cada operação. O resultado vai para um arquivo JSON, para comparar
+versões diferentes.
+
+Uso:
+    python benchmarks/hot_paths.py --sizes 1000 10000 100000 --repeat 30 --output bench_results.json
+"""
+import argparse
+import builtins
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from unittest import mock
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+PASSWORD = "Senha@123"
+LOCATIONS = ["SP", "RJ", "MG", "Paraiba", "Bahia", "Ceará", "Paraná", "Goiás"]
+
+
+def generate_dataset(main, users, attempts_per_user, seed=42):
+    """Preenche o diretório de dados com usuários (e o índice de localidades) e estatísticas sintéticas."""
+    rng = random.Random(seed)
+    hashed = main.bcrypt_hash(PASSWORD)  # Um único hash reaproveitado (mesmo custo configurado)
+    quiz_ids = [course["id"] for course in main.load_course_catalog()]
+    stats = {}
+    rows = []
+    for n in range(users):
+        username = f"user{n:07d}"
+        location = rng.choice(LOCATIONS)
+        rows.append({"username": username, "password": hashed, "age": rng.randint(10, 80),
+                     "location": location, "role": "admin" if n % 1000 == 0 else "user",
+                     "location_key": main.canonical_location(location)})
+        user_stats = {}
+        for _ in range(attempts_per_user):
+            quiz = rng.choice(quiz_ids)
+            record = user_stats.setdefault(quiz, {"total_time": 0, "attempts": 0, "correct_answers": 0,
+                                                  "average_time": 0, "total_questions": 0})
+            record["total_time"] += rng.uniform(5, 120)
+            record["attempts"] += 1
+            record["correct_answers"] += rng.randint(0, 3)
+            record["total_questions"] += 3
+            record["average_time"] = record["total_time"] / record["attempts"]
+        if user_stats:
+            stats[username] = user_stats
+    conn = main.open_user_store()
+    with conn:
+        conn.executemany(
+            "INSERT INTO users (username, password, age, location, role, location_key) "
+            "VALUES (:username, :password, :age, :location, :role, :location_key)", rows)
+    main.save_json(main.STATS_FILE, stats)
+    main.load_aggregates()  # Agregados já montados, como em uma base em uso
+
+
+def drive(function, answers, *args):
+    """Executa uma função interativa respondendo os prompts com `answers` (depois, sempre 'q')."""
+    answers = iter(answers)
+    with mock.patch.object(builtins, "input", lambda prompt="": next(answers, "q")), \
+            contextlib.redirect_stdout(io.StringIO()):
+        function(*args)
+        sys.modules["main"].flush_frame()  # Descarta o que ficou no quadro sem prompt final
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(int(p * len(ordered)), len(ordered) - 1)]
+
+
+def measure(name, repeat, make_call):
+    """Mede latência, vazão e pico de memória de uma operação."""
+    latencies = []
+    for i in range(repeat):
+        call = make_call(i)
+        started = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - started)
+    tracemalloc.start()
+    make_call(repeat)()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    total = sum(latencies)
+    return {
+        "operation": name,
+        "repeat": repeat,
+        "mean_ms": 1000 * total / repeat,
+        "p50_ms": 1000 * percentile(latencies, 0.50),
+        "p90_ms": 1000 * percentile(latencies, 0.90),
+        "p99_ms": 1000 * percentile(latencies, 0.99),
+        "throughput_ops": repeat / total if total else None,
+        "peak_memory_kb": peak / 1024,
+    }
+
+
+def run_size(users, attempts_per_user, repeat):
+    """Roda todas as medições para uma base (executado em um processo separado)."""
+    sys.path.insert(0, str(ROOT_DIR))
+    import main
+
+    main.clear_screen = lambda: None
+    # Os limites de tentativas de login recusariam as repetições do benchmark
+    main.LOGIN_BURST = main.LOGIN_MAX_FAILURES = 10 ** 9
+    main._session_bucket = main.new_token_bucket()
+    setup_started = time.perf_counter()
+    generate_dataset(main, users, attempts_per_user)
+    setup_time = time.perf_counter() - setup_started
+    rng = random.Random(7)
+    questions = main.load_course("cyber_quiz")["questions"]
+
+    def existing_user():
+        return f"user{rng.randrange(1, users):07d}"
+
+    # Sessão aberta (como após o login): os resultados do quiz são gravados em segundo plano
+    session = main.open_session(main.get_user(f"user{users - 1:07d}"))
+    operations = [
+        measure("login", repeat, lambda i: lambda: drive(
+            main.login, [existing_user(), PASSWORD, "", "4"])),
+        measure("login_wrong_password", repeat, lambda i: lambda: drive(
+            main.login, [existing_user(), "Errada@123"])),
+        measure("register", repeat, lambda i: lambda: drive(
+            main.register, [f"new{i:07d}", PASSWORD, "30", rng.choice(LOCATIONS), "não"])),
+        measure("run_quiz", repeat, lambda i: lambda: drive(
+            main.run_quiz, ["A", "B", "A"], questions, "cyber_quiz", existing_user())),
+        measure("run_quiz_session", repeat, lambda i: lambda: drive(
+            main.run_quiz, ["A", "B", "A"], questions, "cyber_quiz", session["user"]["username"])),
+        measure("report_users_first_page", repeat, lambda i: lambda: drive(
+            main.show_all_users, ["", "", "1"])),
+        measure("report_users_by_location", repeat, lambda i: lambda: drive(
+            main.show_all_users, ["", "SP", "3"])),
+        measure("report_stats_first_page", repeat, lambda i: lambda: drive(
+            main.show_all_quiz_statistics, ["", "", "", "1"])),
+        measure("report_stats_sorted", max(1, repeat // 10), lambda i: lambda: drive(
+            main.show_all_quiz_statistics, ["", "", "", "2"])),
+        measure("report_locations", repeat, lambda i: lambda: drive(
+            main.show_locations, ["", "2"])),
+        measure("leaderboard", repeat, lambda i: lambda: drive(
+            main.show_leaderboard, ["", ""], existing_user())),
+    ]
+    main.close_session(session)
+    return {"users": users, "attempts_per_user": attempts_per_user,
+            "setup_seconds": setup_time, "operations": operations}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--attempts-per-user", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=30)
+    parser.add_argument("--bcrypt-rounds", default="4", help="custo do bcrypt durante o benchmark")
+    parser.add_argument("--output", type=Path, default=Path("bench_results.json"))
+    parser.add_argument("--run-size", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_size:
+        print(json.dumps(run_size(args.run_size, args.attempts_per_user, args.repeat)))
+        return
+
+    try:
+        revision = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR,
+                                  capture_output=True, text=True).stdout.strip()
+    except OSError:
+        revision = ""
+    report = {
+        "revision": revision,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "bcrypt_rounds": args.bcrypt_rounds,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": [],
+    }
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as data_dir:
+            env = dict(os.environ, UNIAO_DATA_DIR=data_dir, UNIAO_BCRYPT_ROUNDS=args.bcrypt_rounds)
+            child = subprocess.run(
+                [sys.executable, __file__, "--run-size", str(size),
+                 "--attempts-per-user", str(args.attempts_per_user), "--repeat", str(args.repeat)],
+                env=env, capture_output=True, text=True, check=True)
+        result = json.loads(child.stdout)
+        report["results"].append(result)
+        print(f"\n{size} usuários (geração: {result['setup_seconds']:.1f} s)")
+        print(f"{'operação':28} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'ops/s':>9} {'pico KB':>10}")
+        for op in result["operations"]:
+            print(f"{op['operation']:28} {op['p50_ms']:9.2f} {op['p90_ms']:9.2f} {op['p99_ms']:9.2f} "
+                  f"{op['throughput_ops'] or 0:9.1f} {op['peak_memory_kb']:10.1f}")
+    args.output.write_text(json.dumps(report, indent=4))
+    print(f"\nResultados gravados em {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Gerador de carga para o modo servidor (python main.py serve).
+
+Abre N conexões simultâneas; cada cliente se registra, faz login, responde um
+quiz inteiro e sai. Mede a latência de cada comando e a vazão de sessões.
+
+Uso:
+    python benchmarks/load_client.py --clients 1000 --spawn-server
+    python benchmarks/load_client.py --clients 200 --host 127.0.0.1 --port 5050
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+PASSWORD = "Senha@123"
+
+
+async def client(number, args, latencies, failures):
+    """Uma sessão completa: register, login, start, answer... e quit."""
+    reader, writer = await asyncio.open_connection(args.host, args.port, limit=1 << 20)
+
+    async def send(request):
+        started = time.perf_counter()
+        writer.write((json.dumps(request) + "\n").encode("utf-8"))
+        await writer.drain()
+        response = json.loads(await reader.readline())
+        latencies.setdefault(request["cmd"], []).append(time.perf_counter() - started)
+        if not response.get("ok"):
+            failures.append((request["cmd"], response.get("error")))
+        return response
+
+    username = f"carga{args.run_id}-{number}"
+    await send({"cmd": "register", "username": username, "password": PASSWORD,
+                "age": 20 + number % 50, "location": random.choice(["SP", "RJ", "MG"])})
+    await send({"cmd": "login", "username": username, "password": PASSWORD})
+    response = await send({"cmd": "start", "course": args.course})
+    while response.get("ok") and "question" in response:
+        response = await send({"cmd": "answer", "answer": random.choice("ABCD")})
+    await send({"cmd": "quit"})
+    writer.close()
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(int(p * len(ordered)), len(ordered) - 1)]
+
+
+async def run(args):
+    latencies = {}
+    failures = []
+    semaphore = asyncio.Semaphore(args.concurrency or args.clients)
+
+    async def limited(number):
+        async with semaphore:
+            await client(number, args, latencies, failures)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(limited(n) for n in range(args.clients)))
+    elapsed = time.perf_counter() - started
+
+    print(f"Sessões: {args.clients} em {elapsed:.2f} s ({args.clients / elapsed:.1f} sessões/s)")
+    print(f"{'comando':10} {'qtde':>7} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9}")
+    for command, values in latencies.items():
+        print(f"{command:10} {len(values):7d} {1000 * percentile(values, 0.5):9.2f} "
+              f"{1000 * percentile(values, 0.9):9.2f} {1000 * percentile(values, 0.99):9.2f}")
+    if failures:
+        print(f"❌ {len(failures)} comandos falharam, ex.: {failures[:3]}")
+
+
+def wait_for_server(host, port, timeout=15):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            asyncio.run(asyncio.wait_for(asyncio.open_connection(host, port), 1))
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise SystemExit("Servidor não respondeu a tempo.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=0, help="conexões abertas ao mesmo tempo (0 = todas)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5050)
+    parser.add_argument("--course", default="cyber_quiz")
+    parser.add_argument("--spawn-server", action="store_true",
+                        help="inicia um servidor temporário (dados em diretório temporário, bcrypt custo 4)")
+    args = parser.parse_args()
+    args.run_id = f"{os.getpid()}-{int(time.time())}"
+
+    if not args.spawn_server:
+        asyncio.run(run(args))
+        return
+    with tempfile.TemporaryDirectory() as data_dir:
+        # Todos os clientes vêm do mesmo endereço: o limite de logins por endereço precisa comportá-los
+        env = dict(os.environ, UNIAO_DATA_DIR=data_dir, UNIAO_BCRYPT_ROUNDS="4", UNIAO_LOGIN_BURST=str(args.clients))
+        server = subprocess.Popen(
+            [sys.executable, str(ROOT_DIR / "main.py"), "serve", "--host", args.host, "--port", str(args.port)],
+            env=env)
+        try:
+            wait_for_server(args.host, args.port)
+            asyncio.run(run(args))
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
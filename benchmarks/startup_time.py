@@ -0,0 +1,161 @@
+"""Benchmark do tempo de inicialização (import do main.py) com python -X importtime.
+
+Executa `import main` em processos novos, lê o relatório do -X importtime e mostra
+o tempo de import do main.py, o tempo total do processo e os módulos mais caros
+carregados por ele. Também confere que o import não cria nada no diretório de
+dados. Depois mede `python main.py <comando>` com um comando barato (padrão:
+profile-report), que inclui o que o cli() importa antes de despachar, e lista os
+módulos que o comando carrega além do main.py. Com --max-import-ms e
+--max-command-ms, termina com erro se a mediana passar do limite (para manter a
+inicialização enxuta ao longo das versões).
+
+Uso:
+    python benchmarks/startup_time.py --repeat 20 --max-import-ms 60 --max-command-ms 150 --output startup.json
+"""
+import argparse
+import json
+import os
+import shlex
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+
+def parse_importtime(stderr):
+    """Retorna (microssegundos do main, {módulo importado diretamente pelo main: microssegundos})."""
+    children = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        # Formato: "import time: <self> | <cumulativo> | <nome indentado>"
+        self_us, cumulative_us, name = line.split(":", 1)[1].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        name = name.strip()
+        if depth == 0:
+            if name == "main":
+                return int(cumulative_us), children
+            children = {}  # Módulos do próprio interpretador carregados antes
+        elif depth == 1:
+            children[name] = int(cumulative_us)
+    raise RuntimeError("O relatório do -X importtime não contém o main.")
+
+
+def run_once(data_dir):
+    """Importa o main.py em um processo novo e mede o processo inteiro."""
+    env = dict(os.environ, UNIAO_DATA_DIR=str(data_dir))
+    started = time.perf_counter()
+    child = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"],
+                           cwd=ROOT_DIR, env=env, capture_output=True, text=True, check=True)
+    wall = time.perf_counter() - started
+    main_us, children = parse_importtime(child.stderr)
+    return wall, main_us, children, set(imported_modules(child.stderr))
+
+
+def imported_modules(stderr):
+    """Retorna {módulo importado: microssegundos acumulados} de todo o relatório do -X importtime."""
+    modules = {}
+    for line in stderr.splitlines():
+        if line.startswith("import time:") and "self [us]" not in line:
+            _, cumulative_us, name = line.split(":", 1)[1].split("|")
+            modules[name.strip()] = int(cumulative_us)
+    return modules
+
+
+def run_command(data_dir, command):
+    """Roda `python main.py <comando>` em um processo novo e mede o processo inteiro."""
+    env = dict(os.environ, UNIAO_DATA_DIR=str(data_dir))
+    started = time.perf_counter()
+    child = subprocess.run([sys.executable, "-X", "importtime", "main.py", *command],
+                           cwd=ROOT_DIR, env=env, capture_output=True, text=True, check=True)
+    wall = time.perf_counter() - started
+    return wall, imported_modules(child.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--top", type=int, default=10, help="módulos mais caros a exibir")
+    parser.add_argument("--max-import-ms", type=float, help="falha se a mediana do import passar deste valor")
+    parser.add_argument("--command", default="profile-report", help="comando barato do main.py a medir")
+    parser.add_argument("--max-command-ms", type=float, help="falha se a mediana do comando passar deste valor")
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args()
+
+    walls = []
+    imports = []
+    modules = {}
+    import_loaded = set()
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = Path(tmp) / "data"
+        run_once(data_dir)  # Aquecimento: grava o __pycache__ do main.py
+        for _ in range(args.repeat):
+            wall, main_us, children, loaded = run_once(data_dir)
+            walls.append(wall)
+            imports.append(main_us / 1000)
+            import_loaded |= loaded
+            for name, us in children.items():
+                modules.setdefault(name, []).append(us / 1000)
+        side_effects = sorted(str(path.relative_to(tmp)) for path in Path(tmp).rglob("*"))
+
+    command = shlex.split(args.command)
+    command_walls = []
+    command_modules = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = Path(tmp) / "data"
+        run_command(data_dir, command)  # Aquecimento (e dados criados pelo próprio comando)
+        for _ in range(args.repeat):
+            wall, loaded = run_command(data_dir, command)
+            command_walls.append(wall)
+            for name, us in loaded.items():
+                if name not in import_loaded:  # Só o que o comando importa além do `import main`
+                    command_modules.setdefault(name, []).append(us / 1000)
+
+    report = {
+        "python": sys.version.split()[0],
+        "repeat": args.repeat,
+        "import_main_ms": {"p50": statistics.median(imports), "min": min(imports), "max": max(imports)},
+        "process_ms": {"p50": 1000 * statistics.median(walls), "min": 1000 * min(walls)},
+        "modules_ms": dict(sorted(((name, statistics.median(times)) for name, times in modules.items()),
+                                  key=lambda item: item[1], reverse=True)[:args.top]),
+        "side_effects": side_effects,
+        "command": args.command,
+        "command_ms": {"p50": 1000 * statistics.median(command_walls), "min": 1000 * min(command_walls)},
+        "command_modules_ms": dict(sorted(((name, statistics.median(times)) for name, times in command_modules.items()),
+                                          key=lambda item: item[1], reverse=True)[:args.top]),
+    }
+    print(f"import main: p50 {report['import_main_ms']['p50']:.1f} ms "
+          f"(mín. {report['import_main_ms']['min']:.1f} ms, máx. {report['import_main_ms']['max']:.1f} ms)")
+    print(f"processo completo: p50 {report['process_ms']['p50']:.1f} ms")
+    print("Módulos mais caros importados pelo main.py:")
+    for name, ms in report["modules_ms"].items():
+        print(f"  {name:28} {ms:8.2f} ms")
+    print(f"python main.py {args.command}: p50 {report['command_ms']['p50']:.1f} ms "
+          f"(mín. {report['command_ms']['min']:.1f} ms)")
+    print("Módulos importados pelo comando além do `import main`:")
+    for name, ms in report["command_modules_ms"].items():
+        print(f"  {name:28} {ms:8.2f} ms")
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=4))
+        print(f"Resultados gravados em {args.output}")
+
+    failed = False
+    if side_effects:
+        print(f"❌ O import criou arquivos no diretório de dados: {side_effects}")
+        failed = True
+    if args.max_import_ms is not None and report["import_main_ms"]["p50"] > args.max_import_ms:
+        print(f"❌ Import acima do limite de {args.max_import_ms:.1f} ms.")
+        failed = True
+    if args.max_command_ms is not None and report["command_ms"]["p50"] > args.max_command_ms:
+        print(f"❌ Comando acima do limite de {args.max_command_ms:.1f} ms.")
+        failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""Teste de estresse: várias sessões gravando estatísticas e cadastrando usuários ao mesmo tempo.
+
+Cada processo simula uma sessão do main.py registrando tentativas de quiz
+(record_quiz_result) e cadastrando usuários (add_user) no mesmo diretório de
+dados. As localidades são grafias diferentes dos mesmos lugares, então todos os
+cadastros disputam as mesmas linhas do índice de localidades (location_key no
+banco de usuários). Ao final, confere se nenhuma atualização foi perdida.
+
+Antes, uma rodada com um único processo e o mesmo total de operações serve de
+referência: o teste falha se a vazão total com --processes cair abaixo de
+--min-scaling vezes essa referência.
+Se um processo morrer ou não terminar em --timeout segundos, o teste também falha
+em vez de esperar para sempre.
+
+Uso:
+    python benchmarks/stress_concurrency.py --processes 8 --operations 200
+"""
+import argparse
+import multiprocessing
+import os
+import queue
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+LOCATIONS = ("SP", "sp", "São Paulo", "Sao Paulo ", "RJ", "rio de janeiro", "Belo Horizonte - MG")
+
+
+def worker(worker_id, operations, keys, start_event, results):
+    """Executa as operações de uma sessão e devolve o tempo gasto."""
+    sys.path.insert(0, str(ROOT_DIR))
+    import main
+
+    start_event.wait()
+    started = time.perf_counter()
+    for i in range(operations):
+        key = f"user{(worker_id + i) % keys}"
+        main.record_quiz_result(key, "stress_quiz", 1.0, 1, 1)
+        main.add_user({"username": f"sessao{worker_id}-{i}", "password": "hash", "age": 20,
+                       "location": LOCATIONS[(worker_id + i) % len(LOCATIONS)], "role": "user"})
+    results.put((worker_id, time.perf_counter() - started, dict(main.json_write_stats)))
+
+
+def collect_reports(processes, results, deadline):
+    """Recebe o relatório de cada processo; encerra os demais e sai com erro se algum morrer ou travar."""
+    reports = []
+    while len(reports) < len(processes):
+        try:
+            reports.append(results.get(timeout=1))
+            continue
+        except queue.Empty:
+            pass
+        failed = [process for process in processes if process.exitcode not in (None, 0)]
+        if failed or time.perf_counter() > deadline:
+            for process in processes:
+                process.terminate()
+            if failed:
+                print("❌ Processo(s) encerrado(s) com erro: " + ", ".join(
+                    f"{process.name} (código {process.exitcode})" for process in failed))
+            else:
+                print(f"❌ Só {len(reports)} de {len(processes)} processo(s) terminaram no tempo limite.")
+            sys.exit(1)
+    return reports
+
+
+def run_stress(processes, operations, args):
+    """Roda `processes` sessões em um diretório de dados novo, confere os dados e retorna a vazão total."""
+    with tempfile.TemporaryDirectory() as data_dir:
+        os.environ["UNIAO_DATA_DIR"] = data_dir
+        ctx = multiprocessing.get_context("spawn")
+        start_event = ctx.Event()
+        results = ctx.Queue()
+        workers = [
+            ctx.Process(target=worker, args=(n, operations, args.keys, start_event, results))
+            for n in range(processes)
+        ]
+        for process in workers:
+            process.start()
+        time.sleep(1)  # Dá tempo para todos os processos importarem o main.py
+        started = time.perf_counter()
+        start_event.set()
+        reports = collect_reports(workers, results, started + args.timeout)
+        for process in workers:
+            process.join()
+        elapsed = time.perf_counter() - started
+
+        sys.path.insert(0, str(ROOT_DIR))
+        sys.modules.pop("main", None)  # Cada rodada usa outro diretório de dados
+        import main as platform
+        stats = platform.load_json(platform.STATS_FILE, {})
+        conn = platform.open_user_store()
+        users = conn.execute("SELECT count(*) FROM users").fetchone()[0]
+        locations = {key: platform.location_count(key) for key, _, _ in platform.iter_locations()}
+        expected_locations = dict(conn.execute("SELECT location_key, count(*) FROM users GROUP BY location_key"))
+        conn.close()
+    expected = processes * operations
+    attempts = sum(user["stress_quiz"]["attempts"] for user in stats.values())
+    conflicts = sum(report[2]["conflicts"] for report in reports)
+    fallbacks = sum(report[2]["locked_fallbacks"] for report in reports)
+    print(f"Processos: {processes}  Operações por processo: {operations}")
+    print(f"Tempo total: {elapsed:.2f} s  Vazão: {2 * expected / elapsed:.0f} gravações/s "
+          f"({2 * expected / elapsed / processes:.0f} por processo)")
+    print(f"Conflitos otimistas: {conflicts}  Repetições com trava: {fallbacks}")
+    print(f"Tentativas registradas: {attempts}/{expected}  Usuários cadastrados: {users}/{expected}")
+    print(f"Contagens de localidade: {sum(locations.values())}/{expected} em {len(locations)} localidade(s)")
+    if attempts != expected or users != expected or locations != expected_locations:
+        print("❌ Atualizações perdidas!")
+        sys.exit(1)
+    return 2 * expected / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 4)
+    parser.add_argument("--operations", type=int, default=200, help="operações por processo")
+    parser.add_argument("--keys", type=int, default=4, help="usuários disputados entre os processos")
+    parser.add_argument("--timeout", type=float, default=600, help="segundos de espera pelos processos")
+    parser.add_argument("--min-scaling", type=float, default=0.5,
+                        help="fração mínima da vazão de um único processo que deve ser mantida")
+    args = parser.parse_args()
+
+    # A referência faz o mesmo total de operações, com o diário crescendo do mesmo jeito
+    baseline = run_stress(1, args.processes * args.operations, args)
+    throughput = run_stress(args.processes, args.operations, args) if args.processes > 1 else baseline
+    print(f"✅ Nenhuma atualização perdida. Vazão com {args.processes} processo(s): "
+          f"{throughput / baseline:.0%} da de um único processo.")
+    if throughput < args.min_scaling * baseline:
+        print(f"❌ Vazão abaixo de {args.min_scaling:.0%} da de um único processo.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
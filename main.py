@@ -1,37 +1,262 @@
 import os  # Adicionado para limpeza de tela e centralização
+import sys # Importa sys para escrever cada tela de uma só vez
 import time # Importa o módulo time para medir o tempo de execução
-import json # Importa o módulo json para manipulação de arquivos JSON
-import re # Importa o módulo re para expressões regulares
+import threading # Importa threading para tornar as travas de arquivo reentrantes
+import heapq # Importa heapq para ordenar relatórios sem carregar tudo na memória
+import marshal # Importa marshal para o formato compilado do banco de questões
+import atexit # Importa atexit para gravar os relatórios de instrumentação ao sair
+import functools # Importa functools para os decoradores de instrumentação
+import importlib # Importa importlib para carregar os módulos opcionais sob demanda
+import struct # Importa struct para os registros binários do histórico de tentativas
+import mmap # Importa mmap para ler o histórico de tentativas sem copiá-lo
+import signal # Importa signal para saber quando o terminal é redimensionado (SIGWINCH)
+import unicodedata # Importa unicodedata para normalizar os nomes de localidades
 
-from bcrypt import hashpw, checkpw, gensalt # Importa funções do bcrypt para hashing de senhas
-
-from statistics import mean, median, mode, StatisticsError # Importa funções estatísticas
+from collections import OrderedDict # Importa OrderedDict para o cache LRU de documentos JSON
+from contextlib import contextmanager, ExitStack # Importa contextmanager e ExitStack para as travas de arquivo
+from itertools import islice # Importa islice para paginar relatórios
 from pathlib import Path # Importa Path para manipulação de caminhos de arquivos
 
+# Os demais módulos (json, re, sqlite3, bcrypt, statistics, asyncio, csv, argparse, gzip...)
+# são importados dentro das funções que os usam: cada execução em lote ou headless
+# só paga pelo que realmente usa, e nada é carregado ou criado em disco no import.
+
+try:
+    import fcntl # Travas consultivas de arquivo (Linux/macOS)
+except ImportError:
+    fcntl = None
+    import msvcrt # Travas de arquivo no Windows
+
 # Senha secreta para cadastro de administradores
 ADMIN_SECRET = "02plataforma!"  # Altere para a senha desejada
 
+# Custo do bcrypt; hashes gravados com outro custo são refeitos no próximo login
+BCRYPT_ROUNDS = int(os.environ.get("UNIAO_BCRYPT_ROUNDS", "12"))
+# Threads para hashing/verificação de senhas (o bcrypt libera o GIL)
+PASSWORD_WORKERS = int(os.environ.get("UNIAO_PASSWORD_WORKERS", os.cpu_count() or 4))
+
 # Diretórios e arquivos JSON
-BASE_DIR = Path(__file__).resolve().parent / "data"
+# UNIAO_DATA_DIR permite apontar várias sessões (ou benchmarks) para outro diretório
+BASE_DIR = Path(os.environ.get("UNIAO_DATA_DIR", Path(__file__).resolve().parent / "data"))
 USER_DATA_FILE = BASE_DIR / "users.json"
 STATS_FILE = BASE_DIR / "statistics.json"
 LOCATIONS_FILE = BASE_DIR / "locations.json"
-BASE_DIR.mkdir(parents=True, exist_ok=True)
+USERS_DB_FILE = BASE_DIR / "users.db"
+AGGREGATES_FILE = BASE_DIR / "aggregates.json"
+USER_AGGREGATES_FILE = BASE_DIR / "user_aggregates.json"
+COURSE_CACHE_DIR = BASE_DIR / "cache"
+PROFILE_TOTALS_FILE = BASE_DIR / "profile_totals.json"
+ATTEMPTS_LOG_FILE = BASE_DIR / "attempts.bin"
+ATTEMPT_IDS_FILE = BASE_DIR / "attempt_ids.jsonl"
+LOGIN_THROTTLE_FILE = BASE_DIR / "login_throttle.json"
+SNAPSHOT_DIR = BASE_DIR / "snapshots"
+QUESTION_STATS_FILE = BASE_DIR / "question_stats.json"
+LEARNER_STATS_FILE = BASE_DIR / "learner_stats.json"
+SCHEMA_FILE = BASE_DIR / "schema.json"
+# Documentos JSON com os dados da plataforma: todos entram nos snapshots (ao criar
+# um arquivo de dados novo, registre-o aqui). Ficam de fora o users.json legado e
+# as métricas de instrumentação.
+DATA_JSON_FILES = (STATS_FILE, LOCATIONS_FILE, AGGREGATES_FILE, USER_AGGREGATES_FILE, LOGIN_THROTTLE_FILE,
+                   QUESTION_STATS_FILE, LEARNER_STATS_FILE, SCHEMA_FILE)
+
+# Relatório analítico: faixas etárias (limite inferior de cada faixa) e ranking de desempenho
+AGE_BAND_EDGES = (0, 18, 25, 35, 45, 60)
+AGE_BAND_LABELS = ("até 17", "18-24", "25-34", "35-44", "45-59", "60+")
+ANALYTICS_TOP_K = 10
+ANALYTICS_MIN_QUESTIONS = 5  # Mínimo de questões respondidas para entrar no ranking
+
+# Estados brasileiros: a sigla é a chave canônica de "SP", "sp", "São Paulo", "Sao Paulo - SP"...
+BRAZIL_STATES = {
+    "AC": "Acre", "AL": "Alagoas", "AP": "Amapá", "AM": "Amazonas", "BA": "Bahia", "CE": "Ceará",
+    "DF": "Distrito Federal", "ES": "Espírito Santo", "GO": "Goiás", "MA": "Maranhão", "MT": "Mato Grosso",
+    "MS": "Mato Grosso do Sul", "MG": "Minas Gerais", "PA": "Pará", "PB": "Paraíba", "PR": "Paraná",
+    "PE": "Pernambuco", "PI": "Piauí", "RJ": "Rio de Janeiro", "RN": "Rio Grande do Norte",
+    "RS": "Rio Grande do Sul", "RO": "Rondônia", "RR": "Roraima", "SC": "Santa Catarina",
+    "SP": "São Paulo", "SE": "Sergipe", "TO": "Tocantins"
+}
+
+# Banco de questões: um arquivo JSON por curso, listado em courses/index.json
+COURSES_DIR = Path(__file__).resolve().parent / "courses"
+COURSES_INDEX_FILE = COURSES_DIR / "index.json"
+
+# Instrumentação (desligada por padrão): UNIAO_PROFILE=timers|cprofile|tracemalloc ou --profile
+PROFILE_MODES = ("timers", "cprofile", "tracemalloc")
+profile_state = {"mode": None, "profiler": None}
+session_metrics = {}  # nome -> {"count", "total", "max"} (em segundos)
+_metrics_lock = threading.Lock()
+
+_optional_modules = {}
+
+def optional_module(name):
+    """Importa um módulo opcional no primeiro uso. Retorna None se ele não estiver instalado."""
+    if name not in _optional_modules:
+        try:
+            _optional_modules[name] = importlib.import_module(name)
+        except ImportError:
+            _optional_modules[name] = None
+    return _optional_modules[name]
+
+def record_metric(name, elapsed):
+    """Acumula a duração de uma operação nas métricas da sessão."""
+    with _metrics_lock:
+        metric = session_metrics.setdefault(name, {"count": 0, "total": 0.0, "max": 0.0})
+        metric["count"] += 1
+        metric["total"] += elapsed
+        metric["max"] = max(metric["max"], elapsed)
+
+def instrumented(name):
+    """Decorador que cronometra a função quando a instrumentação está ligada."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if profile_state["mode"] is None:
+                return function(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record_metric(name, time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+def enable_profiling(mode):
+    """Liga a instrumentação: cronômetros sempre; cProfile ou tracemalloc conforme o modo."""
+    if not mode or profile_state["mode"] is not None:
+        return
+    mode = mode if mode in PROFILE_MODES else "timers"
+    profile_state["mode"] = mode
+    if mode == "cprofile":
+        import cProfile
+        profile_state["profiler"] = cProfile.Profile()
+        profile_state["profiler"].enable()
+    elif mode == "tracemalloc":
+        import tracemalloc
+        tracemalloc.start(25)
+    atexit.register(finish_profiling)
+
+def format_metrics(metrics):
+    """Formata as métricas como tabela (nome, chamadas, total, média e máximo em ms)."""
+    lines = [f"{'operação':24} {'chamadas':>9} {'total ms':>11} {'média ms':>10} {'máx ms':>10}"]
+    for name, metric in sorted(metrics.items(), key=lambda item: -item[1]["total"]):
+        lines.append(
+            f"{name:24} {metric['count']:9d} {1000 * metric['total']:11.1f} "
+            f"{1000 * metric['total'] / metric['count']:10.2f} {1000 * metric['max']:10.2f}"
+        )
+    return "\n".join(lines)
+
+def profiling_report():
+    """Relatório da sessão atual: tempos por operação e contadores de cache/gravação."""
+    with _metrics_lock:
+        metrics = {name: dict(metric) for name, metric in session_metrics.items()}
+    return (
+        "=== Instrumentação da sessão ===\n"
+        + format_metrics(metrics)
+        + f"\nCache JSON: {json_cache_stats}\nGravações JSON: {json_write_stats}"
+        + f"\nAutenticação: {auth_stats}\nSessões: {session_stats}"
+    )
+
+def finish_profiling():
+    """Ao sair: imprime o relatório, soma ao acumulado em disco e grava os perfis capturados."""
+    print(profiling_report())
+    with _metrics_lock:
+        metrics = {name: dict(metric) for name, metric in session_metrics.items()}
+
+    def build_changes(totals):
+        changes = []
+        for name, metric in metrics.items():
+            total = dict(totals.get(name, {"count": 0, "total": 0.0, "max": 0.0}))
+            total["count"] += metric["count"]
+            total["total"] += metric["total"]
+            total["max"] = max(total["max"], metric["max"])
+            changes.append({"op": "set", "path": [name], "value": total})
+        return changes
+
+    if metrics:
+        update_json(PROFILE_TOTALS_FILE, {}, build_changes)
+    stamp = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+    if profile_state["mode"] == "cprofile":
+        profile_state["profiler"].disable()
+        profile_path = BASE_DIR / f"profile-{stamp}.prof"
+        ensure_directory_exists(profile_path)
+        profile_state["profiler"].dump_stats(profile_path)
+        print(f"Perfil do cProfile gravado em {profile_path}")
+    elif profile_state["mode"] == "tracemalloc":
+        import tracemalloc
+        snapshot = tracemalloc.take_snapshot()
+        snapshot_path = BASE_DIR / f"tracemalloc-{stamp}.snapshot"
+        ensure_directory_exists(snapshot_path)
+        snapshot.dump(snapshot_path)
+        tracemalloc.stop()
+        print("Maiores alocações:")
+        for stat in snapshot.statistics("lineno")[:10]:
+            print(f"  {stat}")
+        print(f"Snapshot do tracemalloc gravado em {snapshot_path}")
+
+def show_cumulative_profile():
+    """Imprime os tempos acumulados de todas as sessões instrumentadas."""
+    totals = load_json(PROFILE_TOTALS_FILE, {})
+    if not totals:
+        print("Nenhuma métrica acumulada. Rode com UNIAO_PROFILE=timers ou --profile.")
+        return
+    print("=== Instrumentação acumulada ===")
+    print(format_metrics(totals))
+
+# Sequência ANSI que limpa a tela e volta o cursor ao topo (sem abrir um subprocesso)
+CLEAR_SEQUENCE = "\033[2J\033[H"
+
+# Estado do renderizador: tamanho do terminal em cache e linhas do quadro atual
+render_state = {"size": None, "resize_handler": False, "windows_ansi": False}
+_frame = []
+
+def invalidate_terminal_size(signum=None, frame=None):
+    """Descarta o tamanho em cache (chamado pelo SIGWINCH quando o terminal é redimensionado)."""
+    render_state["size"] = None
+
+def terminal_size():
+    """Retorna (colunas, linhas) do terminal, consultando o sistema só quando o tamanho muda."""
+    if render_state["size"] is None:
+        if not render_state["resize_handler"] and hasattr(signal, "SIGWINCH") \
+                and threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGWINCH, invalidate_terminal_size)
+            render_state["resize_handler"] = True
+        try:
+            size = os.get_terminal_size()
+            render_state["size"] = (size.columns, size.lines)
+        except OSError:
+            render_state["size"] = (80, 24)
+    return render_state["size"]
+
+def render_line(text="", center=True):
+    """Acrescenta uma linha (centralizada por padrão) ao quadro que será escrito de uma vez."""
+    _frame.append(text.center(terminal_size()[0]) if center else text)
+
+def flush_frame():
+    """Escreve o quadro acumulado em uma única chamada ao terminal."""
+    if _frame:
+        sys.stdout.write("\n".join(_frame) + "\n")
+        _frame.clear()
+    sys.stdout.flush()
+
+def ask(prompt):
+    """Escreve o quadro pendente e lê a resposta do usuário."""
+    flush_frame()
+    return input(prompt)
 
+@instrumented("screen.clear")
 def clear_screen():
-    """Limpa a tela do console."""
-    os.system('cls' if os.name == 'nt' else 'clear')
+    """Limpa a tela do console (escape ANSI no início do próximo quadro)."""
+    if os.name == 'nt' and not render_state["windows_ansi"]:
+        os.system('')  # Habilita as sequências ANSI no console do Windows (uma única vez)
+        render_state["windows_ansi"] = True
+    if not render_state["resize_handler"]:
+        invalidate_terminal_size()  # Sem SIGWINCH (ex.: Windows), o tamanho é conferido a cada tela
+    _frame.append(CLEAR_SEQUENCE)
 
+@instrumented("screen.banner")
 def print_banner(text):
     """Imprime um banner centralizado no console (horizontal e vertical)."""
     clear_screen()
-    try:
-        size = os.get_terminal_size()
-        columns = size.columns
-        lines = size.lines
-    except OSError:
-        columns = 80
-        lines = 24
+    lines = terminal_size()[1]
 
     banner_lines = [
         "",
@@ -41,46 +266,1139 @@ def print_banner(text):
     ]
     total_banner_lines = len(banner_lines)
     empty_lines = max((lines - total_banner_lines) // 2, 0)
-    print("\n" * empty_lines)
+    render_line("\n" * empty_lines, center=False)
     for line in banner_lines:
-        print(line.center(columns))
+        render_line(line)
 
 def ensure_directory_exists(file_path):
     """Garante que o diretório do arquivo exista."""
     file_path.parent.mkdir(parents=True, exist_ok=True)
 
-def load_json(file_path, default_data):
-    """Carrega dados de um arquivo JSON ou cria com dados padrão."""
-    #print(f"[DEBUG] Carregando: {file_path}")  # Debug para ver onde está lendo
+# Tamanho mínimo do diário (em bytes) antes de compactá-lo no arquivo principal
+JOURNAL_COMPACT_MIN_BYTES = 256 * 1024
+
+# Quantidade de registros por página nos relatórios do administrador
+REPORT_PAGE_SIZE = 20
+
+# Orçamento do cache de JSON em memória, medido pelo tamanho dos arquivos em disco
+JSON_CACHE_MAX_BYTES = 32 * 1024 * 1024
+
+# Cache LRU: caminho -> (assinatura dos arquivos, custo em bytes, documento)
+_json_cache = OrderedDict()
+_json_cache_guard = threading.RLock()  # A thread de gravação das sessões também usa o cache
+json_cache_stats = {"hits": 0, "misses": 0, "evictions": 0, "bytes": 0, "index_reads": 0}
+
+# Leituras por chave (load_json_items) de documentos fora do cache, como o statistics.json
+# com muitos usuários, usam um índice: caminho -> {"base": assinatura do arquivo principal,
+# "spans": {chave: (início, fim) em bytes}, "journal": identidade do diário, "journal_bytes":
+# bytes do diário já aplicados, "values": {chave: valor após as alterações do diário}}
+_json_indexes = {}
+_json_indexes_guard = threading.Lock()
+_DELETED = object()  # Valor de uma chave removida pelo diário
+
+# Travas de arquivo mantidas por este processo: caminho -> estado da trava
+_file_locks = {}
+_file_locks_guard = threading.Lock()
+json_write_stats = {"commits": 0, "conflicts": 0, "locked_fallbacks": 0, "compactions": 0, "compaction_errors": 0}
+
+# Arquivos com compactação em andamento neste processo (uma thread de fundo por arquivo)
+_compactions = set()
+_compactions_guard = threading.Lock()
+
+@contextmanager
+def file_lock(file_path):
+    """Trava exclusiva entre processos (arquivo .lock com fcntl), reentrante no mesmo processo."""
+    key = str(file_path)
+    with _file_locks_guard:
+        state = _file_locks.setdefault(key, {"thread_lock": threading.RLock(), "depth": 0, "file": None})
+    with state["thread_lock"]:
+        if state["depth"] == 0:
+            lock_path = file_path.with_name(file_path.name + ".lock")
+            ensure_directory_exists(lock_path)
+            lock_file = lock_path.open('a+b')
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            state["file"] = lock_file
+        state["depth"] += 1
+        try:
+            yield
+        finally:
+            state["depth"] -= 1
+            if state["depth"] == 0:
+                lock_file = state["file"]
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+                else:
+                    lock_file.seek(0)
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+                lock_file.close()
+                state["file"] = None
+
+def journal_path(file_path):
+    """Retorna o caminho do diário (append-only) associado a um arquivo JSON."""
+    return file_path.with_name(file_path.name + ".journal")
+
+def write_json_file(path, data):
+    """Grava o JSON (indentado) e força a gravação em disco.
+
+    `data` é o documento ou um iterador de pares (chave, valor) de um objeto, como o
+    de iter_json_file_items (assim a compactação não monta o documento inteiro).
+    Objetos são gravados item a item, no mesmo formato do json.dump(indent=4), e o
+    retorno é {chave: (início, fim)}: a posição em bytes de cada item no arquivo.
+    """
+    import json
+    spans = {}
+    with path.open('wb') as file:
+        if isinstance(data, dict) or hasattr(data, "__next__"):
+            file.write(b"{")
+            for key, value in (data.items() if isinstance(data, dict) else data):
+                start = file.tell()
+                item = json.dumps({key: value}, indent=4)[1:-2]  # '\n    "chave": valor'
+                file.write((("," if spans else "") + item).encode('utf-8'))
+                spans[key] = (start, file.tell())
+            file.write(b"\n}" if spans else b"}")
+        else:
+            file.write(json.dumps(data, indent=4).encode('utf-8'))
+        file.flush()
+        os.fsync(file.fileno())
+    return spans
+
+@instrumented("json.serialize")
+def write_json_atomic(file_path, data):
+    """Grava o JSON em um arquivo temporário e o substitui atomicamente.
+
+    Retorna as posições dos itens (write_json_file) e a assinatura do arquivo gravado.
+    """
     ensure_directory_exists(file_path)
-    if not file_path.exists():
-        with file_path.open('w') as file:
-            json.dump(default_data, file)
+    tmp_path = file_path.with_name(file_path.name + ".tmp")
+    spans = write_json_file(tmp_path, data)
+    info = tmp_path.stat()
+    os.replace(tmp_path, file_path)
+    return spans, (info.st_mtime_ns, info.st_size)
+
+def apply_json_change(data, change):
+    """Aplica uma alteração do diário ao documento em memória."""
+    *parents, key = change["path"]
+    target = data
+    for part in parents:
+        target = target.setdefault(part, {})
+    if change["op"] == "set":
+        target[key] = change["value"]
+    elif change["op"] == "delete":
+        target.pop(key, None)
+
+def json_file_signature(file_path):
+    """Retorna (mtime, tamanho) do arquivo e do seu diário, usado para revalidar o cache."""
+    signature = []
+    for path in (file_path, journal_path(file_path)):
+        try:
+            info = path.stat()
+            signature.append((info.st_mtime_ns, info.st_size))
+        except FileNotFoundError:
+            signature.append(None)
+    return tuple(signature)
+
+def cache_json(file_path, signature, data):
+    """Guarda um documento no cache, removendo os menos usados se passar do orçamento."""
+    key = str(file_path)
+    cost = sum(part[1] for part in signature if part is not None)
+    with _json_cache_guard:
+        drop_cached_json(file_path)
+        if cost > JSON_CACHE_MAX_BYTES:
+            return
+        _json_cache[key] = (signature, cost, data)
+        json_cache_stats["bytes"] += cost
+        while json_cache_stats["bytes"] > JSON_CACHE_MAX_BYTES:
+            _, (_, old_cost, _) = _json_cache.popitem(last=False)
+            json_cache_stats["bytes"] -= old_cost
+            json_cache_stats["evictions"] += 1
+
+def drop_cached_json(file_path):
+    """Remove um documento do cache."""
+    with _json_cache_guard:
+        entry = _json_cache.pop(str(file_path), None)
+        if entry is not None:
+            json_cache_stats["bytes"] -= entry[1]
+
+@instrumented("json.parse")
+def read_json_file(file_path, default_data):
+    """Lê o arquivo JSON do disco e reaplica as alterações do diário."""
+    import json
     with file_path.open('r') as file:
         try:
-            return json.load(file)
+            data = json.load(file)
         except json.JSONDecodeError:
             return default_data
+    journal = journal_path(file_path)
+    if journal.exists():
+        with journal.open('r') as file:
+            for line in file:
+                try:
+                    change = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Linha incompleta de uma gravação interrompida
+                apply_json_change(data, change)
+    return data
+
+def load_json_versioned(file_path, default_data):
+    """Carrega um documento JSON e retorna (dados, versão), onde a versão é a assinatura dos arquivos."""
+    ensure_directory_exists(file_path)
+    if not file_path.exists():
+        with file_lock(file_path):
+            if not file_path.exists():
+                write_json_atomic(file_path, default_data)
+    signature = json_file_signature(file_path)
+    with _json_cache_guard:
+        entry = _json_cache.get(str(file_path))
+        if entry is not None and entry[0] == signature:
+            json_cache_stats["hits"] += 1
+            _json_cache.move_to_end(str(file_path))
+            return entry[2], signature
+    json_cache_stats["misses"] += 1
+    while True:
+        data = read_json_file(file_path, default_data)
+        # Se outra sessão compactou ou gravou durante a leitura, lê de novo
+        current = json_file_signature(file_path)
+        if current == signature:
+            break
+        signature = current
+    if data is not default_data:
+        cache_json(file_path, signature, data)
+    return data, signature
+
+@instrumented("json.load")
+def load_json(file_path, default_data):
+    """Carrega dados de um arquivo JSON (mais as alterações do diário) ou cria com dados padrão.
+
+    O documento fica em cache e só é relido quando o mtime/tamanho do arquivo
+    ou do diário mudar. O retorno é compartilhado: não o modifique diretamente,
+    registre as mudanças com update_json(), append_json_changes() ou save_json().
+    """
+    #print(f"[DEBUG] Carregando: {file_path}")  # Debug para ver onde está lendo
+    return load_json_versioned(file_path, default_data)[0]
+
+def iter_json_container(file_path, key=None, resume=None, kinds="{[", chunk_size=64 * 1024, offsets=True):
+    """Lê em fluxo os itens de um objeto ou lista JSON e produz (chave, valor, retomada).
+
+    Só um item por vez fica na memória, então funciona com arquivos maiores que a RAM.
+    Com `key`, percorre o contêiner guardado nessa chave do objeto raiz (como a lista
+    "users" do users.json); nas listas a chave é None. A retomada é [offset em bytes
+    logo após o item, tipo do contêiner]: passá-la em `resume` continua a leitura dali
+    (com offsets=False ela não é calculada e vem como None).
+    """
+    import codecs
+    import json
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    offset, kind = resume or (0, None)
+    with file_path.open('rb') as file:
+        file.seek(offset)
+        buffer = ""
+        position = 0
+        counted = 0  # Até onde do buffer os bytes já foram somados ao offset
+        eof = False
+
+        def tell():
+            nonlocal offset, counted
+            offset += len(buffer[counted:position].encode('utf-8'))
+            counted = position
+            return offset
+
+        def fill():
+            nonlocal buffer, position, counted, eof
+            chunk = file.read(chunk_size)
+            if not chunk:
+                eof = True
+            if offsets:
+                tell()
+            buffer = buffer[position:] + text_decoder.decode(chunk, final=eof)
+            position = counted = 0
+
+        def skip_whitespace():
+            nonlocal position
+            while True:
+                while position < len(buffer) and buffer[position].isspace():
+                    position += 1
+                if position < len(buffer) or eof:
+                    return
+                fill()
+
+        def expect(chars):
+            nonlocal position
+            skip_whitespace()
+            char = buffer[position:position + 1]
+            if not char or char not in chars:
+                raise json.JSONDecodeError(f"Esperado um de {chars!r}", buffer, position)
+            position += 1
+            return char
+
+        def decode():
+            # Repete com mais dados se o valor (ou um número) terminar no fim do bloco
+            nonlocal position
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buffer, position)
+                    if end < len(buffer) or eof:
+                        position = end
+                        return value
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                fill()
+
+        if kind is None:
+            if key is None:
+                kind = expect(kinds)
+            else:
+                expect("{")
+                while kind is None:
+                    skip_whitespace()
+                    if buffer[position:position + 1] == "}":
+                        return  # A chave não existe
+                    name = decode()
+                    expect(":")
+                    skip_whitespace()
+                    if name == key:
+                        kind = expect(kinds)
+                    else:
+                        decode()  # Valor de outra chave
+                        skip_whitespace()
+                        if buffer[position:position + 1] == ",":
+                            position += 1
+        closing = "}" if kind == "{" else "]"
+        while True:
+            skip_whitespace()
+            if buffer[position:position + 1] == ",":
+                position += 1
+                skip_whitespace()
+            if buffer[position:position + 1] == closing:
+                return
+            item_key = None
+            if kind == "{":
+                item_key = decode()
+                expect(":")
+                skip_whitespace()
+            value = decode()
+            yield item_key, value, [tell(), kind] if offsets else None
+
+def iter_json_object_file(file_path, chunk_size=64 * 1024):
+    """Lê um objeto JSON do disco em blocos e produz (chave, valor) do nível superior."""
+    for key, value, _ in iter_json_container(file_path, kinds="{", chunk_size=chunk_size, offsets=False):
+        yield key, value
+
+def iter_json_items(file_path, default_data):
+    """Percorre (chave, valor) do nível superior de um documento, incluindo as alterações do diário.
+
+    Usa o documento em cache quando ele está válido; caso contrário lê o arquivo
+    em fluxo e aplica as alterações do diário (que é limitado pela compactação).
+    """
+    if not file_path.exists():
+        load_json(file_path, default_data)
+    entry = _json_cache.get(str(file_path))
+    if entry is not None and entry[0] == json_file_signature(file_path):
+        yield from list(entry[2].items())
+        return
+    yield from iter_json_file_items(file_path)
+
+def iter_json_file_items(file_path, journal_bytes=None):
+    """Lê do disco, em fluxo, (chave, valor) do nível superior com as alterações do diário.
+
+    Das alterações do diário fica na memória só a última de cada caminho (uma
+    alteração em ["ana"] substitui as anteriores em ["ana", ...]). Com `journal_bytes`,
+    só as alterações gravadas nesses primeiros bytes do diário são aplicadas.
+    """
+    import json
+    pending = {}
+    journal = journal_path(file_path)
+    if journal.exists():
+        with journal.open('rb') as file:
+            for line in file:
+                if journal_bytes is not None:
+                    journal_bytes -= len(line)
+                    if journal_bytes < 0:
+                        break
+                try:
+                    change = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                path = tuple(change["path"])
+                changes = pending.setdefault(path[0], {})
+                for overwritten in [other for other in changes if other[:len(path)] == path]:
+                    del changes[overwritten]
+                changes[path] = change
+    try:
+        for key, value in iter_json_object_file(file_path):
+            document = {key: value}
+            for change in pending.pop(key, {}).values():
+                apply_json_change(document, change)
+            if key in document:
+                yield key, document[key]
+    except json.JSONDecodeError:
+        pass  # Mesmo comportamento de load_json com arquivo corrompido
+    for key, changes in pending.items():
+        document = {}
+        for change in changes.values():
+            apply_json_change(document, change)
+        if key in document:
+            yield key, document[key]
+
+def read_json_span(file, span):
+    """Decodifica o valor do item gravado entre as posições `span` do arquivo principal."""
+    import json
+    file.seek(span[0])
+    text = file.read(span[1] - span[0]).decode('utf-8').lstrip("{, \t\r\n")
+    decoder = json.JSONDecoder()
+    _, end = decoder.raw_decode(text)  # A chave
+    return decoder.raw_decode(text[end:].lstrip(": \t\r\n"))[0]
+
+def install_json_index(file_path, spans, base):
+    """Guarda as posições dos itens de um arquivo principal que este processo acabou de gravar.
+
+    Assim a próxima leitura por chave não precisa percorrer o arquivo novo.
+    """
+    with _json_indexes_guard:
+        _json_indexes[str(file_path)] = {"base": base, "spans": spans, "journal": None,
+                                         "journal_bytes": 0, "values": {}}
+
+def json_index_value(index, base_file, key):
+    """Valor atual de uma chave pelo índice (ou _DELETED se ela não existir)."""
+    if key in index["values"]:
+        return index["values"][key]
+    span = index["spans"].get(key)
+    return read_json_span(base_file, span) if span is not None else _DELETED
+
+def json_index(file_path):
+    """Índice do documento para a leitura por chave, com as linhas novas do diário já aplicadas.
+
+    O arquivo principal só é percorrido (em fluxo) quando muda, isto é, depois de uma
+    compactação de outro processo; do diário são lidas só as linhas acrescentadas
+    desde a consulta anterior. Chamar com _json_indexes_guard.
+    """
+    import json
+    base = json_file_signature(file_path)[0]
+    index = _json_indexes.get(str(file_path))
+    if index is None or index["base"] != base:
+        spans = {}
+        start = 0
+        try:
+            for key, _, (end, _) in iter_json_container(file_path, kinds="{"):
+                spans[key] = (start, end)
+                start = end
+        except json.JSONDecodeError:
+            spans = {}  # Mesmo comportamento de load_json com arquivo corrompido
+        index = {"base": base, "spans": spans, "journal": None, "journal_bytes": 0, "values": {}}
+        _json_indexes[str(file_path)] = index
+    try:
+        with journal_path(file_path).open('rb') as file:
+            info = os.fstat(file.fileno())
+            if index["journal"] != (info.st_dev, info.st_ino) or info.st_size < index["journal_bytes"]:
+                # Diário novo: a compactação o trocou pelas linhas gravadas durante ela
+                index.update(journal=(info.st_dev, info.st_ino), journal_bytes=0, values={})
+            file.seek(index["journal_bytes"])
+            data = file.read()
+    except FileNotFoundError:
+        index.update(journal=None, journal_bytes=0, values={})
+        return index
+    complete = data.rfind(b"\n") + 1  # Uma linha sem "\n" ainda está sendo gravada
+    if complete:
+        with file_path.open('rb') as base_file:
+            for line in data[:complete].splitlines():
+                try:
+                    change = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Linha incompleta de uma gravação interrompida
+                key = change["path"][0]
+                value = json_index_value(index, base_file, key)
+                document = {} if value is _DELETED else {key: value}
+                apply_json_change(document, change)
+                index["values"][key] = document.get(key, _DELETED)
+        index["journal_bytes"] += complete
+    return index
+
+def load_json_items_versioned(file_path, keys, default_data):
+    """Como load_json_versioned, mas só com algumas chaves do nível superior: ({chave: valor}, versão).
+
+    Usa o documento em cache quando ele está válido; senão lê pelo índice de posições,
+    e o custo depende só das chaves pedidas e das linhas novas do diário, nunca do
+    tamanho do documento. Também nunca há um json.load do arquivo inteiro, que
+    seguraria o GIL (a thread de gravação das sessões usa esta leitura).
+    """
+    signature = json_file_signature(file_path)
+    with _json_cache_guard:
+        entry = _json_cache.get(str(file_path))
+        if entry is not None and entry[0] == signature:
+            json_cache_stats["hits"] += 1
+            _json_cache.move_to_end(str(file_path))
+            return {key: entry[2][key] for key in keys if key in entry[2]}, signature
+    if signature[0] is None:
+        data, signature = load_json_versioned(file_path, default_data)  # Cria o arquivo com os dados padrão
+        return {key: data[key] for key in keys if key in data}, signature
+    while True:
+        try:
+            with _json_indexes_guard:
+                index = json_index(file_path)
+                with file_path.open('rb') as base_file:
+                    values = {key: json_index_value(index, base_file, key) for key in keys}
+        except (ValueError, FileNotFoundError):
+            values = None  # O arquivo principal foi trocado durante a leitura
+            with _json_indexes_guard:
+                _json_indexes.pop(str(file_path), None)
+        current = json_file_signature(file_path)
+        if values is not None and current == signature:
+            json_cache_stats["index_reads"] += 1
+            return {key: value for key, value in values.items() if value is not _DELETED}, signature
+        if current[0] is None:
+            return load_json_items_versioned(file_path, keys, default_data)
+        signature = current
+
+def load_json_items(file_path, keys, default_data):
+    """Carrega só as chaves pedidas do nível superior de um documento JSON ({chave: valor}).
+
+    Como em load_json, os valores são compartilhados: não os modifique diretamente.
+    """
+    return load_json_items_versioned(file_path, keys, default_data)[0]
+
+@instrumented("json.journal_append")
+def append_json_changes(file_path, changes):
+    """Registra alterações no diário do arquivo sem reescrever o documento inteiro.
+
+    Cada alteração é {"op": "set"|"delete", "path": [...], "value": ...}. As
+    operações são idempotentes, então reaplicar o diário após uma falha durante
+    a compactação não altera o resultado.
+    """
+    import json
+    with file_lock(file_path):
+        journal = journal_path(file_path)
+        ensure_directory_exists(journal)
+        signature_before = json_file_signature(file_path)
+        payload = "".join(json.dumps(change) + "\n" for change in changes).encode('utf-8')
+        with journal.open('a+b') as file:
+            # Se uma gravação anterior foi interrompida, começa em uma linha nova
+            if file.tell() > 0:
+                file.seek(-1, os.SEEK_END)
+                if file.read(1) != b"\n":
+                    payload = b"\n" + payload
+            file.write(payload)
+            file.flush()
+            os.fsync(file.fileno())
+            journal_size = file.tell()
+        # Mantém o cache em dia sem reler o arquivo, se ninguém mais o alterou
+        with _json_cache_guard:
+            entry = _json_cache.get(str(file_path))
+            if entry is not None:
+                if entry[0] == signature_before:
+                    for change in changes:
+                        apply_json_change(entry[2], change)
+                    cache_json(file_path, json_file_signature(file_path), entry[2])
+                else:
+                    drop_cached_json(file_path)
+        snapshot_size = file_path.stat().st_size if file_path.exists() else 0
+        if journal_size > max(JOURNAL_COMPACT_MIN_BYTES, snapshot_size):
+            schedule_compaction(file_path)
+
+def schedule_compaction(file_path):
+    """Compacta o diário em uma thread de fundo, sem atrasar a gravação que passou do limite."""
+    with _compactions_guard:
+        if str(file_path) in _compactions:
+            return
+        _compactions.add(str(file_path))
+
+    def run():
+        try:
+            compact_json(file_path)
+        except OSError:
+            json_write_stats["compaction_errors"] += 1  # O diário continua válido; a próxima gravação tenta de novo
+        finally:
+            with _compactions_guard:
+                _compactions.discard(str(file_path))
+
+    threading.Thread(target=run, name=f"compactação {file_path.name}", daemon=True).start()
+
+def compaction_count(file_path):
+    """Quantas compactações o arquivo já teve (<arquivo>.compactions), para quem acompanha o diário."""
+    try:
+        return int(file_path.with_name(file_path.name + ".compactions").read_text())
+    except (FileNotFoundError, ValueError):
+        return 0
+
+def compact_json(file_path):
+    """Incorpora o diário ao arquivo principal (troca atômica) sem bloquear as gravações.
+
+    O novo arquivo principal é gravado em fluxo, item a item, sem a trava do arquivo;
+    com ela ficam só as trocas: primeiro o arquivo principal, depois o diário, que
+    passa a ter só as linhas gravadas durante a compactação. As alterações são
+    idempotentes, então quem ler entre as duas trocas reaplica o diário antigo sem efeito.
+    """
+    journal = journal_path(file_path)
+    with file_lock(file_path.with_name(file_path.name + ".compact")):  # Uma compactação por vez
+        with file_lock(file_path):
+            signature = json_file_signature(file_path)
+        if signature[0] is None or signature[1] is None:
+            return
+        tmp_path = file_path.with_name(file_path.name + ".compact.tmp")
+        spans = write_json_file(tmp_path, iter_json_file_items(file_path, journal_bytes=signature[1][1]))
+        with file_lock(file_path):
+            current = json_file_signature(file_path)
+            if current[0] != signature[0] or current[1] is None:
+                tmp_path.unlink()  # Outra sessão regravou o arquivo durante a compactação
+                return
+            with journal.open('rb') as file:
+                file.seek(signature[1][1])
+                tail = file.read()
+            info = tmp_path.stat()
+            count_path = file_path.with_name(file_path.name + ".compactions")
+            count_tmp = count_path.with_name(count_path.name + ".tmp")
+            count_tmp.write_text(str(compaction_count(file_path) + 1))
+            os.replace(count_tmp, count_path)  # Antes das trocas: quem vir um diário novo já vê a contagem
+            os.replace(tmp_path, file_path)
+            if tail:
+                tail_path = journal.with_name(journal.name + ".tmp")
+                with tail_path.open('wb') as file:
+                    file.write(tail)
+                    file.flush()
+                    os.fsync(file.fileno())
+                os.replace(tail_path, journal)
+            else:
+                journal.unlink()
+            # O conteúdo não mudou: o documento em cache continua valendo com a nova assinatura
+            with _json_cache_guard:
+                entry = _json_cache.get(str(file_path))
+                if entry is not None and entry[0] == current:
+                    cache_json(file_path, json_file_signature(file_path), entry[2])
+                else:
+                    drop_cached_json(file_path)
+            install_json_index(file_path, spans, (info.st_mtime_ns, info.st_size))
+            json_write_stats["compactions"] += 1
+
+def follow_json_journal(file_path):
+    """Começa a acompanhar o diário de um documento a partir do ponto atual (ver read_journal_changes).
+
+    Quem acompanha carrega o que precisa do documento depois desta chamada: as linhas
+    gravadas nesse meio-tempo são entregues de novo, sem efeito (as alterações são idempotentes).
+    """
+    while True:
+        compactions = compaction_count(file_path)
+        base = json_file_signature(file_path)[0]
+        follower = {"file": None, "journal": None, "offset": 0, "base": base, "compactions": compactions}
+        try:
+            follower["file"] = journal_path(file_path).open('rb')
+            info = os.fstat(follower["file"].fileno())
+            follower.update(journal=(info.st_dev, info.st_ino), offset=info.st_size)
+        except FileNotFoundError:
+            pass
+        if json_file_signature(file_path)[0] == base and compaction_count(file_path) == compactions:
+            return follower
+        if follower["file"] is not None:
+            follower["file"].close()  # Uma compactação trocou os arquivos durante a abertura
+
+def read_journal_changes(file_path, follower):
+    """Alterações gravadas no diário desde a última leitura, ou None se é preciso recarregar o documento.
+
+    Uma compactação não obriga a recarregar: as linhas que faltavam são lidas do diário
+    antigo, que continua aberto, e o novo (só com as linhas gravadas durante ela) é lido
+    desde o início. Qualquer outra troca do arquivo principal, ou mais de uma compactação
+    desde a última leitura, retorna None.
+    """
+    import json
+    changes = []
+
+    def read_lines():
+        follower["file"].seek(follower["offset"])
+        data = follower["file"].read()
+        complete = data.rfind(b"\n") + 1  # Uma linha sem "\n" ainda está sendo gravada
+        follower["offset"] += complete
+        for line in data[:complete].splitlines():
+            try:
+                changes.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue  # Linha incompleta de uma gravação interrompida
+
+    while True:
+        if follower["file"] is not None:
+            read_lines()
+        base = json_file_signature(file_path)[0]
+        try:
+            info = journal_path(file_path).stat()
+            journal = (info.st_dev, info.st_ino)
+        except FileNotFoundError:
+            journal = None
+        if base == follower["base"] and journal == follower["journal"]:
+            return changes
+        compactions = compaction_count(file_path)
+        if journal is not None and journal == follower["journal"] and compactions == follower["compactions"] + 1:
+            return changes  # Compactação no meio das trocas: o diário ainda é o mesmo
+        if base != follower["base"] and follower["file"] is not None and compactions == follower["compactions"] + 1:
+            read_lines()  # Depois da troca, o diário antigo não recebe mais linhas
+            follower["file"].close()
+            follower.update(file=None, journal=None, offset=0, base=base, compactions=compactions)
+        elif base != follower["base"] or compactions != follower["compactions"] or follower["file"] is not None:
+            if follower["file"] is not None:
+                follower["file"].close()
+                follower["file"] = None
+            return None
+        if journal is not None:  # Diário criado (ou deixado pela compactação) desde a última leitura
+            try:
+                follower["file"] = journal_path(file_path).open('rb')
+            except FileNotFoundError:
+                continue
+            info = os.fstat(follower["file"].fileno())
+            follower["journal"] = (info.st_dev, info.st_ino)
 
 def save_json(file_path, data):
-    """Salva dados em um arquivo JSON."""
+    """Salva o documento completo em um arquivo JSON (troca atômica)."""
     #print(f"[DEBUG] Salvando: {file_path}")  # Debug para ver onde está salvando
-    with file_path.open('w') as file:
-        json.dump(data, file, indent=4)
+    with file_lock(file_path):
+        spans, base = write_json_atomic(file_path, data)
+        journal = journal_path(file_path)
+        if journal.exists():
+            journal.unlink()
+        drop_cached_json(file_path)
+        install_json_index(file_path, spans, base)
+
+def update_json(file_path, default_data, build_changes, retries=5, keys=None):
+    """Leitura-modificação-gravação segura entre várias sessões.
+
+    build_changes(data) recebe o documento atual e devolve a lista de alterações
+    para o diário. Primeiro tenta de forma otimista: calcula as alterações sem
+    trava e só as grava se a versão do arquivo não mudou nesse meio-tempo. Após
+    `retries` conflitos, repete a operação inteira com a trava mantida. Com `keys`,
+    build_changes recebe só essas chaves do nível superior (load_json_items), e o
+    custo não cresce com o tamanho do documento: a leitura (só as linhas novas do
+    diário) é feita direto com a trava, sem conflitos entre sessões que gravam juntas.
+    """
+    def load():
+        if keys is None:
+            return load_json_versioned(file_path, default_data)
+        return load_json_items_versioned(file_path, keys, default_data)
+
+    for _ in range(retries if keys is None else 0):
+        data, version = load()
+        changes = build_changes(data)
+        with file_lock(file_path):
+            if json_file_signature(file_path) == version:
+                append_json_changes(file_path, changes)
+                json_write_stats["commits"] += 1
+                return changes
+        json_write_stats["conflicts"] += 1
+    with file_lock(file_path):
+        data = load()[0]
+        changes = build_changes(data)
+        append_json_changes(file_path, changes)
+        json_write_stats["commits"] += 1
+        if keys is None:
+            json_write_stats["locked_fallbacks"] += 1
+        return changes
+
+# Conexões com o banco de usuários, uma por thread (abertas sob demanda)
+_user_store = threading.local()
+
+def open_user_store():
+    """Abre o banco indexado de usuários, criando as tabelas e índices na primeira vez."""
+    import sqlite3
+    conn = getattr(_user_store, "conn", None)
+    if conn is not None:
+        return conn
+    ensure_directory_exists(USERS_DB_FILE)
+    conn = sqlite3.connect(USERS_DB_FILE, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS users (
+            username TEXT PRIMARY KEY,
+            password TEXT NOT NULL,
+            age INTEGER NOT NULL,
+            location TEXT NOT NULL,
+            role TEXT NOT NULL,
+            location_key TEXT NOT NULL DEFAULT ''
+        )"""
+    )
+    # Índices para os filtros e ordenações dos relatórios
+    conn.execute("CREATE INDEX IF NOT EXISTS users_by_age ON users (age)")
+    conn.execute("CREATE INDEX IF NOT EXISTS users_by_location ON users (location)")
+    conn.execute("CREATE INDEX IF NOT EXISTS users_by_role ON users (role)")
+    # As conversões de dados antigos ficam nas migrações de esquema (SCHEMA_MIGRATIONS)
+    with conn:
+        create_location_index(conn)
+    _user_store.conn = conn
+    return conn
+
+def fold_location_text(text):
+    """Remove acentos, maiúsculas e espaços repetidos; separadores viram " - "."""
+    text = unicodedata.normalize("NFKD", str(text))
+    text = "".join(char for char in text if not unicodedata.combining(char)).casefold()
+    separator, whitespace = location_patterns()
+    text = separator.sub(" - ", text.strip(" -/,\t\n"))
+    return whitespace.sub(" ", text).strip()
+
+@functools.cache
+def location_patterns():
+    """Expressões da normalização de localidades (separadores e espaços), compiladas uma única vez."""
+    import re
+    return re.compile(r"\s*[-/,]\s*"), re.compile(r"\s+")
+
+@functools.cache
+def state_keys():
+    """Nome ou sigla do estado (já normalizados) -> sigla."""
+    keys = {fold_location_text(name): uf for uf, name in BRAZIL_STATES.items()}
+    keys.update({uf.casefold(): uf for uf in BRAZIL_STATES})
+    return keys
+
+def canonical_location(text):
+    """Chave canônica de uma localidade: a sigla para estados, o texto normalizado para o resto.
+
+    "SP", "sp", "São Paulo", "Sao Paulo " e "São Paulo/SP" viram "SP";
+    "Campinas/SP" e "campinas - sp" viram "campinas - sp".
+    """
+    folded = fold_location_text(text)
+    keys = state_keys()
+    if folded in keys:
+        return keys[folded]
+    name, separator, suffix = folded.rpartition(" - ")
+    state = keys.get(suffix)
+    if separator and state is not None and keys.get(name) == state:
+        return state  # "São Paulo - SP"
+    return folded
+
+def location_label(key, name):
+    """Nome exibido de uma localidade do índice."""
+    return BRAZIL_STATES.get(key) or name or "(não informada)"
+
+def create_location_index(conn):
+    """Cria o índice de localidades (chave -> contagem) mantido por gatilhos nas gravações de usuários."""
+    # Índice reverso localidade -> usuários
+    conn.execute("CREATE INDEX IF NOT EXISTS users_by_location_key ON users (location_key)")
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS locations (
+            key TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            users INTEGER NOT NULL
+        )"""
+    )
+    conn.execute(
+        """CREATE TRIGGER IF NOT EXISTS locations_on_insert AFTER INSERT ON users BEGIN
+            INSERT INTO locations (key, name, users) VALUES (NEW.location_key, NEW.location, 1)
+                ON CONFLICT (key) DO UPDATE SET users = users + 1;
+        END"""
+    )
+    conn.execute(
+        """CREATE TRIGGER IF NOT EXISTS locations_on_delete AFTER DELETE ON users BEGIN
+            UPDATE locations SET users = users - 1 WHERE key = OLD.location_key;
+            DELETE FROM locations WHERE key = OLD.location_key AND users <= 0;
+        END"""
+    )
+    conn.execute(
+        """CREATE TRIGGER IF NOT EXISTS locations_on_update AFTER UPDATE OF location_key ON users
+        WHEN NEW.location_key IS NOT OLD.location_key BEGIN
+            UPDATE locations SET users = users - 1 WHERE key = OLD.location_key;
+            DELETE FROM locations WHERE key = OLD.location_key AND users <= 0;
+            INSERT INTO locations (key, name, users) VALUES (NEW.location_key, NEW.location, 1)
+                ON CONFLICT (key) DO UPDATE SET users = users + 1;
+        END"""
+    )
+
+def rebuild_location_index(progress=None):
+    """Recalcula as chaves canônicas de todos os usuários e refaz as contagens do zero.
+
+    Os usuários são lidos em lotes de MIGRATION_BATCH_SIZE pelo rowid (memória
+    limitada ao lote), tudo em uma única transação. Retorna (usuários com chave
+    alterada, localidades no índice).
+    """
+    conn = open_user_store()
+    changed = 0
+    last_rowid = 0
+    with conn:
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        total = cursor.execute("SELECT max(rowid) FROM users").fetchone()[0] or 0
+        while True:
+            rows = cursor.execute(
+                "SELECT rowid, location, location_key FROM users WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                (last_rowid, MIGRATION_BATCH_SIZE)
+            ).fetchall()
+            if not rows:
+                break
+            updates = [(key, rowid) for rowid, location, old_key in rows
+                       if (key := canonical_location(location)) != old_key]
+            conn.executemany("UPDATE users SET location_key = ? WHERE rowid = ?", updates)
+            changed += len(updates)
+            last_rowid = rows[-1][0]
+            if progress is not None:
+                progress(last_rowid, total)
+        conn.execute("DELETE FROM locations")
+        # Ordem do índice = ordem do primeiro cadastro de cada localidade
+        conn.execute(
+            """INSERT INTO locations (key, name, users)
+            SELECT location_key, location, total FROM (
+                SELECT location_key, location, min(rowid) AS first, count(*) AS total
+                FROM users GROUP BY location_key
+            ) ORDER BY first"""
+        )
+        locations = conn.execute("SELECT count(*) FROM locations").fetchone()[0]
+    for stale_path in COURSE_CACHE_DIR.glob("analytics.*.npz"):
+        stale_path.unlink()  # As colunas do relatório analítico usam as chaves antigas
+    return changed, locations
+
+def location_count(location):
+    """Número de usuários de uma localidade (consulta pontual no índice)."""
+    row = open_user_store().execute(
+        "SELECT users FROM locations WHERE key = ?", (canonical_location(location),)
+    ).fetchone()
+    return row[0] if row is not None else 0
+
+def iter_locations(order_by="rowid"):
+    """Percorre (chave, nome exibido, usuários) do índice, na ordem de cadastro ou por contagem."""
+    order = "users DESC, rowid" if order_by == "users" else "rowid"
+    cursor = open_user_store().cursor()
+    cursor.row_factory = None
+    for key, name, users in cursor.execute(f"SELECT key, name, users FROM locations ORDER BY {order}"):
+        yield key, location_label(key, name), users
+
+def canonical_username(username):
+    """Nome de usuário canônico (sem espaços nas pontas), o mesmo usado como chave nas estatísticas."""
+    return username.strip()
+
+def get_user(username):
+    """Busca um usuário pelo nome (consulta pontual pelo índice)."""
+    row = open_user_store().execute(
+        "SELECT username, password, age, location, role FROM users WHERE username = ?",
+        (canonical_username(username),)
+    ).fetchone()
+    return dict(row) if row is not None else None
+
+def add_user(user):
+    """Insere um novo usuário. Retorna False se o nome já existir."""
+    import sqlite3
+    conn = open_user_store()
+    try:
+        with conn:
+            conn.execute(
+                "INSERT INTO users (username, password, age, location, role, location_key) "
+                "VALUES (:username, :password, :age, :location, :role, :location_key)",
+                dict(user, username=canonical_username(user["username"]),
+                     location_key=canonical_location(user["location"]))
+            )
+    except sqlite3.IntegrityError:
+        return False
+    return True
+
+def update_user_password(username, hashed_password):
+    """Atualiza apenas a senha de um usuário."""
+    conn = open_user_store()
+    with conn:
+        conn.execute(
+            "UPDATE users SET password = ? WHERE username = ?", (hashed_password, canonical_username(username))
+        )
+
+def add_users(users):
+    """Insere vários usuários em uma única transação. Retorna os que foram inseridos.
+
+    A chave da localidade é calculada aqui, a menos que o usuário já traga "location_key".
+    """
+    conn = open_user_store()
+    inserted = []
+    with conn:
+        for user in users:
+            location_key = user["location_key"] if "location_key" in user else canonical_location(user["location"])
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO users (username, password, age, location, role, location_key) "
+                "VALUES (:username, :password, :age, :location, :role, :location_key)",
+                dict(user, username=canonical_username(user["username"]), location_key=location_key)
+            )
+            if cursor.rowcount:
+                inserted.append(user)
+    return inserted
+
+def iter_users(batch_size=500, role=None, location=None, order_by="rowid"):
+    """Percorre os usuários em lotes (paginação por chave), sem carregar todos na memória.
+
+    order_by pode ser "rowid" (ordem de cadastro), "username", "age" ou "location".
+    O filtro de localidade usa a chave canônica ("sp" encontra "São Paulo").
+    """
+    if order_by not in ("rowid", "username", "age", "location"):
+        raise ValueError(f"Ordenação inválida: {order_by}")
+    conditions = []
+    params = []
+    if role:
+        conditions.append("role = ?")
+        params.append(role)
+    if location:
+        conditions.append("location_key = ?")
+        params.append(canonical_location(location))
+    last = None
+    while True:
+        where = list(conditions)
+        page_params = list(params)
+        if last is not None:
+            where.append(f"({order_by}, rowid) > (?, ?)")
+            page_params.extend(last)
+        sql = "SELECT rowid, * FROM users"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY {order_by}, rowid LIMIT ?"
+        rows = open_user_store().execute(sql, page_params + [batch_size]).fetchall()
+        if not rows:
+            return
+        for row in rows:
+            user = dict(row)
+            del user["rowid"]
+            del user["location_key"]
+            yield user
+        last = (rows[-1][order_by], rows[-1]["rowid"])
+
+# Pool de threads do bcrypt (criado no primeiro uso)
+_password_pool = None
+
+def password_pool():
+    """Retorna o pool de threads usado para hashing e verificação de senhas."""
+    from concurrent.futures import ThreadPoolExecutor
+    global _password_pool
+    if _password_pool is None:
+        _password_pool = ThreadPoolExecutor(max_workers=PASSWORD_WORKERS, thread_name_prefix="bcrypt")
+    return _password_pool
+
+@instrumented("bcrypt.hash")
+def bcrypt_hash(password):
+    """Calcula o hash bcrypt da senha com o custo configurado (bloqueia a thread atual)."""
+    from bcrypt import hashpw, gensalt
+    return hashpw(password.encode('utf-8'), gensalt(BCRYPT_ROUNDS)).decode('utf-8')
+
+def hash_password_async(password):
+    """Agenda o hashing da senha no pool e retorna um Future com o hash (str)."""
+    return password_pool().submit(bcrypt_hash, password)
+
+@instrumented("bcrypt.verify")
+def bcrypt_verify(password, hashed_password):
+    """Confere a senha com o hash bcrypt (bloqueia a thread atual)."""
+    from bcrypt import checkpw
+    return checkpw(password.encode('utf-8'), hashed_password.encode('utf-8'))
+
+def verify_password_async(password, hashed_password):
+    """Agenda a verificação da senha no pool e retorna um Future com True/False."""
+    return password_pool().submit(bcrypt_verify, password, hashed_password)
+
+def hash_password(password):
+    """Gera o hash bcrypt da senha com o custo configurado."""
+    return hash_password_async(password).result()
+
+def verify_password(password, hashed_password):
+    """Confere a senha com o hash bcrypt armazenado."""
+    return verify_password_async(password, hashed_password).result()
+
+def password_needs_rehash(hashed_password):
+    """Indica se o hash foi gerado com um custo diferente do configurado ($2b$<custo>$...)."""
+    try:
+        return int(hashed_password.split("$")[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+def rehash_user_password(username, password):
+    """Refaz o hash da senha com o custo atual e o grava (executado no pool)."""
+    update_user_password(username, bcrypt_hash(password))
 
 def is_valid_password(password):
     """Valida se a senha atende aos requisitos de segurança."""
     if len(password) < 8:
         return False
-    if not re.search(r"[A-Z]", password):
-        return False
-    if not re.search(r"[a-z]", password):
-        return False
-    if not re.search(r"[0-9]", password):
-        return False
-    if not re.search(r"[!@#$%^&*(),.?\":{}|<>]", password):
-        return False
-    return True
+    return all(rule.search(password) for rule in password_rules())
+
+@functools.cache
+def password_rules():
+    """Regras de senha (maiúscula, minúscula, número e caractere especial), compiladas uma única vez."""
+    import re
+    return tuple(re.compile(pattern) for pattern in (r"[A-Z]", r"[a-z]", r"[0-9]", r"[!@#$%^&*(),.?\":{}|<>]"))
+
+# Limites de tentativas de login e recuperação de senha, verificados antes de qualquer bcrypt:
+# por sessão (no servidor, por endereço do cliente), um balde de fichas; por usuário, falhas
+# em uma janela de tempo levam a um bloqueio
+LOGIN_BURST = int(os.environ.get("UNIAO_LOGIN_BURST", "5"))  # Tentativas seguidas permitidas por sessão
+LOGIN_REFILL_SECONDS = 5  # Uma nova ficha a cada 5 segundos
+LOGIN_MAX_FAILURES = 5  # Falhas dentro da janela antes de bloquear o usuário
+LOGIN_FAILURE_WINDOW = 15 * 60
+LOGIN_LOCKOUT_SECONDS = 15 * 60
+
+auth_stats = {"attempts": 0, "failures": 0, "session_throttled": 0, "user_locked": 0, "lockouts": 0}
+
+def new_token_bucket():
+    """Cria o balde de fichas de tentativas de uma sessão."""
+    return {"tokens": float(LOGIN_BURST), "updated": time.monotonic()}
+
+_session_bucket = new_token_bucket()  # Sessão do menu interativo
+_peer_buckets = OrderedDict()  # Servidor: endereço do cliente -> balde, do menos para o mais recente
+
+def peer_token_bucket(peer):
+    """Retorna o balde de fichas de um endereço no modo servidor (reconectar não o renova).
+
+    Baldes parados por tempo suficiente para encherem de novo são descartados: um
+    balde novo para o mesmo endereço é equivalente.
+    """
+    now = time.monotonic()
+    while _peer_buckets:
+        oldest = next(iter(_peer_buckets.values()))
+        if now - oldest["updated"] < LOGIN_BURST * LOGIN_REFILL_SECONDS:
+            break
+        _peer_buckets.popitem(last=False)
+    bucket = _peer_buckets.pop(peer, None) or new_token_bucket()
+    _peer_buckets[peer] = bucket
+    return bucket
+
+def take_token(bucket):
+    """Consome uma ficha do balde. Retorna 0 ou os segundos até a próxima ficha."""
+    now = time.monotonic()
+    bucket["tokens"] = min(LOGIN_BURST, bucket["tokens"] + (now - bucket["updated"]) / LOGIN_REFILL_SECONDS)
+    bucket["updated"] = now
+    if bucket["tokens"] >= 1:
+        bucket["tokens"] -= 1
+        return 0
+    return (1 - bucket["tokens"]) * LOGIN_REFILL_SECONDS
+
+def check_login_allowed(username, bucket):
+    """Decide, sem calcular nenhum hash, se a tentativa pode seguir. Retorna None ou o motivo da recusa.
+
+    O estado por usuário (login_throttle.json) é {usuário: [falhas, início da janela, bloqueado até]}.
+    """
+    auth_stats["attempts"] += 1
+    wait = take_token(bucket)
+    if wait:
+        auth_stats["session_throttled"] += 1
+        return f"Muitas tentativas seguidas. Aguarde {wait:.0f} s."
+    key = canonical_username(username)
+    entry = load_json_items(LOGIN_THROTTLE_FILE, [key], {}).get(key)
+    if entry is not None and entry[2] > time.time():
+        auth_stats["user_locked"] += 1
+        return f"Usuário bloqueado por excesso de tentativas. Tente novamente em {(entry[2] - time.time()) / 60:.0f} min."
+    return None
+
+def record_login_failure(username):
+    """Conta uma falha do usuário na janela atual e o bloqueia ao atingir o limite."""
+    key = canonical_username(username)
+    now = int(time.time())
+    locked = []
+    auth_stats["failures"] += 1
+
+    def build_changes(data):
+        locked.clear()
+        failures, window_start, locked_until = data.get(key, (0, now, 0))
+        if now - window_start > LOGIN_FAILURE_WINDOW:
+            failures, window_start = 0, now
+        failures += 1
+        if failures >= LOGIN_MAX_FAILURES:
+            failures, window_start, locked_until = 0, now, now + LOGIN_LOCKOUT_SECONDS
+            locked.append(True)
+        return [{"op": "set", "path": [key], "value": [failures, window_start, locked_until]}]
+
+    update_json(LOGIN_THROTTLE_FILE, {}, build_changes, keys=[key])
+    if locked:
+        auth_stats["lockouts"] += 1
+
+def clear_login_failures(username):
+    """Esquece as falhas do usuário após um acesso bem-sucedido (sem gravar se não houver nenhuma)."""
+    key = canonical_username(username)
+    if key in load_json_items(LOGIN_THROTTLE_FILE, [key], {}):
+        update_json(LOGIN_THROTTLE_FILE, {}, lambda data: [{"op": "delete", "path": [key]}] if key in data else [],
+                    keys=[key])
 
 def show_policies():
     """Exibe as políticas do sistema no console."""
@@ -112,425 +1430,1616 @@ def show_policies():
    - O uso indevido do sistema pode resultar em suspensão da conta.
 """
     # Centraliza o texto das políticas horizontalmente
-    try:
-        columns = os.get_terminal_size().columns
-    except OSError:
-        columns = 80
     for line in policies.strip().split('\n'):
-        print(line.center(columns))
-    input("\nPressione Enter para continuar.")
+        render_line(line)
+    ask("\nPressione Enter para continuar.")
+
+def create_user(username, hashed_password, age, location, role):
+    """Grava um usuário já validado (o índice de localidades é atualizado pelo banco). Retorna False se o nome já existir."""
+    return add_user({
+        "username": username,
+        "password": hashed_password,
+        "age": age,
+        "location": location,
+        "role": role
+    })
 
 def register():
     """Registra um novo usuário."""
     print_banner("Registro de Usuário")
-    username = input("Escolha um nome de usuário: ")
+    username = ask("Escolha um nome de usuário: ")
 
     while True:
-        password = input("Escolha uma senha (mínimo 8 caracteres, incluindo letras maiúsculas, minúsculas, números e caracteres especiais): ")
+        password = ask("Escolha uma senha (mínimo 8 caracteres, incluindo letras maiúsculas, minúsculas, números e caracteres especiais): ")
         if is_valid_password(password):
-            hashed_password = hashpw(password.encode('utf-8'), gensalt())
+            # O hash é calculado em segundo plano enquanto o restante do cadastro é preenchido
+            hashed_password = hash_password_async(password)
             break
-        print("❌ Erro: A senha não atende aos requisitos de segurança. Tente novamente.\n")
+        render_line("❌ Erro: A senha não atende aos requisitos de segurança. Tente novamente.\n", center=False)
 
     while True:
         try:
-            age = int(input("Digite sua idade: "))
+            age = int(ask("Digite sua idade: "))
             if age <= 0:
                 raise ValueError
             break
         except ValueError:
-            print("❌ Erro: Idade inválida. Digite um número inteiro positivo.")
+            render_line("❌ Erro: Idade inválida. Digite um número inteiro positivo.", center=False)
 
-    location = input("Digite sua cidade/estado: ")
+    location = ask("Digite sua cidade/estado: ").strip()
 
     while True:
-        role = input("Você é um administrador? (sim/não): ").strip().lower()
+        role = ask("Você é um administrador? (sim/não): ").strip().lower()
         if role in ["sim", "não"]:
             if role == "sim":
-                admin_pass = input("Digite a senha secreta de administrador: ")
+                admin_pass = ask("Digite a senha secreta de administrador: ")
                 if admin_pass == ADMIN_SECRET:
                     role = "admin"
                 else:
-                    print("❌ Senha de administrador incorreta! Registrando como usuário comum.")
+                    render_line("❌ Senha de administrador incorreta! Registrando como usuário comum.", center=False)
                     role = "user"
             else:
                 role = "user"
             break
-        print("❌ Opção inválida! Digite 'sim' ou 'não'.")
+        render_line("❌ Opção inválida! Digite 'sim' ou 'não'.", center=False)
 
-    users_data = load_json(USER_DATA_FILE, {"users": []})
-    for user in users_data["users"]:
-        if user["username"] == username:
-            print("❌ Erro: Nome de usuário já existe. Tente novamente.\n")
-            return
+    if not create_user(username, hashed_password.result(), age, location, role):
+        render_line("❌ Erro: Nome de usuário já existe. Tente novamente.\n", center=False)
+        return
 
-    users_data["users"].append({
-        "username": username,
-        "password": hashed_password.decode('utf-8'),
-        "age": age,
-        "location": location,
-        "role": role
-    })
-    save_json(USER_DATA_FILE, users_data)
-
-    locations_data = load_json(LOCATIONS_FILE, {})
-    if location not in locations_data:
-        locations_data[location] = 0
-    locations_data[location] += 1
-    save_json(LOCATIONS_FILE, locations_data)
-
-    print(f"✅ Usuário {username} registrado com sucesso!\n")
+    render_line(f"✅ Usuário {username} registrado com sucesso!\n", center=False)
 
 def reset_password():
     """Permite ao usuário redefinir a senha caso esqueça."""
     print_banner("Recuperação de Senha")
-    username = input("Digite seu nome de usuário: ")
-    users_data = load_json(USER_DATA_FILE, {"users": []})
-    for user in users_data["users"]:
-        if user["username"] == username:
-            # Pergunta a localização e idade como verificação simples
-            location = input("Digite sua cidade/estado cadastrada: ")
-            try:
-                age = int(input("Digite sua idade cadastrada: "))
-            except ValueError:
-                print("❌ Idade inválida.")
+    username = ask("Digite seu nome de usuário: ")
+    refusal = check_login_allowed(username, _session_bucket)
+    if refusal:
+        render_line(f"❌ {refusal}", center=False)
+        return
+    user = get_user(username)
+    if user is None:
+        render_line("❌ Usuário não encontrado.", center=False)
+        return
+    # Pergunta a localização e idade como verificação simples
+    location = ask("Digite sua cidade/estado cadastrada: ")
+    try:
+        age = int(ask("Digite sua idade cadastrada: "))
+    except ValueError:
+        render_line("❌ Idade inválida.", center=False)
+        return
+    if canonical_location(user["location"]) == canonical_location(location) and user["age"] == age:
+        clear_login_failures(username)
+        while True:
+            new_password = ask("Digite a nova senha: ")
+            if is_valid_password(new_password):
+                update_user_password(username, hash_password(new_password))
+                render_line("✅ Senha redefinida com sucesso!\n", center=False)
                 return
-            if user["location"] == location and user["age"] == age:
-                while True:
-                    new_password = input("Digite a nova senha: ")
-                    if is_valid_password(new_password):
-                        user["password"] = hashpw(new_password.encode('utf-8'), gensalt()).decode('utf-8')
-                        save_json(USER_DATA_FILE, users_data)
-                        print("✅ Senha redefinida com sucesso!\n")
-                        return
-                    else:
-                        print("❌ A senha não atende aos requisitos de segurança. Tente novamente.")
             else:
-                print("❌ Dados de verificação incorretos. Não foi possível redefinir a senha.")
-            return
-    print("❌ Usuário não encontrado.")
+                render_line("❌ A senha não atende aos requisitos de segurança. Tente novamente.", center=False)
+    else:
+        record_login_failure(username)
+        render_line("❌ Dados de verificação incorretos. Não foi possível redefinir a senha.", center=False)
 
 def login():
     """Realiza o login do usuário."""
     print_banner("Login")
-    username = input("Digite seu nome de usuário: ")
-    password = input("Digite sua senha: ")
+    username = ask("Digite seu nome de usuário: ")
+    password = ask("Digite sua senha: ")
 
-    users_data = load_json(USER_DATA_FILE, {"users": []})
-    for user in users_data["users"]:
-        if user["username"] == username and checkpw(password.encode('utf-8'), user["password"].encode('utf-8')):
+    refusal = check_login_allowed(username, _session_bucket)
+    if refusal:
+        render_line(f"❌ {refusal}\n", center=False)
+        return
+    user = get_user(username)
+    if user is not None and verify_password(password, user["password"]):
+        clear_login_failures(username)
+        if password_needs_rehash(user["password"]):
+            password_pool().submit(rehash_user_password, username, password)
+        session = open_session(user)
+        try:
             # Verificação extra para admin: pede senha secreta
             if user["role"] == "admin":
-                admin_pass = input("Digite a senha secreta de administrador para acessar o painel admin: ")
+                admin_pass = ask("Digite a senha secreta de administrador para acessar o painel admin: ")
                 if admin_pass != ADMIN_SECRET:
-                    print("❌ Senha de administrador incorreta! Acesso como usuário comum.")
+                    render_line("❌ Senha de administrador incorreta! Acesso como usuário comum.", center=False)
                     show_user_menu(username)
                     return
-            print(f"✅ Bem-vindo(a), {username}! Login realizado com sucesso.\n")
+            render_line(f"✅ Bem-vindo(a), {username}! Login realizado com sucesso.\n", center=False)
             show_policies()  # Exibe as políticas após o login
             if user["role"] == "admin":
                 show_admin_menu(username)
             else:
                 show_user_menu(username)
-            return
-    print("❌ Erro: Nome de usuário ou senha incorretos. Tente novamente.\n")
+        finally:
+            close_session(session)  # Logout: grava os resultados pendentes
+        return
+    if user is not None:
+        record_login_failure(username)  # Só usuários existentes: nomes inventados não ocupam o estado
+    render_line("❌ Erro: Nome de usuário ou senha incorretos. Tente novamente.\n", center=False)
+
+# Quantis do tempo de resposta estimados de forma incremental (algoritmo P²)
+AGGREGATE_QUANTILES = (0.5, 0.9, 0.95)
+
+def new_quantile_sketch(p):
+    """Cria o estado do estimador P² (Jain & Chlamtac) para o quantil p."""
+    return {
+        "p": p,
+        "heights": [],  # As 5 primeiras observações, depois as alturas dos marcadores
+        "positions": [1, 2, 3, 4, 5],
+        "desired": [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5],
+        "increments": [0, p / 2, p, (1 + p) / 2, 1]
+    }
+
+def quantile_sketch_add(sketch, x):
+    """Acrescenta uma observação ao estimador P² em O(1)."""
+    q = sketch["heights"]
+    if len(q) < 5:
+        q.append(x)
+        q.sort()
+        return
+    n = sketch["positions"]
+    if x < q[0]:
+        q[0] = x
+        k = 0
+    elif x >= q[4]:
+        q[4] = x
+        k = 3
+    else:
+        k = next(i for i in range(4) if q[i] <= x < q[i + 1])
+    for i in range(k + 1, 5):
+        n[i] += 1
+    for i in range(5):
+        sketch["desired"][i] += sketch["increments"][i]
+    for i in range(1, 4):
+        d = sketch["desired"][i] - n[i]
+        if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+            d = 1 if d > 0 else -1
+            # Ajuste parabólico; se sair do intervalo, usa o linear
+            candidate = q[i] + d / (n[i + 1] - n[i - 1]) * (
+                (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+                + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+            )
+            if not q[i - 1] < candidate < q[i + 1]:
+                candidate = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+            q[i] = candidate
+            n[i] += d
+
+def quantile_sketch_value(sketch):
+    """Retorna a estimativa atual do quantil (exata enquanto houver menos de 5 observações)."""
+    from statistics import median
+    q = sketch["heights"]
+    if not q:
+        return None
+    if len(q) < 5:
+        if sketch["p"] == 0.5:
+            return median(q)
+        return q[min(int(sketch["p"] * len(q)), len(q) - 1)]
+    return q[2]
+
+def new_aggregate(with_quantiles=True):
+    """Cria os contadores acumulados de um quiz, de um usuário ou da plataforma.
+
+    Os agregados por usuário dispensam os quantis para manter o arquivo pequeno.
+    """
+    return {
+        "attempts": 0,
+        "total_time": 0,
+        "correct_answers": 0,
+        "total_questions": 0,
+        "timed_attempts": 0,  # Tentativas com tempo individual (variância e quantis)
+        "time_mean": 0,
+        "time_m2": 0,
+        "quantiles": {str(p): new_quantile_sketch(p) for p in AGGREGATE_QUANTILES} if with_quantiles else {}
+    }
+
+def aggregate_add(aggregate, elapsed_time, correct_answers, total_questions):
+    """Retorna uma cópia do agregado com mais uma tentativa (soma, Welford e P² em O(1))."""
+    import copy
+    aggregate = copy.deepcopy(aggregate)
+    aggregate["attempts"] += 1
+    aggregate["total_time"] += elapsed_time
+    aggregate["correct_answers"] += correct_answers
+    aggregate["total_questions"] += total_questions
+    aggregate["timed_attempts"] += 1
+    delta = elapsed_time - aggregate["time_mean"]
+    aggregate["time_mean"] += delta / aggregate["timed_attempts"]
+    aggregate["time_m2"] += delta * (elapsed_time - aggregate["time_mean"])
+    for sketch in aggregate["quantiles"].values():
+        quantile_sketch_add(sketch, elapsed_time)
+    return aggregate
+
+def aggregate_summary(aggregate):
+    """Converte os contadores em médias, desvio padrão, quantis e taxa de acerto."""
+    timed = aggregate["timed_attempts"]
+    summary = {
+        "attempts": aggregate["attempts"],
+        "average_time": aggregate["total_time"] / aggregate["attempts"] if aggregate["attempts"] else 0,
+        "time_stdev": (aggregate["time_m2"] / (timed - 1)) ** 0.5 if timed > 1 else 0,
+        "accuracy": (
+            aggregate["correct_answers"] / aggregate["total_questions"]
+            if aggregate["total_questions"] else None
+        )
+    }
+    for key, sketch in aggregate["quantiles"].items():
+        summary[f"p{round(float(key) * 100)}"] = quantile_sketch_value(sketch)
+    return summary
+
+def ensure_aggregates():
+    """Cria os arquivos de agregados na primeira vez, somando os totais de statistics.json.
+
+    Os agregados por usuário ficam à parte, em user_aggregates.json (um item por
+    usuário), que cresce com a base e por isso é lido e atualizado só por chave.
+    """
+    if not AGGREGATES_FILE.exists():
+        aggregates = {"platform": new_aggregate(), "quizzes": {}}
+        user_aggregates = {}
+        # Os dados antigos só têm totais: variância e quantis começam a partir daqui
+        for user, quizzes in iter_json_items(STATS_FILE, {}):
+            for quiz, data in quizzes.items():
+                for aggregate in (
+                    aggregates["platform"],
+                    aggregates["quizzes"].setdefault(quiz, new_aggregate()),
+                    user_aggregates.setdefault(user, new_aggregate(with_quantiles=False))
+                ):
+                    aggregate["attempts"] += data["attempts"]
+                    aggregate["total_time"] += data["total_time"]
+                    if "total_questions" in data:  # Sem o total de questões não há taxa de acerto
+                        aggregate["correct_answers"] += data["correct_answers"]
+                        aggregate["total_questions"] += data["total_questions"]
+        with file_lock(AGGREGATES_FILE):
+            if not AGGREGATES_FILE.exists():
+                save_json(USER_AGGREGATES_FILE, user_aggregates)
+                save_json(AGGREGATES_FILE, aggregates)
+
+def load_aggregates():
+    """Carrega os agregados da plataforma e dos quizzes (ver ensure_aggregates)."""
+    ensure_aggregates()
+    return load_json(AGGREGATES_FILE, {"platform": new_aggregate(), "quizzes": {}})
+
+def add_quiz_result(quiz_stats, elapsed_time, correct_answers, total_questions):
+    """Totais de um quiz (novo dicionário) somando uma tentativa aos totais anteriores (ou None)."""
+    quiz_stats = dict(quiz_stats or {"total_time": 0, "attempts": 0, "correct_answers": 0, "average_time": 0})
+    quiz_stats["total_time"] += elapsed_time
+    quiz_stats["attempts"] += 1
+    quiz_stats["correct_answers"] += correct_answers
+    quiz_stats["total_questions"] = quiz_stats.get("total_questions", 0) + total_questions
+    quiz_stats["average_time"] = quiz_stats["total_time"] / quiz_stats["attempts"]
+    return quiz_stats
+
+def record_quiz_results(results, written=None):
+    """Registra várias tentativas com uma única gravação por arquivo.
+
+    Cada resultado é (usuário, quiz, tempo, acertos, total de questões). Retorna
+    os totais atualizados do quiz após cada tentativa, na mesma ordem. `written`
+    (arquivo -> resultado) guarda os arquivos já gravados: se uma gravação falhar,
+    chamar de novo com o mesmo dicionário grava só os que faltaram, sem somar as
+    mesmas tentativas duas vezes.
+    """
+    written = {} if written is None else written
+    totals = []
+
+    def build_changes(stats):
+        updated = {}
+        totals.clear()
+        for username, quiz_name, elapsed_time, correct_answers, total_questions in results:
+            key = (canonical_username(username), quiz_name)
+            previous = updated.get(key) or stats.get(key[0], {}).get(quiz_name)
+            quiz_stats = add_quiz_result(previous, elapsed_time, correct_answers, total_questions)
+            updated[key] = quiz_stats
+            totals.append(quiz_stats)
+        return [{"op": "set", "path": list(key), "value": value} for key, value in updated.items()]
+
+    def build_aggregate_changes(aggregates):
+        updated = {}
+        for username, quiz_name, elapsed_time, correct_answers, total_questions in results:
+            for path in (("platform",), ("quizzes", quiz_name)):
+                if path in updated:
+                    aggregate = updated[path]
+                elif len(path) == 1:
+                    aggregate = aggregates.get("platform") or new_aggregate()
+                else:
+                    aggregate = aggregates.get("quizzes", {}).get(quiz_name) or new_aggregate()
+                updated[path] = aggregate_add(aggregate, elapsed_time, correct_answers, total_questions)
+        return [{"op": "set", "path": list(path), "value": value} for path, value in updated.items()]
+
+    def build_user_aggregate_changes(user_aggregates):
+        updated = {}
+        for username, quiz_name, elapsed_time, correct_answers, total_questions in results:
+            key = canonical_username(username)
+            aggregate = updated.get(key) or user_aggregates.get(key) or new_aggregate(with_quantiles=False)
+            updated[key] = aggregate_add(aggregate, elapsed_time, correct_answers, total_questions)
+        return [{"op": "set", "path": [key], "value": value} for key, value in updated.items()]
+
+    if not results:
+        return []
+    ensure_aggregates()
+    usernames = {canonical_username(username) for username, *_ in results}
+    if STATS_FILE not in written:
+        # Só os usuários do lote são lidos: o custo não depende do tamanho do statistics.json
+        update_json(STATS_FILE, {}, build_changes, keys=usernames)
+        written[STATS_FILE] = list(totals)
+    if AGGREGATES_FILE not in written:
+        # Lidos por chave: gravações de outras sessões não obrigam a reler o arquivo e o diário inteiros
+        written[AGGREGATES_FILE] = update_json(AGGREGATES_FILE, {}, build_aggregate_changes,
+                                               keys=["platform", "quizzes"])
+    if USER_AGGREGATES_FILE not in written:
+        written[USER_AGGREGATES_FILE] = update_json(USER_AGGREGATES_FILE, {}, build_user_aggregate_changes,
+                                                    keys=usernames)
+    return written[STATS_FILE]
+
+def record_quiz_result(username, quiz_name, elapsed_time, correct_answers, total_questions):
+    """Soma uma tentativa às estatísticas do usuário e retorna os totais atualizados do quiz."""
+    return record_quiz_results([(username, quiz_name, elapsed_time, correct_answers, total_questions)])[0]
+
+# Rankings (por quiz e geral): taxa de acerto, depois tempo médio por tentativa
+LEADERBOARD_TOP_K = 10
+LEADERBOARD_MAX_LEVELS = 32  # Níveis da skip list: suficiente para 2**32 participantes
+GLOBAL_LEADERBOARD = ""  # Escopo do ranking geral (nenhum quiz tem id vazio)
+
+# Rankings por quiz e geral: escopo -> {"list": skip list indexável, "keys": {usuário: chave}}.
+# Montados na primeira consulta; depois, os usuários alterados pelas linhas novas do diário
+# das estatísticas (desta ou de outras sessões) são reposicionados a cada consulta.
+_leaderboards = {"journal": None, "boards": {}}
+_leaderboards_guard = threading.Lock()
 
-def run_quiz(questions, quiz_name, username):
-    """Executa um quiz genérico."""
+def skiplist_level():
+    """Sorteia a altura de um nó (distribuição geométrica com p = 1/2)."""
+    import random
+    bits = random.getrandbits(LEADERBOARD_MAX_LEVELS - 1)
+    return (bits & -bits).bit_length() if bits else LEADERBOARD_MAX_LEVELS
+
+def new_skiplist(sorted_keys=()):
+    """Cria uma skip list indexável a partir de chaves já ordenadas, em O(n).
+
+    Cada nó é [chave, próximos, larguras]; a largura de um link é quantos itens ele
+    pula, o que permite achar a posição de uma chave (e o item de uma posição) em O(log n).
+    """
+    tail = [(float("inf"),), [], []]
+    head = [None, [tail] * LEADERBOARD_MAX_LEVELS, [0] * LEADERBOARD_MAX_LEVELS]
+    last = [head] * LEADERBOARD_MAX_LEVELS
+    last_position = [0] * LEADERBOARD_MAX_LEVELS
+    position = 0
+    for position, key in enumerate(sorted_keys, start=1):
+        height = skiplist_level()
+        node = [key, [tail] * height, [0] * height]
+        for level in range(height):
+            last[level][1][level] = node
+            last[level][2][level] = position - last_position[level]
+            last[level] = node
+            last_position[level] = position
+    for level in range(LEADERBOARD_MAX_LEVELS):
+        last[level][2][level] = position + 1 - last_position[level]
+    return {"head": head, "size": position}
+
+def skiplist_insert(skiplist, key):
+    """Insere uma chave mantendo a ordem: O(log n) esperado."""
+    chain = [None] * LEADERBOARD_MAX_LEVELS
+    steps_at_level = [0] * LEADERBOARD_MAX_LEVELS
+    node = skiplist["head"]
+    for level in reversed(range(LEADERBOARD_MAX_LEVELS)):
+        while node[1][level][0] <= key:
+            steps_at_level[level] += node[2][level]
+            node = node[1][level]
+        chain[level] = node
+    height = skiplist_level()
+    new_node = [key, [None] * height, [None] * height]
+    steps = 0
+    for level in range(height):
+        previous = chain[level]
+        new_node[1][level] = previous[1][level]
+        previous[1][level] = new_node
+        new_node[2][level] = previous[2][level] - steps
+        previous[2][level] = steps + 1
+        steps += steps_at_level[level]
+    for level in range(height, LEADERBOARD_MAX_LEVELS):
+        chain[level][2][level] += 1
+    skiplist["size"] += 1
+
+def skiplist_remove(skiplist, key):
+    """Remove uma chave existente: O(log n) esperado."""
+    chain = [None] * LEADERBOARD_MAX_LEVELS
+    node = skiplist["head"]
+    for level in reversed(range(LEADERBOARD_MAX_LEVELS)):
+        while node[1][level][0] < key:
+            node = node[1][level]
+        chain[level] = node
+    target = chain[0][1][0]
+    if target[0] != key:
+        raise KeyError(key)
+    for level in range(len(target[1])):
+        previous = chain[level]
+        previous[2][level] += target[2][level] - 1
+        previous[1][level] = target[1][level]
+    for level in range(len(target[1]), LEADERBOARD_MAX_LEVELS):
+        chain[level][2][level] -= 1
+    skiplist["size"] -= 1
+
+def skiplist_rank(skiplist, key):
+    """Quantas chaves são menores que `key` (a posição dela, começando em 0): O(log n)."""
+    position = 0
+    node = skiplist["head"]
+    for level in reversed(range(LEADERBOARD_MAX_LEVELS)):
+        while node[1][level][0] < key:
+            position += node[2][level]
+            node = node[1][level]
+    return position
+
+def iter_skiplist(skiplist, start=0):
+    """Percorre as chaves a partir da posição `start` (O(log n) para chegar lá, O(1) por item)."""
+    node = skiplist["head"]
+    remaining = start + 1
+    for level in reversed(range(LEADERBOARD_MAX_LEVELS)):
+        while node[2][level] <= remaining and node[1][level][1]:
+            remaining -= node[2][level]
+            node = node[1][level]
+    if remaining:  # start além do fim
+        return
+    while node[1]:
+        yield node[0]
+        node = node[1][0]
+
+def leaderboard_key(username, quizzes):
+    """Chave de ordenação de um usuário: maior taxa de acerto, depois menor tempo médio.
+
+    `quizzes` são as estatísticas dos quizzes que entram no ranking (um só, ou todos
+    para o geral). Retorna None se não houver tentativas.
+    """
+    attempts = sum(data["attempts"] for data in quizzes)
+    if not attempts:
+        return None
+    questions = sum(data.get("total_questions", 0) for data in quizzes)
+    correct = sum(data["correct_answers"] for data in quizzes if "total_questions" in data)
+    accuracy = correct / questions if questions else 0.0
+    return (-accuracy, sum(data["total_time"] for data in quizzes) / attempts, username)
+
+def leaderboard_keys(username, quizzes):
+    """{escopo: chave} do usuário em cada ranking de que participa (cada quiz e o geral)."""
+    keys = {}
+    for scope, data in [*((quiz, [stats]) for quiz, stats in quizzes.items()),
+                        (GLOBAL_LEADERBOARD, list(quizzes.values()))]:
+        key = leaderboard_key(username, data)
+        if key is not None:
+            keys[scope] = key
+    return keys
+
+def update_leaderboards(boards, usernames):
+    """Reposiciona nos rankings os usuários cujas estatísticas mudaram: O(log n) por ranking."""
+    stats = load_json_items(STATS_FILE, usernames, {})
+    for username in usernames:
+        keys = leaderboard_keys(username, stats.get(username, {}))
+        for scope in set(keys) | {scope for scope, board in boards.items() if username in board["keys"]}:
+            board = boards.setdefault(scope, {"list": new_skiplist(), "keys": {}})
+            old_key = board["keys"].pop(username, None)
+            if old_key is not None:
+                skiplist_remove(board["list"], old_key)
+            if scope in keys:
+                skiplist_insert(board["list"], keys[scope])
+                board["keys"][username] = keys[scope]
+
+def load_leaderboards():
+    """Rankings atualizados com as linhas novas do diário das estatísticas.
+
+    Só são montados do zero na primeira consulta, ou se o statistics.json for trocado
+    por algo além de uma compactação (ver read_journal_changes).
+    """
+    with _leaderboards_guard:
+        journal = _leaderboards["journal"]
+        changes = read_journal_changes(STATS_FILE, journal) if journal is not None else None
+        if changes is None:
+            journal = follow_json_journal(STATS_FILE)
+            keys = {}
+            for username, quizzes in iter_json_items(STATS_FILE, {}):
+                for scope, key in leaderboard_keys(username, quizzes).items():
+                    keys.setdefault(scope, {})[username] = key
+            _leaderboards["boards"] = {
+                scope: {"list": new_skiplist(sorted(users.values())), "keys": users}
+                for scope, users in keys.items()
+            }
+            _leaderboards["journal"] = journal
+        elif changes:
+            update_leaderboards(_leaderboards["boards"], {change["path"][0] for change in changes})
+        return _leaderboards["boards"]
+
+def leaderboard_top(scope=GLOBAL_LEADERBOARD, k=LEADERBOARD_TOP_K, start=0):
+    """As posições start+1 .. start+k do ranking como (posição, usuário, acerto, tempo médio)."""
+    board = load_leaderboards().get(scope)
+    if board is None:
+        return []
+    return [(position, key[2], -key[0], key[1])
+            for position, key in enumerate(islice(iter_skiplist(board["list"], start), k), start=start + 1)]
+
+def leaderboard_rank(username, scope=GLOBAL_LEADERBOARD):
+    """(posição, total de participantes) do usuário no ranking, ou None se ele não participa."""
+    board = load_leaderboards().get(scope)
+    key = board["keys"].get(canonical_username(username)) if board else None
+    if key is None:
+        return None
+    return skiplist_rank(board["list"], key) + 1, board["list"]["size"]
+
+# Histórico de tentativas: uma linha binária de largura fixa por questão respondida
+# (instante, tentativa, usuário, quiz, questão, acertou, resposta, tempo da questão)
+ATTEMPT_RECORD = struct.Struct("<dIIHHBBf")
+ATTEMPT_COLUMNS = ("timestamp", "attempt", "user", "quiz", "question", "correct", "answer", "elapsed")
+ATTEMPT_DTYPE = [
+    ("timestamp", "<f8"), ("attempt", "<u4"), ("user", "<u4"), ("quiz", "<u2"),
+    ("question", "<u2"), ("correct", "u1"), ("answer", "u1"), ("elapsed", "<f4")
+]  # Mesmo layout do struct, para o NumPy
+
+# Nomes de usuários e quizzes internados como inteiros: tipo -> {"ids": {nome: id}, "names": [nome]}
+# "file" identifica o arquivo lido (dispositivo, inode) e "offset" é o fim da última linha completa lida
+_attempt_ids = {}
+_attempt_ids_guard = threading.Lock()
+
+def reset_attempt_ids(identity=None):
+    """Esvazia a tabela de nomes internados (o arquivo volta a ser lido desde o início)."""
+    _attempt_ids.update(file=identity, offset=0, user={"ids": {}, "names": []}, quiz={"ids": {}, "names": []})
+
+reset_attempt_ids()
+
+def load_attempt_ids():
+    """Carrega a tabela de nomes internados do histórico; se o arquivo cresceu, lê só as linhas novas.
+
+    O arquivo só recebe acréscimos no fim. Se ele for substituído (restauração de
+    um snapshot) ou encolher, a tabela é refeita desde o início.
+    """
+    import json
+    with _attempt_ids_guard, ExitStack() as stack:
+        file = stack.enter_context(ATTEMPT_IDS_FILE.open('rb')) if ATTEMPT_IDS_FILE.exists() else None
+        info = os.fstat(file.fileno()) if file else None
+        identity = (info.st_dev, info.st_ino) if info else None
+        size = info.st_size if info else 0
+        if identity != _attempt_ids["file"] or size < _attempt_ids["offset"]:
+            reset_attempt_ids(identity)
+        if size > _attempt_ids["offset"]:
+            file.seek(_attempt_ids["offset"])
+            data = file.read(size - _attempt_ids["offset"])
+            end = data.rfind(b"\n") + 1  # Uma linha ainda incompleta fica para a próxima leitura
+            for line in data[:end].splitlines():
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                table = _attempt_ids[entry["kind"]]
+                if entry["name"] not in table["ids"]:
+                    table["ids"][entry["name"]] = len(table["names"])
+                    table["names"].append(entry["name"])
+            _attempt_ids["offset"] += end
+    return _attempt_ids
+
+def intern_attempt_names(kind, names):
+    """Retorna os ids dos nomes, registrando os novos no arquivo de ids (chamar com a trava do log).
+
+    Os ids novos vão para o disco (fsync) antes de qualquer registro que os use: após
+    uma queda, o histórico nunca aponta para um nome que não está no arquivo de ids.
+    """
+    import json
+    table = load_attempt_ids()[kind]
+    new_names = [name for name in dict.fromkeys(names) if name not in table["ids"]]
+    if new_names:
+        ensure_directory_exists(ATTEMPT_IDS_FILE)
+        payload = "".join(json.dumps({"kind": kind, "name": name}, ensure_ascii=False) + "\n"
+                          for name in new_names).encode('utf-8')
+        with ATTEMPT_IDS_FILE.open('a+b') as file:
+            # Se uma gravação anterior foi interrompida, começa em uma linha nova
+            if file.tell() > 0:
+                file.seek(-1, os.SEEK_END)
+                if file.read(1) != b"\n":
+                    payload = b"\n" + payload
+            file.write(payload)
+            file.flush()
+            os.fsync(file.fileno())
+        table = load_attempt_ids()[kind]
+    return [table["ids"][name] for name in names]
+
+def log_quiz_attempts(attempts):
+    """Acrescenta tentativas ao histórico binário com uma única gravação.
+
+    Cada tentativa é (usuário, quiz, instante de início, respostas), onde respostas
+    é uma lista de (índice da questão, letra, acertou, segundos na questão).
+    """
+    if not attempts:
+        return
+    with file_lock(ATTEMPTS_LOG_FILE):
+        user_ids = intern_attempt_names("user", [canonical_username(username) for username, _, _, _ in attempts])
+        quiz_ids = intern_attempt_names("quiz", [quiz_name for _, quiz_name, _, _ in attempts])
+        ensure_directory_exists(ATTEMPTS_LOG_FILE)
+        with ATTEMPTS_LOG_FILE.open('a+b') as file:
+            file.seek(0, os.SEEK_END)
+            size = file.tell()
+            if size % ATTEMPT_RECORD.size:
+                # Descarta um registro incompleto deixado por uma gravação interrompida
+                size -= size % ATTEMPT_RECORD.size
+                file.truncate(size)
+            next_row = size // ATTEMPT_RECORD.size
+            payload = bytearray()
+            for (_, _, started, outcomes), user_id, quiz_id in zip(attempts, user_ids, quiz_ids):
+                for number, answer, correct, elapsed in outcomes:
+                    payload += ATTEMPT_RECORD.pack(
+                        started, next_row, user_id, quiz_id, number, bool(correct), ord(answer), elapsed
+                    )
+                next_row += len(outcomes)
+            file.write(payload)
+            file.flush()
+            os.fsync(file.fileno())
+
+def read_attempt_log():
+    """Retorna as colunas do histórico (arrays NumPy mapeados em memória, ou listas sem NumPy)."""
+    np = optional_module("numpy")
+    size = ATTEMPTS_LOG_FILE.stat().st_size if ATTEMPTS_LOG_FILE.exists() else 0
+    count = size // ATTEMPT_RECORD.size
+    if count == 0:
+        return {column: [] for column in ATTEMPT_COLUMNS}
+    with ATTEMPTS_LOG_FILE.open('rb') as file:
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    if np is not None:
+        records = np.frombuffer(mapped, dtype=np.dtype(ATTEMPT_DTYPE), count=count)
+        return {column: records[column] for column in ATTEMPT_COLUMNS}
+    rows = ATTEMPT_RECORD.iter_unpack(mapped[:count * ATTEMPT_RECORD.size])
+    return dict(zip(ATTEMPT_COLUMNS, (list(column) for column in zip(*rows))))
+
+def question_difficulty(quiz_name):
+    """Por questão do quiz: respostas, taxa de acerto e tempo médio, a partir do histórico."""
+    np = optional_module("numpy")
+    ids = load_attempt_ids()["quiz"]["ids"]
+    if quiz_name not in ids:
+        return []
+    log = read_attempt_log()
+    quiz_id = ids[quiz_name]
+    if np is not None:
+        mask = log["quiz"] == quiz_id
+        questions = log["question"][mask]
+        answered = np.bincount(questions)
+        correct = np.bincount(questions, weights=log["correct"][mask])
+        elapsed = np.bincount(questions, weights=log["elapsed"][mask])
+        return [
+            {"question": number, "answers": int(total), "accuracy": float(correct[number] / total),
+             "average_time": float(elapsed[number] / total)}
+            for number, total in enumerate(answered) if total
+        ]
+    totals = {}
+    for quiz, number, hit, seconds in zip(log["quiz"], log["question"], log["correct"], log["elapsed"]):
+        if quiz == quiz_id:
+            total = totals.setdefault(number, [0, 0, 0.0])
+            total[0] += 1
+            total[1] += hit
+            total[2] += seconds
+    return [
+        {"question": number, "answers": total[0], "accuracy": total[1] / total[0],
+         "average_time": total[2] / total[0]}
+        for number, total in sorted(totals.items())
+    ]
+
+def attempt_time_trend(quiz_name=None, bucket_seconds=86400):
+    """Por período (padrão: dia): questões respondidas, taxa de acerto e tempo médio por questão."""
+    np = optional_module("numpy")
+    log = read_attempt_log()
+    quiz_id = load_attempt_ids()["quiz"]["ids"].get(quiz_name)
+    if quiz_name is not None and quiz_id is None:
+        return []
+    if np is not None:
+        mask = np.ones(len(log["quiz"]), dtype=bool) if quiz_id is None else log["quiz"] == quiz_id
+        buckets = (log["timestamp"][mask] // bucket_seconds).astype(np.int64)
+        if not len(buckets):
+            return []
+        keys, inverse = np.unique(buckets, return_inverse=True)
+        answered = np.bincount(inverse)
+        correct = np.bincount(inverse, weights=log["correct"][mask])
+        elapsed = np.bincount(inverse, weights=log["elapsed"][mask])
+        return [
+            {"start": float(key * bucket_seconds), "answers": int(total),
+             "accuracy": float(correct[i] / total), "average_time": float(elapsed[i] / total)}
+            for i, (key, total) in enumerate(zip(keys, answered))
+        ]
+    totals = {}
+    for quiz, stamp, hit, seconds in zip(log["quiz"], log["timestamp"], log["correct"], log["elapsed"]):
+        if quiz_id is None or quiz == quiz_id:
+            total = totals.setdefault(int(stamp // bucket_seconds), [0, 0, 0.0])
+            total[0] += 1
+            total[1] += hit
+            total[2] += seconds
+    return [
+        {"start": float(key * bucket_seconds), "answers": total[0],
+         "accuracy": total[1] / total[0], "average_time": total[2] / total[0]}
+        for key, total in sorted(totals.items())
+    ]
+
+def compare_cohorts(cohorts, quiz_name=None):
+    """Compara grupos de usuários ({nome do grupo: [usuários]}) por taxa de acerto e tempo por questão."""
+    np = optional_module("numpy")
+    ids = load_attempt_ids()
+    log = read_attempt_log()
+    quiz_id = ids["quiz"]["ids"].get(quiz_name)
+    if quiz_name is not None and quiz_id is None:
+        return {name: None for name in cohorts}
+    result = {}
+    for name, usernames in cohorts.items():
+        members = {ids["user"]["ids"][user] for user in usernames if user in ids["user"]["ids"]}
+        if np is not None:
+            mask = np.isin(log["user"], list(members))
+            if quiz_id is not None:
+                mask &= log["quiz"] == quiz_id
+            answered = int(mask.sum())
+            correct = float(log["correct"][mask].sum())
+            elapsed = float(log["elapsed"][mask].sum())
+        else:
+            answered = correct = elapsed = 0
+            for user, quiz, hit, seconds in zip(log["user"], log["quiz"], log["correct"], log["elapsed"]):
+                if user in members and (quiz_id is None or quiz == quiz_id):
+                    answered += 1
+                    correct += hit
+                    elapsed += seconds
+        result[name] = {
+            "users": len(members), "answers": answered,
+            "accuracy": correct / answered if answered else None,
+            "average_time": elapsed / answered if answered else None
+        }
+    return result
+
+# Modo adaptativo: as questões em que o aluno (ou, sem histórico, a turma) mais erra vêm primeiro
+ADAPTIVE_QUIZ_LENGTH = 10
+ADAPTIVE_PRIOR_WEIGHT = 2  # Peso, em respostas, da dificuldade geral na estimativa de cada aluno
+QUESTION_OVERRIDE_LIMIT = 1024  # Questões atualizadas antes de refazer o heap do quiz
+
+# Heap de prioridade por quiz: "quizzes" = quiz -> {"size", "heap", "overrides", "override_heap"}.
+# As linhas novas do diário das estatísticas, desta ou de outras sessões, vão para "overrides"
+# (um novo estado a cada vez, então quem já está percorrendo o estado anterior não é afetado);
+# o heap de um quiz só é refeito depois de QUESTION_OVERRIDE_LIMIT questões atualizadas.
+_question_priority = {"journal": None, "quizzes": {}}
+_question_priority_guard = threading.Lock()
+
+def question_error_rate(entry):
+    """Taxa de erro suavizada de uma questão a partir de [respostas, acertos, tempo total]."""
+    answers, correct = entry[:2] if entry else (0, 0)
+    return (answers - correct + 1) / (answers + 2)
+
+def apply_question_changes(quizzes, changes):
+    """Leva aos heaps já montados as questões alteradas pelas linhas novas do diário."""
+    changed = {}
+    for change in changes:
+        quiz_name, *key = change["path"]
+        if quiz_name in quizzes:
+            changed.setdefault(quiz_name, set()).add(key[0] if key else None)
+    stats = load_json_items(QUESTION_STATS_FILE, changed, {})
+    for quiz_name, keys in changed.items():
+        state = quizzes[quiz_name]
+        overrides = dict(state["overrides"])
+        for key in keys - {None}:
+            if int(key) < state["size"]:
+                overrides[int(key)] = question_error_rate(stats.get(quiz_name, {}).get(key))
+        if None in keys or len(overrides) > QUESTION_OVERRIDE_LIMIT:
+            del quizzes[quiz_name]  # Quiz inteiro trocado, ou muitas questões: refeito no próximo uso
+            continue
+        quizzes[quiz_name] = dict(state, overrides=overrides,
+                                  override_heap=sorted((-rate, 0, index) for index, rate in overrides.items()))
+
+def question_priority(quiz_name, size):
+    """Estado pré-computado de prioridade do quiz (heap pela taxa de erro geral de cada questão)."""
+    with _question_priority_guard:
+        journal = _question_priority["journal"]
+        changes = read_journal_changes(QUESTION_STATS_FILE, journal) if journal is not None else None
+        if changes is None:
+            _question_priority.update(journal=follow_json_journal(QUESTION_STATS_FILE), quizzes={})
+        elif changes:
+            apply_question_changes(_question_priority["quizzes"], changes)
+        state = _question_priority["quizzes"].get(quiz_name)
+        if state is None or state["size"] != size:
+            stats = load_json_items(QUESTION_STATS_FILE, [quiz_name], {}).get(quiz_name, {})
+            heap = [(-question_error_rate(stats.get(str(index))), 0, index) for index in range(size)]
+            heapq.heapify(heap)
+            state = {"size": size, "heap": heap, "overrides": {}, "override_heap": []}
+            _question_priority["quizzes"][quiz_name] = state
+        return state
+
+def iter_heap_order(heap):
+    """Percorre um heap em ordem sem alterá-lo: O(log k) por item, com um heap auxiliar da fronteira."""
+    if not heap:
+        return
+    frontier = [(heap[0], 0)]
+    while frontier:
+        item, position = heapq.heappop(frontier)
+        yield item
+        for child in (2 * position + 1, 2 * position + 2):
+            if child < len(heap):
+                heapq.heappush(frontier, (heap[child], child))
+
+def adaptive_question_order(quiz_name, username, size, length=ADAPTIVE_QUIZ_LENGTH):
+    """Gera os índices das questões do ponto mais fraco do aluno para o mais forte.
+
+    Questões que o aluno já respondeu usam o histórico dele, puxado para a taxa de
+    erro geral; as demais seguem o heap pré-computado do quiz. As três fontes já
+    estão ordenadas e são intercaladas com heapq.merge: O(log n) por questão.
+    """
+    state = question_priority(quiz_name, size)
+    stats = load_json_items(QUESTION_STATS_FILE, [quiz_name], {}).get(quiz_name, {})
+    learner_key = canonical_username(username)
+    learner = load_json_items(LEARNER_STATS_FILE, [learner_key], {}).get(learner_key, {}).get(quiz_name, {})
+    overrides = state["overrides"]
+    personal = []
+    for key, (seen, hits) in learner.items():
+        index = int(key)
+        if index < size:
+            difficulty = question_error_rate(stats.get(key))
+            weakness = (seen - hits + ADAPTIVE_PRIOR_WEIGHT * difficulty) / (seen + ADAPTIVE_PRIOR_WEIGHT)
+            personal.append((-weakness, seen, index))
+    personal.sort()
+    known = {item[2] for item in personal}
+    updated = (item for item in state["override_heap"] if item[2] not in known)
+    base = (item for item in iter_heap_order(state["heap"]) if item[2] not in overrides and item[2] not in known)
+    for item in islice(heapq.merge(personal, updated, base), min(length, size)):
+        yield item[2]
+
+def record_question_outcomes(attempts, written=None):
+    """Atualiza as estatísticas por questão (geral e por aluno) com uma gravação por arquivo.
+
+    Recebe as mesmas tentativas de log_quiz_attempts. Geral: {quiz: {questão:
+    [respostas, acertos, tempo total]}}; por aluno: {usuário: {quiz: {questão: [respostas, acertos]}}}.
+    `written` funciona como em record_quiz_results.
+    """
+    written = {} if written is None else written
+    question_totals = {}
+    learner_totals = {}
+    for username, quiz_name, _, outcomes in attempts:
+        for number, _, correct, elapsed in outcomes:
+            total = question_totals.setdefault((quiz_name, str(number)), [0, 0, 0.0])
+            total[0] += 1
+            total[1] += bool(correct)
+            total[2] += elapsed
+            total = learner_totals.setdefault((canonical_username(username), quiz_name, str(number)), [0, 0])
+            total[0] += 1
+            total[1] += bool(correct)
+    if not question_totals:
+        return
+
+    def build_question_changes(stats):
+        changes = []
+        for (quiz_name, key), (answers, correct, elapsed) in question_totals.items():
+            old = stats.get(quiz_name, {}).get(key, [0, 0, 0.0])
+            changes.append({"op": "set", "path": [quiz_name, key],
+                            "value": [old[0] + answers, old[1] + correct, old[2] + elapsed]})
+        return changes
+
+    def build_learner_changes(learners):
+        changes = []
+        for (username, quiz_name, key), (answers, correct) in learner_totals.items():
+            old = learners.get(username, {}).get(quiz_name, {}).get(key, [0, 0])
+            changes.append({"op": "set", "path": [username, quiz_name, key],
+                            "value": [old[0] + answers, old[1] + correct]})
+        return changes
+
+    if QUESTION_STATS_FILE not in written:
+        written[QUESTION_STATS_FILE] = update_json(QUESTION_STATS_FILE, {}, build_question_changes,
+                                                   keys={quiz_name for quiz_name, _ in question_totals})
+    if LEARNER_STATS_FILE not in written:
+        written[LEARNER_STATS_FILE] = update_json(LEARNER_STATS_FILE, {}, build_learner_changes,
+                                                  keys={username for username, _, _ in learner_totals})
+
+# Sessões interativas: o usuário e as estatísticas dele ficam em memória após o login e
+# os resultados dos quizzes são gravados em segundo plano (write-behind), em lotes.
+# Durabilidade: "sync" grava ao fim de cada quiz; "interval" a cada SESSION_FLUSH_SECONDS
+# (uma queda do processo perde no máximo esse intervalo); "exit" só no logout e ao sair.
+# Só a thread principal cria resultados pendentes; as telas que leem os arquivos alterados
+# pela thread de gravação chamam flush_sessions() antes, e assim as duas nunca os usam juntas.
+SESSION_DURABILITY_MODES = ("sync", "interval", "exit")
+SESSION_DURABILITY = os.environ.get("UNIAO_DURABILITY", "interval")
+if SESSION_DURABILITY not in SESSION_DURABILITY_MODES:
+    raise ValueError(f"UNIAO_DURABILITY deve ser {', '.join(SESSION_DURABILITY_MODES)} (recebido: {SESSION_DURABILITY!r})")
+SESSION_FLUSH_SECONDS = float(os.environ.get("UNIAO_FLUSH_SECONDS", "2"))
+
+# Sessões abertas neste processo: nome canônico -> sessão
+_sessions = {}
+_sessions_guard = threading.Lock()  # Protege _sessions e os buffers das sessões
+_flush_lock = threading.Lock()  # Uma gravação em lote por vez
+_flusher = {"thread": None, "wake": None, "stop": False}
+_pending_flushes = []  # Lotes cuja gravação falhou no meio: {"batch", "written"}, na ordem em que foram tirados
+session_stats = {"quizzes": 0, "flushes": 0, "flushed_results": 0, "flush_errors": 0}
+
+def open_session(user):
+    """Abre a sessão de um usuário autenticado.
+
+    As estatísticas do usuário são carregadas pela thread de gravação logo após o
+    login (no modo "sync", no primeiro uso), sem atrasar o menu.
+    """
+    session = {
+        "user": user,
+        "stats": None,
+        "loaded": threading.Event(),
+        "results": [],  # Para record_quiz_results
+        "attempts": [],  # Para log_quiz_attempts e record_question_outcomes
+    }
+    with _sessions_guard:
+        _sessions[canonical_username(user["username"])] = session
+    if SESSION_DURABILITY != "sync":
+        start_session_flusher()
+        _flusher["wake"].set()
+    return session
+
+def load_session_stats(session):
+    """Copia para a sessão as estatísticas gravadas do usuário.
+
+    Lê só a chave do usuário (load_json_items): na thread de gravação, um json.load
+    do arquivo inteiro seguraria o GIL e travaria o menu. Mesmo se a leitura falhar,
+    "loaded" é sinalizado (com "stats" ainda None), para ninguém esperar para sempre.
+    """
+    try:
+        username = canonical_username(session["user"]["username"])
+        user_stats = load_json_items(STATS_FILE, [username], {}).get(username, {})
+        session["stats"] = {quiz: dict(data) for quiz, data in user_stats.items()}
+    finally:
+        session["loaded"].set()
+
+def session_user_stats(session):
+    """Estatísticas do usuário na sessão, incluindo os quizzes ainda não gravados."""
+    if not session["loaded"].is_set() and _flusher["thread"] is None:
+        load_session_stats(session)
+    session["loaded"].wait()
+    if session["stats"] is None:
+        load_session_stats(session)  # A thread de gravação não conseguiu: tenta aqui, e o erro aparece aqui
+    return session["stats"]
+
+def active_session(username):
+    """Sessão aberta do usuário neste processo, ou None."""
+    return _sessions.get(canonical_username(username))
+
+def session_record_quiz(session, quiz_name, started, elapsed_time, outcomes):
+    """Registra um quiz na sessão e retorna os totais atualizados, sem esperar a gravação."""
+    username = canonical_username(session["user"]["username"])
+    correct_answers = sum(1 for _, _, correct, _ in outcomes if correct)
+    user_stats = session_user_stats(session)
+    with _sessions_guard:
+        quiz_stats = add_quiz_result(user_stats.get(quiz_name), elapsed_time, correct_answers, len(outcomes))
+        user_stats[quiz_name] = quiz_stats
+        session["results"].append((username, quiz_name, elapsed_time, correct_answers, len(outcomes)))
+        session["attempts"].append((username, quiz_name, started, outcomes))
+    session_stats["quizzes"] += 1
+    if SESSION_DURABILITY == "sync":
+        flush_sessions([session])
+        return session["stats"][quiz_name]
+    return quiz_stats
+
+def flush_sessions(sessions=None):
+    """Grava os resultados pendentes das sessões em um único lote por arquivo.
+
+    Cada arquivo recebe o lote uma única vez: se uma gravação falhar no meio, o lote
+    fica guardado com os arquivos já gravados e o próximo flush (antes de tirar um
+    lote novo) grava só os que faltaram. Retorna quantos resultados foram gravados.
+    """
+    with _flush_lock:
+        with _sessions_guard:
+            sessions = list(_sessions.values()) if sessions is None else sessions
+            batch = [(session, session["results"], session["attempts"]) for session in sessions if session["results"]]
+            for session, _, _ in batch:
+                session["results"], session["attempts"] = [], []
+        if batch:
+            _pending_flushes.append({"batch": batch, "written": {}})
+        flushed = 0
+        while _pending_flushes:
+            try:
+                flushed += write_session_batch(**_pending_flushes[0])
+            except Exception:
+                session_stats["flush_errors"] += 1
+                raise
+            _pending_flushes.pop(0)
+        return flushed
+
+def write_session_batch(batch, written):
+    """Grava um lote de flush_sessions, pulando os arquivos que já estão em `written`."""
+    results = [result for _, session_results, _ in batch for result in session_results]
+    attempts = [attempt for _, _, session_attempts in batch for attempt in session_attempts]
+    totals = record_quiz_results(results, written)
+    if ATTEMPTS_LOG_FILE not in written:
+        log_quiz_attempts(attempts)
+        written[ATTEMPTS_LOG_FILE] = True
+    record_question_outcomes(attempts, written)
+    # Os totais gravados incluem tentativas de outros processos; valem se o quiz não tiver outra pendente
+    by_user = {canonical_username(session["user"]["username"]): session for session, _, _ in batch}
+    with _sessions_guard:
+        for (username, quiz_name, *_), quiz_stats in zip(results, totals):
+            session = by_user[username]
+            if not any(result[1] == quiz_name for result in session["results"]):
+                session["stats"][quiz_name] = dict(quiz_stats)
+    session_stats["flushes"] += 1
+    session_stats["flushed_results"] += len(results)
+    return len(results)
+
+def close_session(session):
+    """Logout: grava o que estiver pendente e fecha a sessão."""
+    flush_sessions([session])
+    with _sessions_guard:
+        username = canonical_username(session["user"]["username"])
+        if _sessions.get(username) is session:
+            del _sessions[username]
+
+def run_session_flusher():
+    """Laço da thread de gravação: carrega as sessões novas e, a cada intervalo, grava o pendente."""
+    wake = _flusher["wake"]
+    while not _flusher["stop"]:
+        wake.wait(SESSION_FLUSH_SECONDS if SESSION_DURABILITY == "interval" else None)
+        wake.clear()
+        for session in list(_sessions.values()):
+            if not session["loaded"].is_set():
+                try:
+                    load_session_stats(session)
+                except Exception:
+                    pass  # A sessão carrega as estatísticas por conta própria no primeiro uso
+        try:
+            flush_sessions()
+        except Exception:
+            pass  # O lote fica guardado para a próxima tentativa; a thread não pode parar
+
+def start_session_flusher():
+    """Inicia (uma vez) a thread de gravação e registra a gravação final ao sair."""
+    if _flusher["thread"] is not None:
+        return
+    _flusher["wake"] = threading.Event()
+    _flusher["thread"] = threading.Thread(target=run_session_flusher, name="session-flusher", daemon=True)
+    _flusher["thread"].start()
+    atexit.register(stop_session_flusher)
+
+def stop_session_flusher():
+    """Ao sair do programa: para a thread e grava tudo o que ainda estiver pendente."""
+    if _flusher["thread"] is None:
+        return
+    _flusher["stop"] = True
+    _flusher["wake"].set()
+    _flusher["thread"].join()
+    _flusher["thread"] = None
+    _flusher["stop"] = False
+    flush_sessions()
+
+def run_quiz(questions, quiz_name, username, adaptive=False):
+    """Executa um quiz genérico (no modo adaptativo, só as questões mais fracas do aluno)."""
     correct_answers = 0
     start_time = time.time()
+    outcomes = []
+    if adaptive:
+        order = list(adaptive_question_order(quiz_name, username, len(questions)))
+    else:
+        order = range(len(questions))
 
-    for question in questions:
-        print()
-        try:
-            columns = os.get_terminal_size().columns
-        except OSError:
-            columns = 80
-        print(question["question"].center(columns))
+    for number in order:
+        question = questions[number]
+        question_start = time.time()
+        render_line("")
+        render_line(question["question"])
         for option in question["options"]:
-            print(option.center(columns))
-        answer = input("Sua resposta: ").strip().upper()
+            render_line(option)
+        answer = ask("Sua resposta: ").strip().upper()
         while answer not in ["A", "B", "C", "D"]:
-            print("❌ Opção inválida! Por favor, escolha entre A, B, C ou D.".center(columns))
-            answer = input("Sua resposta: ").strip().upper()
+            render_line("❌ Opção inválida! Por favor, escolha entre A, B, C ou D.")
+            answer = ask("Sua resposta: ").strip().upper()
+        outcomes.append((number, answer, answer == question["correct"], time.time() - question_start))
         if answer == question["correct"]:
-            print("✅ Resposta correta!".center(columns))
+            render_line("✅ Resposta correta!")
             correct_answers += 1
         else:
-            print(f"❌ Resposta incorreta! A resposta correta era: {question['correct']}".center(columns))
+            render_line(f"❌ Resposta incorreta! A resposta correta era: {question['correct']}")
 
     end_time = time.time()
     elapsed_time = end_time - start_time
 
-    print(f"\nVocê acertou {correct_answers} de {len(questions)} questões.".center(columns))
-    print(f"Tempo total: {elapsed_time:.2f} segundos.".center(columns))
+    render_line(f"\nVocê acertou {correct_answers} de {len(order)} questões.")
+    render_line(f"Tempo total: {elapsed_time:.2f} segundos.")
 
     # --- DEBUG: Mostra onde está salvando as estatísticas ---
     #print(f"[DEBUG] Salvando estatísticas em: {STATS_FILE}")
 
-    stats = load_json(STATS_FILE, {})
-    username_key = username.strip()
-    if username_key not in stats:
-        stats[username_key] = {}
-    if quiz_name not in stats[username_key]:
-        stats[username_key][quiz_name] = {
-            "total_time": 0,
-            "attempts": 0,
-            "correct_answers": 0,
-            "average_time": 0
-        }
+    session = active_session(username)
+    if session is not None:
+        quiz_stats = session_record_quiz(session, quiz_name, start_time, elapsed_time, outcomes)
+    else:
+        quiz_stats = record_quiz_result(username, quiz_name, elapsed_time, correct_answers, len(order))
+        log_quiz_attempts([(username, quiz_name, start_time, outcomes)])
+        record_question_outcomes([(username, quiz_name, start_time, outcomes)])
 
-    stats[username_key][quiz_name]["total_time"] += elapsed_time
-    stats[username_key][quiz_name]["attempts"] += 1
-    stats[username_key][quiz_name]["correct_answers"] += correct_answers
-    stats[username_key][quiz_name]["average_time"] = (
-        stats[username_key][quiz_name]["total_time"] / stats[username_key][quiz_name]["attempts"]
-    )
-    save_json(STATS_FILE, stats)
-
-    print(f"Tempo médio para este quiz: {stats[username_key][quiz_name]['average_time']:.2f} segundos.".center(columns))
-
-def logic_quiz(username):
-    """Quiz de Pensamento Lógico Computacional."""
-    questions = [
-        {
-            "question": "1️⃣ O que é o pensamento computacional?",
-            "options": [
-                "A) Um conjunto de regras para programar computadores.",
-                "B) Uma estratégia para resolver problemas de forma eficiente, criando soluções genéricas.",
-                "C) Uma técnica exclusiva para engenheiros de software.",
-                "D) Um método para aprender apenas matemática avançada."
-            ],
-            "correct": "B"
-        },
-        {
-            "question": "2️⃣ Quando o pensamento computacional deveria ser desenvolvido?",
-            "options": [
-                "A) Apenas na fase adulta, quando se aprende programação.",
-                "B) Apenas por profissionais de tecnologia.",
-                "C) Desde a infância, assim como outras disciplinas.",
-                "D) Somente em cursos de ciência da computação."
-            ],
-            "correct": "C"
-        },
-        {
-            "question": "3️⃣ O pensamento computacional está obrigatoriamente ligado ao ensino da programação?",
-            "options": [
-                "A) Sim, pois só pode ser aprendido escrevendo códigos.",
-                "B) Não, pois é uma habilidade que pode ser desenvolvida sem programação.",
-                "C) Sim, pois todas as soluções computacionais precisam de código.",
-                "D) Não, pois só é útil em jogos e inteligência artificial."
-            ],
-            "correct": "B"
-        }
-    ]
-    run_quiz(questions, "logic_quiz", username)
-
-def digital_security_quiz(username):
-    """Quiz de Segurança Digital e Cidadania Digital."""
-    questions = [
-        {
-            "question": "1️⃣ O que é uma senha forte?",
-            "options": [
-                "A) Uma senha curta e fácil de lembrar.",
-                "B) Uma senha longa, com letras, números e caracteres especiais.",
-                "C) Uma senha que contém apenas números.",
-                "D) Uma senha que é o nome do usuário."
-            ],
-            "correct": "B"
-        },
-        {
-            "question": "2️⃣ Qual é a melhor prática para proteger suas contas online?",
-            "options": [
-                "A) Usar a mesma senha para todas as contas.",
-                "B) Compartilhar sua senha com amigos de confiança.",
-                "C) Ativar a autenticação de dois fatores.",
-                "D) Escrever sua senha em um papel e deixá-lo visível."
-            ],
-            "correct": "C"
-        },
-        {
-            "question": "3️⃣ O que é phishing?",
-            "options": [
-                "A) Um ataque que tenta enganar pessoas para obter informações confidenciais.",
-                "B) Um software antivírus.",
-                "C) Um método de criptografia.",
-                "D) Um tipo de firewall."
-            ],
-            "correct": "A"
-        }
-    ]
-    run_quiz(questions, "digital_security_quiz", username)
-
-def python_programming_quiz(username):
-    """Quiz de Programação em Python."""
-    questions = [
-        {
-            "question": "1️⃣ Qual é a função usada para imprimir algo na tela em Python?",
-            "options": [
-                "A) print()",
-                "B) echo()",
-                "C) printf()",
-                "D) output()"
-            ],
-            "correct": "A"
-        },
-        {
-            "question": "2️⃣ Qual é o operador usado para exponenciação em Python?",
-            "options": [
-                "A) ^",
-                "B) **",
-                "C) //",
-                "D) %%"
-            ],
-            "correct": "B"
-        },
-        {
-            "question": "3️⃣ Qual é o tipo de dado retornado pela função input()?",
-            "options": [
-                "A) int",
-                "B) str",
-                "C) float",
-                "D) bool"
-            ],
-            "correct": "B"
-        }
-    ]
-    run_quiz(questions, "python_programming_quiz", username)
-
-def cyber_quiz(username):
-    """Quiz de Fundamentos de Cibersegurança."""
-    questions = [
-        {
-            "question": "1️⃣ O que é um firewall?",
-            "options": [
-                "A) Um dispositivo que protege redes contra acessos não autorizados.",
-                "B) Um software para editar imagens.",
-                "C) Um tipo de vírus de computador.",
-                "D) Uma ferramenta para criar senhas."
-            ],
-            "correct": "A"
-        },
-        {
-            "question": "2️⃣ Qual é a prática de enganar pessoas para obter informações confidenciais?",
-            "options": [
-                "A) Phishing",
-                "B) Malware",
-                "C) Firewall",
-                "D) Criptografia"
-            ],
-            "correct": "A"
-        },
-        {
-            "question": "3️⃣ O que significa HTTPS?",
-            "options": [
-                "A) Protocolo de Transferência de Hipertexto Seguro",
-                "B) Protocolo de Transferência de Arquivos",
-                "C) Sistema de Proteção de Dados",
-                "D) Rede de Segurança Avançada"
-            ],
-            "correct": "A"
-        }
-    ]
-    run_quiz(questions, "cyber_quiz", username)
+    render_line(f"Tempo médio para este quiz: {quiz_stats['average_time']:.2f} segundos.")
+
+# Catálogo e cursos já carregados neste processo
+_course_catalog = None
+_loaded_courses = {}
+
+def load_course_catalog():
+    """Carrega a lista de cursos (id, título e arquivo) sem abrir as questões."""
+    import json
+    global _course_catalog
+    if _course_catalog is None:
+        with COURSES_INDEX_FILE.open('r', encoding='utf-8') as file:
+            _course_catalog = json.load(file)
+    return _course_catalog
+
+def validate_course(course):
+    """Confere a estrutura de um curso e devolve suas questões normalizadas."""
+    questions = []
+    for number, question in enumerate(course.get("questions", []), start=1):
+        options = question.get("options", [])
+        if not question.get("question") or len(options) != 4:
+            raise ValueError(f"Curso {course.get('id')}: questão {number} precisa de enunciado e 4 opções.")
+        for letter, option in zip("ABCD", options):
+            if not option.startswith(f"{letter})"):
+                raise ValueError(f"Curso {course.get('id')}: questão {number}, opção {letter} mal formatada.")
+        if question.get("correct") not in ("A", "B", "C", "D"):
+            raise ValueError(f"Curso {course.get('id')}: questão {number} sem resposta correta válida.")
+        questions.append({
+            "question": question["question"],
+            "options": list(options),
+            "correct": question["correct"]
+        })
+    if not questions:
+        raise ValueError(f"Curso {course.get('id')} não tem questões.")
+    return questions
+
+def load_course(course_id):
+    """Carrega um curso sob demanda, usando a versão compilada quando o conteúdo não mudou.
+
+    O arquivo JSON é validado uma única vez; o resultado fica em cache (marshal)
+    com o hash do conteúdo no nome, então edições no curso geram uma nova versão.
+    """
+    import json
+    import hashlib
+    if course_id in _loaded_courses:
+        return _loaded_courses[course_id]
+    entry = next((item for item in load_course_catalog() if item["id"] == course_id), None)
+    if entry is None:
+        raise KeyError(f"Curso desconhecido: {course_id}")
+    raw = (COURSES_DIR / entry["file"]).read_bytes()
+    digest = hashlib.sha256(raw).hexdigest()[:16]
+    compiled_path = COURSE_CACHE_DIR / f"{course_id}.{digest}.marshal"
+    try:
+        course = marshal.loads(compiled_path.read_bytes())
+    except (OSError, EOFError, ValueError, TypeError):
+        source = json.loads(raw.decode('utf-8'))
+        course = {"id": course_id, "title": entry["title"], "questions": validate_course(source)}
+        ensure_directory_exists(compiled_path)
+        for stale_path in COURSE_CACHE_DIR.glob(f"{course_id}.*.marshal"):
+            stale_path.unlink()  # Versões compiladas de conteúdos antigos
+        tmp_path = compiled_path.with_name(compiled_path.name + ".tmp")
+        tmp_path.write_bytes(marshal.dumps(course))
+        os.replace(tmp_path, compiled_path)
+    _loaded_courses[course_id] = course
+    return course
+
+def start_course(course_id, username, adaptive=False):
+    """Carrega o curso escolhido e executa o seu quiz."""
+    course = load_course(course_id)
+    session = active_session(username)
+    if adaptive and session is not None:
+        flush_sessions([session])  # A ordem adaptativa considera os quizzes ainda pendentes
+    run_quiz(course["questions"], course["id"], username, adaptive)
 
 def show_courses(username):
     """Exibe as opções de cursos disponíveis."""
     print_banner("Cursos Disponíveis")
-    try:
-        columns = os.get_terminal_size().columns
-    except OSError:
-        columns = 80
-    print("1. Pensamento Lógico Computacional".center(columns))
-    print("2. Segurança Digital e Cidadania Digital".center(columns))
-    print("3. Programação em Python".center(columns))
-    print("4. Fundamentos de Cibersegurança".center(columns))
-    print("5. Voltar ao menu principal".center(columns))
+    catalog = load_course_catalog()
+    back_option = str(len(catalog) + 1)
+    for number, course in enumerate(catalog, start=1):
+        render_line(f"{number}. {course['title']}")
+    render_line(f"{back_option}. Voltar ao menu principal")
     while True:
-        choice = input("Escolha um curso entre 1, 2, 3, 4 ou digite 5 para voltar: ")
-        if choice == "1":
-            logic_quiz(username)
-        elif choice == "2":
-            digital_security_quiz(username)
-        elif choice == "3":
-            python_programming_quiz(username)
-        elif choice == "4":
-            cyber_quiz(username)
-        elif choice == "5":
-            print("Voltando ao menu principal...\n".center(columns))
+        choice = ask(f"Escolha um curso entre 1 e {len(catalog)} ou digite {back_option} para voltar: ")
+        if choice == back_option:
+            render_line("Voltando ao menu principal...\n")
             break
+        elif choice.isdigit() and 1 <= int(choice) <= len(catalog):
+            mode = ask("Modo: 1) todas as questões 2) adaptativo (suas questões mais difíceis primeiro): ").strip()
+            start_course(catalog[int(choice) - 1]["id"], username, adaptive=mode == "2")
         else:
-            print("❌ Opção inválida! Tente novamente.".center(columns))
+            render_line("❌ Opção inválida! Tente novamente.")
+
+def paginate(items, render_item, empty_message, page_size=REPORT_PAGE_SIZE):
+    """Exibe os itens de um iterador em páginas, consumindo só o necessário para cada página."""
+    items = iter(items)
+    batch = list(islice(items, page_size))
+    if not batch:
+        render_line(empty_message)
+    page = 1
+    while batch:
+        for item in batch:
+            render_item(item)
+        batch = list(islice(items, page_size))
+        if batch:
+            choice = ask(f"\nPágina {page} - Enter para a próxima página ou 'q' para voltar: ")
+            if choice.strip().lower() == "q":
+                return
+            page += 1
+    ask("\nPressione Enter para voltar ao menu.")
+
+def iter_sorted_pages(make_items, key, page_size=REPORT_PAGE_SIZE, reverse=False):
+    """Ordena um fluxo guardando só as páginas já exibidas (refaz a leitura a cada página)."""
+    select = heapq.nlargest if reverse else heapq.nsmallest
+    page = 0
+    while True:
+        wanted = (page + 1) * page_size
+        top = select(wanted, make_items(), key=key)
+        yield from top[page * page_size:]
+        if len(top) < wanted:
+            return
+        page += 1
+
+def iter_quiz_statistics(quiz=None, role=None, location=None):
+    """Percorre (usuário, quiz, dados) de statistics.json em fluxo, aplicando os filtros."""
+    location_key = canonical_location(location) if location else None
+    for user, quizzes in iter_json_items(STATS_FILE, {}):
+        if role or location:
+            record = get_user(user)
+            if record is None or (role and record["role"] != role) or (
+                    location and canonical_location(record["location"]) != location_key):
+                continue
+        for quiz_name, data in quizzes.items():
+            if quiz and quiz_name != quiz:
+                continue
+            yield user, quiz_name, data
 
 def show_all_quiz_statistics():
     """Exibe estatísticas de quizzes de todos os usuários para o administrador."""
-    stats = load_json(STATS_FILE, {})
-    try:
-        columns = os.get_terminal_size().columns
-    except OSError:
-        columns = 80
     print_banner("Estatísticas dos Quizzes (Todos os Usuários)")
-    if not stats:
-        print("Nenhuma estatística de quiz disponível.".center(columns))
+    quiz = ask("Filtrar por quiz (Enter para todos): ").strip()
+    role = ask("Filtrar por perfil - admin/user (Enter para todos): ").strip().lower()
+    location = ask("Filtrar por localidade (Enter para todas): ").strip()
+    order = ask("Ordenar por: 1) ordem de registro 2) tentativas 3) tempo médio: ").strip()
+
+    def make_items():
+        return iter_quiz_statistics(quiz, role, location)
+
+    if order == "2":
+        items = iter_sorted_pages(make_items, key=lambda item: item[2]["attempts"], reverse=True)
+    elif order == "3":
+        items = iter_sorted_pages(make_items, key=lambda item: item[2]["average_time"])
     else:
-        for user, quizzes in stats.items():
-            print(f"Usuário: {user}".center(columns))
-            for quiz, data in quizzes.items():
-                print(f"  {quiz}:".center(columns))
-                print(f"    - Tempo médio: {data['average_time']:.2f} segundos".center(columns))
-                print(f"    - Tentativas: {data['attempts']}".center(columns))
-                print(f"    - Respostas corretas: {data['correct_answers']}".center(columns))
-            print("-" * 40)
-    input("\nPressione Enter para voltar ao menu.")
+        items = make_items()
+
+    def render(item):
+        user, quiz_name, data = item
+        render_line(f"Usuário: {user}")
+        render_line(f"  {quiz_name}:")
+        render_line(f"    - Tempo médio: {data['average_time']:.2f} segundos")
+        render_line(f"    - Tentativas: {data['attempts']}")
+        render_line(f"    - Respostas corretas: {data['correct_answers']}")
+        render_line("-" * 40, center=False)
+
+    paginate(items, render, "Nenhuma estatística de quiz disponível.")
 
 def show_all_users():
     """Exibe todos os usuários cadastrados (exceto senhas) para o administrador."""
-    users_data = load_json(USER_DATA_FILE, {"users": []})
-    try:
-        columns = os.get_terminal_size().columns
-    except OSError:
-        columns = 80
     print_banner("Usuários Cadastrados")
-    if not users_data["users"]:
-        print("Nenhum usuário cadastrado.".center(columns))
-    else:
-        for user in users_data["users"]:
-            print(f"Usuário: {user['username']}".center(columns))
-            print(f"  Idade: {user['age']}".center(columns))
-            print(f"  Localidade: {user['location']}".center(columns))
-            print(f"  Perfil: {user['role']}".center(columns))
-            print("-" * 40)
-    input("\nPressione Enter para voltar ao menu.")
+    role = ask("Filtrar por perfil - admin/user (Enter para todos): ").strip().lower()
+    location = ask("Filtrar por localidade (Enter para todas): ").strip()
+    order = ask("Ordenar por: 1) cadastro 2) nome 3) idade 4) localidade: ").strip()
+    order_by = {"2": "username", "3": "age", "4": "location"}.get(order, "rowid")
+
+    def render(user):
+        render_line(f"Usuário: {user['username']}")
+        render_line(f"  Idade: {user['age']}")
+        render_line(f"  Localidade: {user['location']}")
+        render_line(f"  Perfil: {user['role']}")
+        render_line("-" * 40, center=False)
+
+    paginate(
+        iter_users(batch_size=REPORT_PAGE_SIZE, role=role, location=location, order_by=order_by),
+        render, "Nenhum usuário cadastrado."
+    )
 
 def show_locations():
     """Exibe levantamento de localidades dos usuários."""
-    locations_data = load_json(LOCATIONS_FILE, {})
-    try:
-        columns = os.get_terminal_size().columns
-    except OSError:
-        columns = 80
     print_banner("Levantamento de Localidades")
-    if not locations_data:
-        print("Nenhuma localidade cadastrada.".center(columns))
+    name = ask("Filtrar por nome da localidade (Enter para todas): ").strip()
+    order = ask("Ordenar por: 1) ordem de registro 2) mais usuários 3) ver usuários da localidade: ").strip()
+
+    if order == "3":
+        count = location_count(name)
+        render_line(f"{location_label(canonical_location(name), name)}: {count} usuário(s)")
+
+        def render_user(user):
+            render_line(f"  {user['username']} ({user['age']} anos)", center=False)
+
+        paginate(iter_users(batch_size=REPORT_PAGE_SIZE, location=name), render_user,
+                 "Nenhum usuário nesta localidade.")
+        return
+
+    folded = fold_location_text(name)
+    key = canonical_location(name)
+    items = (
+        (label, count) for location_key, label, count in iter_locations("users" if order == "2" else "rowid")
+        if location_key == key or folded in fold_location_text(label)
+    )
+
+    def render(item):
+        label, count = item
+        render_line(f"{label}: {count} usuário(s)")
+
+    paginate(items, render, "Nenhuma localidade cadastrada.")
+
+def analytics_signature():
+    """Identifica o estado do banco de usuários e das estatísticas usado no relatório analítico.
+
+    Idade e localidade não mudam depois do cadastro, então a contagem e o último
+    rowid bastam para o banco (o mtime do SQLite muda a cada checkpoint do WAL).
+    """
+    import hashlib
+    users = tuple(open_user_store().execute("SELECT count(*), max(rowid) FROM users").fetchone())
+    parts = [json_file_signature(STATS_FILE), users]
+    return hashlib.sha256(repr(parts).encode()).hexdigest()[:16]
+
+def load_analytics_columns():
+    """Carrega usuários e estatísticas como arrays NumPy com ids internados.
+
+    Usuários: idade e localidade (id). Estatísticas: uma linha por (usuário, quiz)
+    com tentativas, acertos, questões e tempo total. As colunas ficam em cache
+    (data/cache/analytics.<assinatura>.npz) até o banco ou as estatísticas mudarem.
+    """
+    np = optional_module("numpy")
+    signature = analytics_signature()
+    snapshot_path = COURSE_CACHE_DIR / f"analytics.{signature}.npz"
+    try:
+        with np.load(snapshot_path, allow_pickle=False) as snapshot:
+            return {name: snapshot[name] for name in snapshot.files}
+    except (OSError, ValueError, KeyError):
+        pass
+
+    user_index = {}
+    locations = {}
+    ages = []
+    user_locations = []
+    cursor = open_user_store().cursor()
+    cursor.row_factory = None  # Tuplas simples: bem mais rápido para milhões de linhas
+    for username, age, location in cursor.execute("SELECT username, age, location_key FROM users"):
+        user_index[canonical_username(username)] = len(ages)  # As estatísticas usam o nome canônico
+        ages.append(age)
+        user_locations.append(locations.setdefault(location, len(locations)))
+    labels = {key: location_label(key, name) for key, name, _ in iter_locations()}
+    quizzes = {}
+    rows = {"stat_user": [], "stat_quiz": [], "stat_attempts": [], "stat_correct": [],
+            "stat_questions": [], "stat_time": []}
+    for username, user_stats in iter_json_items(STATS_FILE, {}):
+        user_id = user_index.get(username)
+        if user_id is None:
+            continue  # Estatísticas de usuários que não estão mais no banco
+        for quiz_name, quiz_stats in user_stats.items():
+            rows["stat_user"].append(user_id)
+            rows["stat_quiz"].append(quizzes.setdefault(quiz_name, len(quizzes)))
+            rows["stat_attempts"].append(quiz_stats.get("attempts", 0))
+            rows["stat_correct"].append(quiz_stats.get("correct_answers", 0))
+            rows["stat_questions"].append(quiz_stats.get("total_questions", 0))
+            rows["stat_time"].append(quiz_stats.get("total_time", 0))
+
+    columns = {
+        "user_names": np.array(list(user_index), dtype=str),
+        "user_age": np.array(ages, dtype=np.int32),
+        "user_location": np.array(user_locations, dtype=np.int32),
+        "location_names": np.array([labels.get(key, key) for key in locations], dtype=str),
+        "quiz_names": np.array(list(quizzes), dtype=str),
+        "stat_user": np.array(rows["stat_user"], dtype=np.int32),
+        "stat_quiz": np.array(rows["stat_quiz"], dtype=np.int32),
+        "stat_attempts": np.array(rows["stat_attempts"], dtype=np.float64),
+        "stat_correct": np.array(rows["stat_correct"], dtype=np.float64),
+        "stat_questions": np.array(rows["stat_questions"], dtype=np.float64),
+        "stat_time": np.array(rows["stat_time"], dtype=np.float64),
+    }
+    ensure_directory_exists(snapshot_path)
+    for stale_path in COURSE_CACHE_DIR.glob("analytics.*.npz"):
+        stale_path.unlink()  # Colunas de um estado anterior dos dados
+    tmp_path = snapshot_path.with_name(snapshot_path.name + ".tmp")
+    with tmp_path.open('wb') as file:
+        np.savez(file, **columns)
+    os.replace(tmp_path, snapshot_path)
+    return columns
+
+def group_performance(keys, labels, columns):
+    """Soma tentativas, acertos, questões e tempo por grupo com bincount.
+
+    Há uma linha de estatística por (usuário, quiz), então os usuários distintos
+    de cada grupo são contados sobre os pares (grupo, usuário) sem repetição.
+    """
+    np = optional_module("numpy")
+    size = len(labels)
+    user_count = len(columns["user_names"])
+    pairs = np.unique(keys.astype(np.int64) * user_count + columns["stat_user"])
+    attempts = np.bincount(keys, weights=columns["stat_attempts"], minlength=size)
+    correct = np.bincount(keys, weights=columns["stat_correct"], minlength=size)
+    questions = np.bincount(keys, weights=columns["stat_questions"], minlength=size)
+    elapsed = np.bincount(keys, weights=columns["stat_time"], minlength=size)
+    users = np.bincount(pairs // max(user_count, 1), minlength=size)
+    return [
+        {"group": str(labels[i]), "users": int(users[i]), "attempts": int(attempts[i]),
+         "accuracy": float(correct[i] / questions[i]) if questions[i] else None,
+         "average_time": float(elapsed[i] / attempts[i])}
+        for i in range(size) if attempts[i]
+    ]
+
+def analytics_report(top_k=ANALYTICS_TOP_K):
+    """Calcula o relatório analítico: acerto por quiz, faixa etária e localidade,
+    distribuição do tempo médio por quiz e melhores/piores desempenhos."""
+    np = optional_module("numpy")
+    columns = load_analytics_columns()
+    stat_user = columns["stat_user"]
+    stat_quiz = columns["stat_quiz"]
+    user_band = np.digitize(columns["user_age"], AGE_BAND_EDGES[1:])
+
+    # Distribuição do tempo médio por tentativa de cada usuário, por quiz
+    with np.errstate(divide="ignore", invalid="ignore"):
+        average_times = columns["stat_time"] / columns["stat_attempts"]
+    valid = columns["stat_attempts"] > 0
+    order = np.argsort(stat_quiz[valid], kind="stable")
+    sorted_quiz = stat_quiz[valid][order]
+    sorted_times = average_times[valid][order]
+    bounds = np.searchsorted(sorted_quiz, np.arange(len(columns["quiz_names"]) + 1))
+    response_times = []
+    for quiz_id, quiz_name in enumerate(columns["quiz_names"]):
+        times = sorted_times[bounds[quiz_id]:bounds[quiz_id + 1]]
+        if len(times):
+            p10, p50, p90, p99 = np.percentile(times, [10, 50, 90, 99])
+            response_times.append({"group": str(quiz_name), "users": int(len(times)),
+                                   "p10": float(p10), "p50": float(p50), "p90": float(p90), "p99": float(p99)})
+
+    # Ranking por taxa de acerto (desempate: menor tempo por questão)
+    user_count = len(columns["user_names"])
+    questions = np.bincount(stat_user, weights=columns["stat_questions"], minlength=user_count)
+    correct = np.bincount(stat_user, weights=columns["stat_correct"], minlength=user_count)
+    elapsed = np.bincount(stat_user, weights=columns["stat_time"], minlength=user_count)
+    eligible = np.flatnonzero(questions >= ANALYTICS_MIN_QUESTIONS)
+    accuracy = correct[eligible] / questions[eligible]
+    time_per_question = elapsed[eligible] / questions[eligible]
+
+    def performers(best):
+        # Pré-seleciona com partition (O(n)) e ordena só os candidatos empatados no corte
+        key = -accuracy if best else accuracy
+        if len(key) > top_k:
+            candidates = np.flatnonzero(key <= np.partition(key, top_k - 1)[top_k - 1])
+        else:
+            candidates = np.arange(len(key))
+        tie_break = time_per_question[candidates] if best else -time_per_question[candidates]
+        ranked = candidates[np.lexsort((tie_break, key[candidates]))][:top_k]
+        return [
+            {"username": str(columns["user_names"][eligible[i]]), "accuracy": float(accuracy[i]),
+             "questions": int(questions[eligible[i]]), "time_per_question": float(time_per_question[i])}
+            for i in ranked
+        ]
+
+    return {
+        "users": int(user_count),
+        "by_quiz": group_performance(stat_quiz, columns["quiz_names"], columns),
+        "by_age_band": group_performance(user_band[stat_user], AGE_BAND_LABELS, columns),
+        "by_location": group_performance(columns["user_location"][stat_user], columns["location_names"], columns),
+        "response_times": response_times,
+        "top_performers": performers(best=True) if top_k > 0 else [],
+        "bottom_performers": performers(best=False) if top_k > 0 else [],
+    }
+
+def export_analytics(report, output, output_format):
+    """Grava o relatório analítico em JSON ou CSV (uma linha por grupo, com a coluna section)."""
+    import json
+    import csv
+    if output_format == "json":
+        output.write(json.dumps(report, indent=4, ensure_ascii=False) + "\n")
+        return
+    sections = [name for name, rows in report.items() if isinstance(rows, list)]
+    fieldnames = ["section"]
+    for name in sections:
+        for row in report[name]:
+            fieldnames.extend(field for field in row if field not in fieldnames)
+    writer = csv.DictWriter(output, fieldnames=fieldnames, restval="")
+    writer.writeheader()
+    for name in sections:
+        for row in report[name]:
+            writer.writerow({"section": name, **row})
+
+def show_platform_summary():
+    """Exibe médias, mediana e percentis de toda a plataforma a partir dos agregados."""
+    aggregates = load_aggregates()
+    print_banner("Resumo Geral da Plataforma")
+    sections = [("Plataforma", aggregates["platform"])] + sorted(aggregates["quizzes"].items())
+    for name, aggregate in sections:
+        summary = aggregate_summary(aggregate)
+        render_line(f"{name}:")
+        render_line(f"  - Tentativas: {summary['attempts']}")
+        if summary["accuracy"] is not None:
+            render_line(f"  - Taxa de acerto: {summary['accuracy']:.0%}")
+        render_line(f"  - Tempo médio: {summary['average_time']:.2f} s (desvio padrão {summary['time_stdev']:.2f} s)")
+        if summary["p50"] is not None:
+            render_line(f"  - Mediana: {summary['p50']:.2f} s | p90: {summary['p90']:.2f} s | p95: {summary['p95']:.2f} s")
+        render_line("-" * 40, center=False)
+    ask("\nPressione Enter para voltar ao menu.")
+
+def show_question_difficulty():
+    """Exibe a taxa de acerto e o tempo médio de cada questão, a partir do histórico de tentativas."""
+    print_banner("Dificuldade das Questões")
+    for course in load_course_catalog():
+        rows = question_difficulty(course["id"])
+        if not rows:
+            continue
+        render_line(f"{course['title']}:")
+        for row in rows:
+            render_line(
+                f"  Questão {row['question'] + 1}: {row['accuracy']:.0%} de acerto, "
+                f"{row['average_time']:.1f} s em média ({row['answers']} respostas)"
+            )
+        render_line("-" * 40, center=False)
+    ask("\nPressione Enter para voltar ao menu.")
+
+def show_analytics_report():
+    """Exibe o relatório analítico (acerto por quiz, faixa etária e localidade, tempos e ranking)."""
+    np = optional_module("numpy")
+    print_banner("Relatório Analítico")
+    if np is None:
+        render_line("❌ O relatório analítico requer o NumPy (pip install numpy).")
+        ask("\nPressione Enter para voltar ao menu.")
+        return
+    report = analytics_report()
+    titles = {"by_quiz": "Por quiz", "by_age_band": "Por faixa etária", "by_location": "Por localidade"}
+    for section, title in titles.items():
+        render_line(f"{title}:")
+        for row in report[section]:
+            accuracy = f"{row['accuracy']:.0%}" if row["accuracy"] is not None else "-"
+            render_line(f"  {row['group']}: {accuracy} de acerto, {row['average_time']:.1f} s por tentativa "
+                        f"({row['users']} usuário(s), {row['attempts']} tentativa(s))", center=False)
+        render_line("-" * 40, center=False)
+    render_line("Tempo médio por tentativa (p10 / p50 / p90 / p99):")
+    for row in report["response_times"]:
+        render_line(f"  {row['group']}: {row['p10']:.1f} / {row['p50']:.1f} / {row['p90']:.1f} / {row['p99']:.1f} s",
+                    center=False)
+    render_line("-" * 40, center=False)
+    for section, title in (("top_performers", "Melhores desempenhos"), ("bottom_performers", "Piores desempenhos")):
+        render_line(f"{title}:")
+        for row in report[section]:
+            render_line(f"  {row['username']}: {row['accuracy']:.0%} de acerto em {row['questions']} questões, "
+                        f"{row['time_per_question']:.1f} s por questão", center=False)
+    ask("\nPressione Enter para voltar ao menu.")
+
+def show_leaderboard(username=None):
+    """Exibe os primeiros colocados do ranking geral ou de um quiz e a posição de um usuário.
+
+    Sem `username` (administrador), pergunta qual usuário consultar.
+    """
+    print_banner("Ranking")
+    flush_sessions()  # O ranking inclui os quizzes ainda pendentes das sessões
+    catalog = load_course_catalog()
+    render_line("0. Geral")
+    for number, course in enumerate(catalog, start=1):
+        render_line(f"{number}. {course['title']}")
+    choice = ask("Escolha o ranking (Enter para o geral): ").strip() or "0"
+    if not choice.isdigit() or int(choice) > len(catalog):
+        render_line("❌ Opção inválida!")
+        ask("\nPressione Enter para voltar ao menu.")
+        return
+    if choice == "0":
+        scope, title = GLOBAL_LEADERBOARD, "Geral"
+    else:
+        scope, title = catalog[int(choice) - 1]["id"], catalog[int(choice) - 1]["title"]
+    rows = leaderboard_top(scope)
+    render_line(f"\nRanking - {title}:")
+    if not rows:
+        render_line("Nenhuma tentativa registrada.")
+    for position, name, accuracy, average_time in rows:
+        render_line(f"  {position}º {name}: {accuracy:.0%} de acerto, {average_time:.1f} s por tentativa",
+                    center=False)
+    if username is None:
+        username = ask("\nConsultar a posição de um usuário (Enter para pular): ")
+        if not username.strip():
+            ask("\nPressione Enter para voltar ao menu.")
+            return
+    rank = leaderboard_rank(username, scope)
+    if rank is None:
+        render_line(f"\n{username.strip()} ainda não participa deste ranking.")
     else:
-        for location, count in locations_data.items():
-            print(f"{location}: {count} usuário(s)".center(columns))
-    input("\nPressione Enter para voltar ao menu.")
+        render_line(f"\nPosição de {username.strip()}: {rank[0]}º de {rank[1]}")
+    ask("\nPressione Enter para voltar ao menu.")
 
 def show_admin_menu(username):
     """Exibe o menu principal para administradores."""
     while True:
         print_banner("Menu Principal (Administrador)")
-        try:
-            columns = os.get_terminal_size().columns
-        except OSError:
-            columns = 80
-        print("1. Escolher um curso".center(columns))
-        print("2. Estatísticas dos quizzes (todos os usuários)".center(columns))
-        print("3. Estatísticas de usuários cadastrados".center(columns))
-        print("4. Levantamento de localidades".center(columns))
-        print("5. Sair".center(columns))
-        choice = input("Escolha uma opção: ")
+        render_line("1. Escolher um curso")
+        render_line("2. Estatísticas dos quizzes (todos os usuários)")
+        render_line("3. Estatísticas de usuários cadastrados")
+        render_line("4. Levantamento de localidades")
+        render_line("5. Resumo geral da plataforma")
+        render_line("6. Dificuldade das questões")
+        render_line("7. Relatório analítico")
+        render_line("8. Ranking")
+        render_line("9. Sair")
+        choice = ask("Escolha uma opção: ")
+        if choice in ("2", "5", "6", "7"):
+            flush_sessions()  # Os relatórios leem os arquivos que a thread de gravação altera
         if choice == "1":
             show_courses(username)
         elif choice == "2":
@@ -540,58 +3049,66 @@ def show_admin_menu(username):
         elif choice == "4":
             show_locations()
         elif choice == "5":
-            print("Obrigado por usar a plataforma. Até logo!".center(columns))
+            show_platform_summary()
+        elif choice == "6":
+            show_question_difficulty()
+        elif choice == "7":
+            show_analytics_report()
+        elif choice == "8":
+            show_leaderboard()
+        elif choice == "9":
+            render_line("Obrigado por usar a plataforma. Até logo!")
             break
         else:
-            print("❌ Opção inválida! Tente novamente.".center(columns))
+            render_line("❌ Opção inválida! Tente novamente.")
 
 def show_user_menu(username):
     """Exibe o menu principal para usuários comuns."""
     while True:
         print_banner("Menu Principal")
-        try:
-            columns = os.get_terminal_size().columns
-        except OSError:
-            columns = 80
-        print("1. Escolher um curso".center(columns))
-        print("2. Ver estatísticas dos quizzes".center(columns))
-        print("3. Sair".center(columns))
-        choice = input("Escolha uma opção: ")
+        render_line("1. Escolher um curso")
+        render_line("2. Ver estatísticas dos quizzes")
+        render_line("3. Ranking")
+        render_line("4. Sair")
+        choice = ask("Escolha uma opção: ")
         if choice == "1":
             show_courses(username)
         elif choice == "2":
-            stats = load_json(STATS_FILE, {})
-            username_key = username.strip()
-            if username_key in stats and stats[username_key]:
+            session = active_session(username)
+            username_key = canonical_username(username)
+            # Na sessão, as estatísticas já estão em memória (incluindo os quizzes ainda não gravados)
+            if session is not None:
+                user_stats = session_user_stats(session)
+            else:
+                user_stats = load_json_items(STATS_FILE, [username_key], {}).get(username_key)
+            if user_stats:
                 print_banner(f"Estatísticas dos Quizzes para {username_key}")
-                for quiz, data in stats[username_key].items():
-                    print(f"{quiz}:".center(columns))
-                    print(f"  - Tempo médio: {data['average_time']:.2f} segundos".center(columns))
-                    print(f"  - Tentativas: {data['attempts']}".center(columns))
-                    print(f"  - Respostas corretas: {data['correct_answers']}".center(columns))
-                input("\nPressione Enter para voltar ao menu.")
+                for quiz, data in user_stats.items():
+                    render_line(f"{quiz}:")
+                    render_line(f"  - Tempo médio: {data['average_time']:.2f} segundos")
+                    render_line(f"  - Tentativas: {data['attempts']}")
+                    render_line(f"  - Respostas corretas: {data['correct_answers']}")
+                ask("\nPressione Enter para voltar ao menu.")
             else:
-                print("\nNenhuma estatística disponível para este usuário.".center(columns))
-                input("\nPressione Enter para voltar ao menu.")
+                render_line("\nNenhuma estatística disponível para este usuário.")
+                ask("\nPressione Enter para voltar ao menu.")
         elif choice == "3":
-            print("Obrigado por usar a plataforma. Até logo!".center(columns))
+            show_leaderboard(username)
+        elif choice == "4":
+            render_line("Obrigado por usar a plataforma. Até logo!")
             break
         else:
-            print("❌ Opção inválida! Tente novamente.".center(columns))
+            render_line("❌ Opção inválida! Tente novamente.")
 
 def main():
     """Função principal."""
     while True:
         print_banner("Bem-vindo à União Digital")
-        try:
-            columns = os.get_terminal_size().columns
-        except OSError:
-            columns = 80
-        print("1. Registrar-se".center(columns))
-        print("2. Login".center(columns))
-        print("3. Recuperar senha".center(columns))
-        print("4. Sair".center(columns))
-        choice = input("Escolha uma opção: ")
+        render_line("1. Registrar-se")
+        render_line("2. Login")
+        render_line("3. Recuperar senha")
+        render_line("4. Sair")
+        choice = ask("Escolha uma opção: ")
         if choice == "1":
             register()
         elif choice == "2":
@@ -599,10 +3116,982 @@ def main():
         elif choice == "3":
             reset_password()
         elif choice == "4":
-            print("Obrigado por usar a plataforma. Até logo!".center(columns))
+            render_line("Obrigado por usar a plataforma. Até logo!")
             break
         else:
-            print("❌ Opção inválida! Tente novamente.".center(columns))
+            render_line("❌ Opção inválida! Tente novamente.")
+    flush_frame()
+
+# Snapshots: cada arquivo de dados é dividido em blocos guardados uma única vez
+# (snapshots/objects/<hash>.<codec>); cada snapshot é um manifesto com a lista de blocos
+SNAPSHOT_CHUNK_BYTES = 1024 * 1024
+SNAPSHOT_JSON_FILES = DATA_JSON_FILES
+# Arquivos só com acréscimos no fim: blocos iniciais de um snapshot anterior são reaproveitados sem releitura
+SNAPSHOT_APPEND_ONLY = tuple(journal_path(path).name for path in SNAPSHOT_JSON_FILES) + (
+    ATTEMPTS_LOG_FILE.name, ATTEMPT_IDS_FILE.name)
+SNAPSHOT_NAMES = (USERS_DB_FILE.name,) + tuple(path.name for path in SNAPSHOT_JSON_FILES) + SNAPSHOT_APPEND_ONLY
+
+def snapshot_chunk_path(digest, codec):
+    """Caminho de um bloco comprimido no repositório de objetos."""
+    return SNAPSHOT_DIR / "objects" / digest[:2] / f"{digest}.{codec}"
+
+def store_snapshot_chunks(file, length, totals):
+    """Lê `length` bytes do arquivo e grava os blocos ainda não guardados. Retorna [[hash, codec], ...]."""
+    import gzip
+    import hashlib
+    zstd = optional_module("compression.zstd")
+    codec = "zst" if zstd is not None else "gz"
+    chunks = []
+    while length > 0:
+        data = file.read(min(SNAPSHOT_CHUNK_BYTES, length))
+        if not data:
+            break
+        length -= len(data)
+        digest = hashlib.sha256(data).hexdigest()
+        existing = next((name for name in ("zst", "gz") if snapshot_chunk_path(digest, name).exists()), None)
+        if existing is None:
+            compressed = zstd.compress(data) if codec == "zst" else gzip.compress(data, compresslevel=6, mtime=0)
+            chunk_path = snapshot_chunk_path(digest, codec)
+            ensure_directory_exists(chunk_path)
+            tmp_path = chunk_path.with_name(chunk_path.name + ".tmp")
+            tmp_path.write_bytes(compressed)
+            os.replace(tmp_path, chunk_path)
+            totals["new_chunks"] += 1
+            totals["bytes_written"] += len(compressed)
+            existing = codec
+        chunks.append([digest, existing])
+    return chunks
+
+def list_snapshots():
+    """Ids dos snapshots existentes, do mais antigo ao mais recente."""
+    return sorted(path.stem for path in SNAPSHOT_DIR.glob("*.json"))
+
+def load_snapshot(snapshot_id):
+    """Carrega o manifesto de um snapshot."""
+    import json
+    manifest_path = SNAPSHOT_DIR / f"{snapshot_id}.json"
+    if not manifest_path.exists():
+        raise KeyError(f"Snapshot desconhecido: {snapshot_id}")
+    with manifest_path.open('r', encoding='utf-8') as file:
+        return json.load(file)
+
+def snapshot_chunk_matches(file, chunks, size, totals):
+    """Confere se o último dos blocos reaproveitados ainda tem o conteúdo do arquivo aberto.
+
+    Inode, tamanho e mtime não bastam: o sistema de arquivos reutiliza o inode de um
+    arquivo apagado (ex.: o diário recriado após a compactação) para o próximo criado.
+    """
+    import hashlib
+    if not chunks:
+        return True
+    offset = (len(chunks) - 1) * SNAPSHOT_CHUNK_BYTES
+    file.seek(offset)
+    data = file.read(min(SNAPSHOT_CHUNK_BYTES, size - offset))
+    totals["bytes_read"] += len(data)
+    return hashlib.sha256(data).hexdigest() == chunks[-1][0]
+
+def snapshot_file(name, file, info, previous, totals):
+    """Entrada do manifesto para um arquivo, relendo só o que mudou desde o snapshot anterior."""
+    entry = {"size": info.st_size, "mtime_ns": info.st_mtime_ns, "inode": info.st_ino}
+    old = previous.get(name)
+    if old is not None and (old["size"], old["mtime_ns"], old["inode"]) == (entry["size"], entry["mtime_ns"], entry["inode"]) \
+            and snapshot_chunk_matches(file, old["chunks"], old["size"], totals):
+        totals["reused_files"] += 1
+        return old
+    reused = []
+    if old is not None and name in SNAPSHOT_APPEND_ONLY and old["inode"] == info.st_ino and old["size"] <= info.st_size:
+        # Margem de 64 bytes: um registro incompleto no fim pode ter sido truncado e regravado
+        reused = old["chunks"][:max(0, old["size"] - 64) // SNAPSHOT_CHUNK_BYTES]
+        if not snapshot_chunk_matches(file, reused, old["size"], totals):
+            reused = []  # Outro arquivo que recebeu o mesmo inode: lê tudo de novo
+    file.seek(len(reused) * SNAPSHOT_CHUNK_BYTES)
+    totals["bytes_read"] += info.st_size - file.tell()
+    entry["chunks"] = reused + store_snapshot_chunks(file, info.st_size - file.tell(), totals)
+    return entry
+
+def create_snapshot():
+    """Tira um snapshot comprimido e incremental dos dados sem bloquear as sessões.
+
+    O banco de usuários é copiado pela API de backup online do SQLite. Os arquivos
+    JSON, seus diários e o histórico de tentativas são abertos com as travas
+    mantidas (um instante consistente entre eles) e lidos depois de liberá-las:
+    gravações posteriores criam arquivos novos ou acrescentam depois do tamanho lido.
+    """
+    import json
+    import sqlite3
+    started = time.perf_counter()
+    snapshots = list_snapshots()
+    previous = load_snapshot(snapshots[-1])["files"] if snapshots else {}
+    totals = {"files": 0, "reused_files": 0, "new_chunks": 0, "bytes_read": 0, "bytes_written": 0}
+    files = {}
+
+    if USERS_DB_FILE.exists():
+        wal_path = USERS_DB_FILE.with_name(USERS_DB_FILE.name + "-wal")
+        signature = [USERS_DB_FILE.stat().st_mtime_ns, wal_path.stat().st_mtime_ns if wal_path.exists() else None]
+        old = previous.get(USERS_DB_FILE.name)
+        if old is not None and old.get("signature") == signature:
+            totals["reused_files"] += 1
+            files[USERS_DB_FILE.name] = old
+        else:
+            backup_path = SNAPSHOT_DIR / "users.db.tmp"
+            ensure_directory_exists(backup_path)
+            backup = sqlite3.connect(backup_path)
+            open_user_store().backup(backup)
+            backup.close()
+            with backup_path.open('rb') as file:
+                info = os.fstat(file.fileno())
+                totals["bytes_read"] += info.st_size
+                files[USERS_DB_FILE.name] = {"size": info.st_size, "signature": signature,
+                                             "chunks": store_snapshot_chunks(file, info.st_size, totals)}
+            backup_path.unlink()
+
+    handles = {}
+    with ExitStack() as locks:
+        for path in SNAPSHOT_JSON_FILES + (ATTEMPTS_LOG_FILE,):
+            locks.enter_context(file_lock(path))
+        for name in SNAPSHOT_NAMES[1:]:
+            path = BASE_DIR / name
+            if path.exists():
+                file = path.open('rb')
+                handles[name] = (file, os.fstat(file.fileno()))
+    for name, (file, info) in handles.items():
+        with file:
+            files[name] = snapshot_file(name, file, info, previous, totals)
+    totals["files"] = len(files)
+
+    snapshot_id = time.strftime("%Y%m%d-%H%M%S") + f"-{time.time_ns() // 1000000 % 1000:03d}"
+    manifest = {"id": snapshot_id, "created": time.time(), "files": files}
+    manifest_path = SNAPSHOT_DIR / f"{snapshot_id}.json"
+    ensure_directory_exists(manifest_path)
+    tmp_path = manifest_path.with_name(manifest_path.name + ".tmp")
+    with tmp_path.open('w', encoding='utf-8') as file:
+        json.dump(manifest, file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, manifest_path)
+    totals["seconds"] = time.perf_counter() - started
+    return snapshot_id, totals
+
+def restore_snapshot(snapshot_id):
+    """Restaura o diretório de dados para um snapshot (com as sessões encerradas).
+
+    Antes, tira um snapshot do estado atual, para que a restauração possa ser desfeita.
+    Retorna o id desse snapshot de segurança.
+    """
+    import gzip
+    zstd = optional_module("compression.zstd")
+    manifest = load_snapshot(snapshot_id)
+    safety_id, _ = create_snapshot()
+    conn = getattr(_user_store, "conn", None)
+    if conn is not None:
+        conn.close()
+        _user_store.conn = None
+    with ExitStack() as locks:
+        for path in SNAPSHOT_JSON_FILES + (ATTEMPTS_LOG_FILE,):
+            locks.enter_context(file_lock(path))
+        for name in SNAPSHOT_NAMES:
+            target = BASE_DIR / name
+            entry = manifest["files"].get(name)
+            if name == USERS_DB_FILE.name:
+                for suffix in ("-wal", "-shm"):
+                    target.with_name(name + suffix).unlink(missing_ok=True)
+            if entry is None:
+                target.unlink(missing_ok=True)  # O arquivo não existia no snapshot
+                continue
+            tmp_path = target.with_name(name + ".restore")
+            with tmp_path.open('wb') as file:
+                for digest, codec in entry["chunks"]:
+                    data = snapshot_chunk_path(digest, codec).read_bytes()
+                    if codec == "zst":
+                        if zstd is None:
+                            raise RuntimeError("Este snapshot usa zstd, disponível só no Python 3.14+.")
+                        file.write(zstd.decompress(data))
+                    else:
+                        file.write(gzip.decompress(data))
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(tmp_path, target)
+        for path in SNAPSHOT_JSON_FILES:
+            drop_cached_json(path)
+    with _attempt_ids_guard:
+        reset_attempt_ids()
+    for stale_path in COURSE_CACHE_DIR.glob("analytics.*.npz"):
+        stale_path.unlink()
+    return safety_id
+
+# Versão do esquema dos dados (schema.json): cada migração leva de uma versão à seguinte,
+# lendo os arquivos em fluxo e gravando um checkpoint a cada lote de MIGRATION_BATCH_SIZE itens
+MIGRATION_BATCH_SIZE = 10000
+
+def merge_user_stats(target, source):
+    """Soma as estatísticas por quiz de `source` às de `target` (um novo dicionário)."""
+    merged = {quiz: dict(data) for quiz, data in target.items()}
+    for quiz, data in source.items():
+        if quiz not in merged:
+            merged[quiz] = dict(data)
+            continue
+        quiz_stats = merged[quiz]
+        for field in ("total_time", "attempts", "correct_answers"):
+            quiz_stats[field] = quiz_stats.get(field, 0) + data.get(field, 0)
+        if "total_questions" in quiz_stats or "total_questions" in data:
+            quiz_stats["total_questions"] = quiz_stats.get("total_questions", 0) + data.get("total_questions", 0)
+        quiz_stats["average_time"] = quiz_stats["total_time"] / quiz_stats["attempts"] if quiz_stats["attempts"] else 0
+    return merged
+
+def migrate_legacy_users(checkpoint, save_checkpoint, progress):
+    """Importa em fluxo o users.json antigo para o users.db, com nomes canônicos.
+
+    Versões anteriores importavam o users.json ao criar o users.db. Isso é decidido
+    uma única vez, no início da migração (antes de ela criar o users.db), e fica no
+    checkpoint: uma migração interrompida no primeiro lote continua importando.
+    """
+    if "already_imported" not in checkpoint:
+        save_checkpoint(already_imported=not checkpoint and USERS_DB_FILE.exists())
+    if not USER_DATA_FILE.exists() or checkpoint["already_imported"]:
+        return "nada a importar"  # Sem users.json, ou o users.db já o importou ao ser criado
+    total = USER_DATA_FILE.stat().st_size
+    imported = checkpoint.get("imported", 0)
+    batch = []
+    resume = checkpoint.get("resume")
+    for _, user, resume in iter_json_container(USER_DATA_FILE, key="users", resume=resume, kinds="["):
+        batch.append(user)
+        if len(batch) >= MIGRATION_BATCH_SIZE:
+            imported += len(add_users(batch))  # INSERT OR IGNORE: repetir um lote após uma falha não duplica
+            batch.clear()
+            save_checkpoint(resume=resume, imported=imported)
+            progress(resume[0], total)
+    imported += len(add_users(batch))
+    progress(total, total)
+    drop_cached_json(USER_DATA_FILE)
+    return f"{imported} usuário(s) importado(s)"
+
+def migrate_canonical_usernames(checkpoint, save_checkpoint, progress):
+    """Renomeia usuários para o nome canônico e mescla as chaves fora do padrão no statistics.json.
+
+    Os usuários são percorridos em lotes pelo rowid; se o nome canônico já estiver em
+    uso, o usuário fica como está e é contado em "conflitos". As estatísticas são lidas
+    em fluxo, sem trava, só para achar as chaves a corrigir; com a trava, essas chaves (e
+    as que vão recebê-las) são relidas por chave e a correção vai para o diário, então
+    as sessões abertas continuam gravando durante a varredura.
+    """
+    import sqlite3
+    conn = open_user_store()
+    last_rowid = checkpoint.get("rowid", 0)
+    renamed = checkpoint.get("renamed", 0)
+    conflicts = checkpoint.get("conflicts", 0)
+    total = conn.execute("SELECT max(rowid) FROM users").fetchone()[0] or 0
+    while True:
+        rows = conn.execute("SELECT rowid, username FROM users WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                            (last_rowid, MIGRATION_BATCH_SIZE)).fetchall()
+        if not rows:
+            break
+        with conn:
+            for rowid, username in rows:
+                if canonical_username(username) == username:
+                    continue
+                try:
+                    conn.execute("UPDATE users SET username = ? WHERE rowid = ?", (canonical_username(username), rowid))
+                    renamed += 1
+                except sqlite3.IntegrityError:
+                    conflicts += 1
+        last_rowid = rows[-1][0]
+        save_checkpoint(rowid=last_rowid, renamed=renamed, conflicts=conflicts)
+        progress(last_rowid, total)
+
+    stray = {key for key, _ in iter_json_items(STATS_FILE, {}) if canonical_username(key) != key}
+    if stray:
+        with file_lock(STATS_FILE):
+            current = load_json_items(STATS_FILE, stray | {canonical_username(key) for key in stray}, {})
+            stray = {key for key in stray if key in current}
+            merged = {}
+            for key, quizzes in current.items():
+                target = canonical_username(key)
+                merged[target] = merge_user_stats(merged.get(target, {}), quizzes)
+            append_json_changes(STATS_FILE, [{"op": "delete", "path": [key]} for key in stray] +
+                                [{"op": "set", "path": [key], "value": value} for key, value in merged.items()])
+    return f"{renamed} usuário(s) renomeado(s), {conflicts} conflito(s), {len(stray)} chave(s) de estatísticas mesclada(s)"
+
+def migrate_legacy_locations(checkpoint, save_checkpoint, progress):
+    """Refaz o índice de localidades do users.db (chaves canônicas) e remove o locations.json antigo."""
+    changed, total = rebuild_location_index(progress)
+    if not LOCATIONS_FILE.exists() and not journal_path(LOCATIONS_FILE).exists():
+        return f"{total} localidade(s) no índice, {changed} chave(s) corrigida(s)"
+    with file_lock(LOCATIONS_FILE):
+        LOCATIONS_FILE.unlink(missing_ok=True)
+        journal_path(LOCATIONS_FILE).unlink(missing_ok=True)
+        drop_cached_json(LOCATIONS_FILE)
+    return f"{total} localidade(s) no índice, locations.json removido"
+
+def migrate_legacy_totals(checkpoint, save_checkpoint, progress):
+    """Completa o total de questões das estatísticas antigas: tentativas × questões do curso.
+
+    Versões antigas não gravavam total_questions, e essas tentativas ficavam sem taxa
+    de acerto (e no fim dos rankings). As estatísticas são lidas em fluxo; a cada lote,
+    com a trava, os usuários do lote são relidos por chave e a correção vai para o
+    diário. Quizzes que não estão mais no catálogo ficam como estão. Se os agregados
+    já existem, os acertos dessas tentativas passam a contar na taxa deles também.
+    """
+    question_counts = {}
+
+    def question_count(quiz):
+        if quiz not in question_counts:
+            try:
+                question_counts[quiz] = len(load_course(quiz)["questions"])
+            except KeyError:
+                question_counts[quiz] = 0  # Curso removido do catálogo
+        return question_counts[quiz]
+
+    def add_accuracy(aggregate, added, with_quantiles=True):
+        aggregate = dict(aggregate or new_aggregate(with_quantiles))
+        aggregate["correct_answers"] += added[0]
+        aggregate["total_questions"] += added[1]
+        return aggregate
+
+    def backfill(usernames):
+        with file_lock(STATS_FILE):
+            changes = []
+            by_scope = {"platform": [0, 0], "quizzes": {}, "users": {}}
+            for username, quizzes in load_json_items(STATS_FILE, usernames, {}).items():
+                for quiz, data in quizzes.items():
+                    if "total_questions" in data or not question_count(quiz):
+                        continue
+                    questions = data["attempts"] * question_count(quiz)
+                    changes.append({"op": "set", "path": [username, quiz, "total_questions"], "value": questions})
+                    for added in (by_scope["platform"], by_scope["quizzes"].setdefault(quiz, [0, 0]),
+                                  by_scope["users"].setdefault(username, [0, 0])):
+                        added[0] += data["correct_answers"]
+                        added[1] += questions
+            if not changes:
+                return 0
+            append_json_changes(STATS_FILE, changes)
+            if AGGREGATES_FILE.exists():  # Senão, serão criados já com os totais corrigidos
+                update_json(AGGREGATES_FILE, {}, lambda aggregates: [
+                    {"op": "set", "path": ["platform"],
+                     "value": add_accuracy(aggregates.get("platform"), by_scope["platform"])},
+                    *({"op": "set", "path": ["quizzes", quiz],
+                       "value": add_accuracy(aggregates.get("quizzes", {}).get(quiz), added)}
+                      for quiz, added in by_scope["quizzes"].items())
+                ], keys=["platform", "quizzes"])
+                update_json(USER_AGGREGATES_FILE, {}, lambda user_aggregates: [
+                    {"op": "set", "path": [username],
+                     "value": add_accuracy(user_aggregates.get(username), added, with_quantiles=False)}
+                    for username, added in by_scope["users"].items()
+                ], keys=set(by_scope["users"]))
+            return len(changes)
+
+    fixed = checkpoint.get("fixed", 0)
+    scanned = 0
+    batch = set()
+    for username, quizzes in iter_json_items(STATS_FILE, {}):
+        scanned += 1
+        if any("total_questions" not in data for data in quizzes.values()):
+            batch.add(username)
+        if len(batch) >= MIGRATION_BATCH_SIZE:
+            fixed += backfill(batch)  # Repetir um lote não soma de novo: só o que ainda falta é corrigido
+            batch = set()
+            save_checkpoint(fixed=fixed)
+    fixed += backfill(batch)
+    progress(scanned, scanned)
+    return f"{fixed} total(is) de questões completado(s)"
+
+# (versão, descrição, função): a função recebe o checkpoint salvo, uma função para
+# salvá-lo e outra para informar o progresso (feito, total); retorna um resumo
+SCHEMA_MIGRATIONS = (
+    (1, "usuários do users.json para o users.db", migrate_legacy_users),
+    (2, "nomes de usuário canônicos", migrate_canonical_usernames),
+    (3, "locations.json para o índice de localidades", migrate_legacy_locations),
+    (4, "total de questões das estatísticas antigas", migrate_legacy_totals),
+)
+DATA_SCHEMA_VERSION = SCHEMA_MIGRATIONS[-1][0]
+
+def schema_version():
+    """Versão do esquema em que os dados estão."""
+    return load_json(SCHEMA_FILE, {"version": 0})["version"]
+
+def migration_progress(description):
+    """Mostra o progresso de uma migração em uma linha do terminal (no máximo a cada 0,2 s)."""
+    last_update = [0.0]
+
+    def report(done, total):
+        now = time.monotonic()
+        if done < total and now - last_update[0] < 0.2:
+            return
+        last_update[0] = now
+        print(f"\r  {description}: {done / total:.0%}" if total else f"\r  {description}: {done}",
+              end="\n" if done >= total else "", flush=True)
+    return report
+
+def migrate_schema(progress=migration_progress):
+    """Aplica em ordem as migrações pendentes, retomando a que tiver sido interrompida.
+
+    O schema.json guarda {"version": última aplicada} e, durante uma migração,
+    "migrating" e "checkpoint" (onde ela parou). Retorna [(versão, descrição, resumo)].
+    """
+    applied = []
+    with file_lock(SCHEMA_FILE):
+        state = load_json(SCHEMA_FILE, {"version": 0})
+        for version, description, migrate in SCHEMA_MIGRATIONS:
+            if version <= state["version"]:
+                continue
+            checkpoint = dict(state.get("checkpoint", {})) if state.get("migrating") == version else {}
+
+            def save_checkpoint(**values):
+                checkpoint.update(values)
+                save_json(SCHEMA_FILE, {"version": version - 1, "migrating": version, "checkpoint": checkpoint})
+
+            summary = migrate(checkpoint, save_checkpoint, progress(description))
+            state = {"version": version}
+            save_json(SCHEMA_FILE, state)
+            applied.append((version, description, summary))
+    return applied
+
+def read_batch_file(path):
+    """Lê os registros de um arquivo CSV (com cabeçalho) ou JSONL (um objeto por linha)."""
+    import json
+    import csv
+    if path.suffix.lower() == ".csv":
+        with path.open(newline='', encoding='utf-8') as file:
+            return list(csv.DictReader(file))
+    with path.open(encoding='utf-8') as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+def register_users_batch(records):
+    """Registra vários usuários sem interação: hashing em paralelo e uma gravação por arquivo.
+
+    Campos: username, password, age, location e, opcionalmente, role="admin" com
+    admin_secret. Retorna (usuários registrados, lista de (linha, erro)).
+    """
+    accepted = []
+    errors = []
+    seen = set()
+    for line, record in enumerate(records, start=1):
+        username = str(record.get("username") or "").strip()
+        password = str(record.get("password") or "")
+        location = str(record.get("location") or "").strip()
+        try:
+            age = int(record.get("age"))
+        except (TypeError, ValueError):
+            age = 0
+        if not username:
+            errors.append((line, "nome de usuário vazio"))
+        elif username in seen or get_user(username) is not None:
+            errors.append((line, f"nome de usuário '{username}' já existe"))
+        elif not is_valid_password(password):
+            errors.append((line, "senha não atende aos requisitos de segurança"))
+        elif age <= 0:
+            errors.append((line, "idade inválida"))
+        elif not location:
+            errors.append((line, "localidade vazia"))
+        else:
+            seen.add(username)
+            is_admin = str(record.get("role") or "").strip().lower() in ("admin", "sim")
+            accepted.append({
+                "username": username,
+                "password": password,
+                "age": age,
+                "location": location,
+                "role": "admin" if is_admin and record.get("admin_secret") == ADMIN_SECRET else "user"
+            })
+
+    hashes = password_pool().map(bcrypt_hash, [user["password"] for user in accepted])
+    for user, hashed_password in zip(accepted, hashes):
+        user["password"] = hashed_password
+    registered = add_users(accepted)
+    return registered, errors
+
+@functools.cache
+def answer_letters():
+    """Expressão que separa as letras de uma folha de respostas em texto ("B,C,A")."""
+    import re
+    return re.compile(r"[A-Za-z]")
+
+def run_quiz_batch(records):
+    """Corrige folhas de respostas sem interação e registra todas com uma gravação por arquivo.
+
+    Campos: username, quiz (id do curso), answers (lista ou texto como "B,C,A") e
+    elapsed_time opcional. Retorna (resultados registrados, lista de (linha, erro)).
+    """
+    results = []
+    attempts = []
+    errors = []
+    now = time.time()
+    for line, record in enumerate(records, start=1):
+        username = str(record.get("username") or "").strip()
+        quiz_name = str(record.get("quiz") or "").strip()
+        answers = record.get("answers") or []
+        if isinstance(answers, str):
+            answers = answer_letters().findall(answers)
+        answers = [str(answer).strip().upper() for answer in answers]
+        if get_user(username) is None:
+            errors.append((line, f"usuário '{username}' não encontrado"))
+            continue
+        try:
+            questions = load_course(quiz_name)["questions"]
+        except KeyError:
+            errors.append((line, f"curso '{quiz_name}' não encontrado"))
+            continue
+        if len(answers) != len(questions) or any(answer not in ("A", "B", "C", "D") for answer in answers):
+            errors.append((line, f"esperadas {len(questions)} respostas entre A, B, C ou D"))
+            continue
+        try:
+            elapsed_time = float(record.get("elapsed_time") or 0)
+        except (TypeError, ValueError):  # Ex.: lista, objeto ou texto não numérico
+            elapsed_time = -1
+        if not 0 <= elapsed_time < float("inf"):  # Também recusa NaN
+            errors.append((line, "tempo inválido"))
+            continue
+        correct_answers = sum(answer == question["correct"] for answer, question in zip(answers, questions))
+        results.append((username, quiz_name, elapsed_time, correct_answers, len(questions)))
+        # Sem o tempo de cada questão, o tempo total é dividido igualmente
+        attempts.append((username, quiz_name, now, [
+            (number, answer, answer == question["correct"], elapsed_time / len(questions))
+            for number, (answer, question) in enumerate(zip(answers, questions))
+        ]))
+    record_quiz_results(results)
+    log_quiz_attempts(attempts)
+    record_question_outcomes(attempts)
+    return results, errors
+
+def run_batch_command(command, path):
+    """Executa um comando em lote e imprime o resumo de vazão."""
+    started = time.perf_counter()
+    records = read_batch_file(path)
+    if command == "batch-register":
+        processed, errors = register_users_batch(records)
+    else:
+        processed, errors = run_quiz_batch(records)
+    elapsed = time.perf_counter() - started
+    for line, error in errors:
+        print(f"❌ Registro {line}: {error}")
+    print(f"Registros lidos: {len(records)} | processados: {len(processed)} | rejeitados: {len(errors)}")
+    print(f"Tempo total: {elapsed:.2f} s | Vazão: {len(records) / elapsed if elapsed else 0:.1f} registros/s")
+
+# Exportação/importação em blocos JSONL: um diretório com manifest.json e arquivos
+# <tipo>-<n>.jsonl[.gz|.zst] de até EXPORT_CHUNK_RECORDS registros cada
+EXPORT_KINDS = ("users", "statistics", "locations")
+EXPORT_CHUNK_RECORDS = 50000
+
+def open_export_chunk(path, mode):
+    """Abre um bloco exportado em modo texto, comprimido conforme a extensão (.gz ou .zst)."""
+    import gzip
+    if path.suffix == ".gz":
+        return gzip.open(path, mode, encoding='utf-8')
+    if path.suffix == ".zst":
+        zstd = optional_module("compression.zstd")
+        if zstd is None:
+            raise RuntimeError("Blocos .zst requerem o Python 3.14+.")
+        return zstd.open(path, mode, encoding='utf-8')
+    return path.open(mode[0], encoding='utf-8')
+
+def iter_export_records(kind, include_passwords=True):
+    """Percorre os registros de um tipo em fluxo, no formato de uma linha do JSONL."""
+    if kind == "users":
+        for user in iter_users(batch_size=MIGRATION_BATCH_SIZE):
+            if not include_passwords:
+                del user["password"]
+            yield user
+    elif kind == "statistics":
+        for username, quizzes in iter_json_items(STATS_FILE, {}):
+            yield {"username": username, "quizzes": quizzes}
+    else:
+        for key, name, users in iter_locations():
+            yield {"key": key, "name": name, "users": users}
+
+def export_data(output_dir, compression=None, chunk_records=EXPORT_CHUNK_RECORDS, include_passwords=True):
+    """Exporta usuários, estatísticas e localidades para um diretório de blocos JSONL.
+
+    Os registros são lidos e gravados em fluxo, então a memória não cresce com a base.
+    O manifest.json (gravado por último) lista os blocos de cada tipo e a versão do esquema.
+    """
+    import json
+    suffix = {None: "", "gz": ".gz", "zst": ".zst"}[compression]
+    output_dir.mkdir(parents=True, exist_ok=True)
+    manifest = {"schema_version": DATA_SCHEMA_VERSION, "created": time.time(), "files": {}, "records": {}}
+    for kind in EXPORT_KINDS:
+        files = []
+        count = 0
+        file = None
+        try:
+            for record in iter_export_records(kind, include_passwords):
+                if count % chunk_records == 0:
+                    if file is not None:
+                        file.close()
+                    files.append(f"{kind}-{len(files):05d}.jsonl{suffix}")
+                    file = open_export_chunk(output_dir / files[-1], "wt")
+                file.write(json.dumps(record, ensure_ascii=False) + "\n")
+                count += 1
+        finally:
+            if file is not None:
+                file.close()
+        manifest["files"][kind] = files
+        manifest["records"][kind] = count
+    write_json_atomic(output_dir / "manifest.json", manifest)
+    return manifest
+
+def validate_export_record(kind, record):
+    """Normaliza um registro importado; retorna (registro, None) ou (None, erro)."""
+    if not isinstance(record, dict) or not isinstance(record.get("username"), str):
+        return None, "registro sem nome de usuário"
+    username = canonical_username(record["username"])
+    if not username:
+        return None, "nome de usuário vazio"
+    if kind == "statistics":
+        quizzes = record.get("quizzes")
+        if not isinstance(quizzes, dict) or not all(
+                isinstance(data, dict) and isinstance(data.get("attempts"), int) for data in quizzes.values()):
+            return None, "estatísticas inválidas"
+        return {"username": username, "quizzes": quizzes}, None
+    if not isinstance(record.get("password"), str) or not record["password"]:
+        return None, "sem hash de senha (exportado com --no-passwords?)"
+    if not isinstance(record.get("age"), int) or record["age"] <= 0:
+        return None, "idade inválida"
+    if not isinstance(record.get("location"), str):
+        return None, "localidade inválida"
+    # A chave canônica da localidade também é calculada aqui, fora do processo que grava
+    return {"username": username, "password": record["password"], "age": record["age"],
+            "location": record["location"], "location_key": canonical_location(record["location"]),
+            "role": "admin" if record.get("role") == "admin" else "user"}, None
+
+def parse_export_chunk(path):
+    """Descomprime, lê e valida um bloco (roda nos processos do pool). Retorna (registros, erros)."""
+    import json
+    path = Path(path)
+    kind = path.name.split("-")[0]
+    records = []
+    errors = []
+    with open_export_chunk(path, "rt") as file:
+        for line_number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            try:
+                record, error = validate_export_record(kind, json.loads(line))
+            except json.JSONDecodeError:
+                record, error = None, "JSON inválido"
+            if error is None:
+                records.append(record)
+            else:
+                errors.append((f"{path.name}:{line_number}", error))
+    return records, errors
+
+def iter_parsed_chunks(paths, workers):
+    """Lê os blocos em paralelo em um pool de processos e os produz na ordem original.
+
+    No máximo 2 * workers blocos ficam lidos e ainda não consumidos, o que limita a memória.
+    """
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for path in paths:
+            pending.append((path, pool.submit(parse_export_chunk, str(path))))
+            if len(pending) >= 2 * workers:
+                path, future = pending.popleft()
+                yield path, *future.result()
+        while pending:
+            path, future = pending.popleft()
+            yield path, *future.result()
+
+def import_data(input_dir, workers=None):
+    """Importa um diretório gerado por export_data, gravando um lote por bloco.
+
+    Usuários já existentes são mantidos; as estatísticas importadas substituem as do
+    usuário (importar de novo não duplica tentativas). As localidades não são
+    importadas: o índice é refeito pelo banco a partir dos usuários. Retorna
+    ({tipo: {"records", "imported"}}, [(bloco:linha, erro)]).
+    """
+    import json
+    with (input_dir / "manifest.json").open(encoding='utf-8') as file:
+        manifest = json.load(file)
+    if manifest.get("schema_version", 0) > DATA_SCHEMA_VERSION:
+        raise ValueError("Exportação feita por uma versão mais nova da plataforma.")
+    totals = {kind: {"records": 0, "imported": 0} for kind in ("users", "statistics")}
+    errors = []
+    paths = [input_dir / name for kind in totals for name in manifest["files"].get(kind, [])]
+    for path, records, chunk_errors in iter_parsed_chunks(paths, workers or os.cpu_count() or 4):
+        kind = path.name.split("-")[0]
+        errors.extend(chunk_errors)
+        totals[kind]["records"] += len(records) + len(chunk_errors)
+        if kind == "users":
+            totals[kind]["imported"] += len(add_users(records))
+        elif records:
+            append_json_changes(STATS_FILE, [{"op": "set", "path": [record["username"]], "value": record["quizzes"]}
+                                             for record in records])
+            totals[kind]["imported"] += len(records)
+    if totals["statistics"]["imported"]:
+        # Os agregados são derivados das estatísticas: serão refeitos no próximo uso
+        with file_lock(AGGREGATES_FILE):
+            AGGREGATES_FILE.unlink(missing_ok=True)
+            journal_path(AGGREGATES_FILE).unlink(missing_ok=True)
+            drop_cached_json(AGGREGATES_FILE)
+    return totals, errors
+
+# Executor de uma única thread para JSON e SQLite no modo servidor (bcrypt usa o pool próprio)
+_data_executor = None
+server_stats = {"connections": 0, "active": 0, "requests": 0}
+
+def data_executor():
+    """Retorna o executor que serializa o acesso aos arquivos de dados no modo servidor."""
+    from concurrent.futures import ThreadPoolExecutor
+    global _data_executor
+    if _data_executor is None:
+        _data_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="data")
+    return _data_executor
+
+async def run_data(function, *args):
+    """Executa uma operação de arquivo/banco fora do loop de eventos."""
+    import asyncio
+    return await asyncio.get_running_loop().run_in_executor(data_executor(), function, *args)
+
+def question_payload(quiz):
+    """Monta a próxima questão de um quiz em andamento para enviar ao cliente."""
+    question = quiz["questions"][quiz["index"]]
+    return {
+        "number": quiz["index"] + 1,
+        "total": len(quiz["questions"]),
+        "question": question["question"],
+        "options": question["options"]
+    }
+
+async def handle_request(session, request):
+    """Executa um comando do protocolo (um objeto JSON por linha) para a sessão da conexão."""
+    import asyncio
+    command = request.get("cmd")
+    if command == "register":
+        username = str(request.get("username") or "").strip()
+        password = str(request.get("password") or "")
+        location = str(request.get("location") or "").strip()
+        try:
+            age = int(request.get("age"))
+        except (TypeError, ValueError):
+            age = 0
+        if not username or not location or age <= 0:
+            return {"ok": False, "error": "Informe username, age (inteiro positivo) e location."}
+        if not is_valid_password(password):
+            return {"ok": False, "error": "A senha não atende aos requisitos de segurança."}
+        role = "admin" if request.get("admin_secret") == ADMIN_SECRET else "user"
+        hashed_password = await asyncio.wrap_future(hash_password_async(password))
+        if not await run_data(create_user, username, hashed_password, age, location, role):
+            return {"ok": False, "error": "Nome de usuário já existe."}
+        return {"ok": True, "message": f"Usuário {username} registrado com sucesso!"}
+    if command == "login":
+        username = str(request.get("username") or "")
+        password = str(request.get("password") or "")
+        refusal = await run_data(check_login_allowed, username, peer_token_bucket(session["peer"]))
+        if refusal:
+            return {"ok": False, "error": refusal}
+        user = await run_data(get_user, username)
+        if user is None or not await asyncio.wrap_future(verify_password_async(password, user["password"])):
+            if user is not None:
+                await run_data(record_login_failure, username)
+            return {"ok": False, "error": "Nome de usuário ou senha incorretos."}
+        await run_data(clear_login_failures, username)
+        if password_needs_rehash(user["password"]):
+            password_pool().submit(rehash_user_password, username, password)
+        session["user"] = user
+        return {"ok": True, "message": f"Bem-vindo(a), {username}!", "role": user["role"]}
+    if command == "quit":
+        return {"ok": True, "message": "Até logo!"}
+    if session["user"] is None:
+        return {"ok": False, "error": "Faça login primeiro."}
+    if command == "courses":
+        catalog = await run_data(load_course_catalog)
+        return {"ok": True, "courses": [{"id": course["id"], "title": course["title"]} for course in catalog]}
+    if command == "start":
+        try:
+            course = await run_data(load_course, str(request.get("course")))
+        except KeyError:
+            return {"ok": False, "error": "Curso não encontrado."}
+        if request.get("adaptive"):
+            numbers = await run_data(lambda: list(adaptive_question_order(
+                course["id"], session["user"]["username"], len(course["questions"]))))
+        else:
+            numbers = list(range(len(course["questions"])))
+        session["quiz"] = {"id": course["id"], "questions": [course["questions"][number] for number in numbers],
+                           "numbers": numbers, "index": 0, "correct": 0, "started": time.time(),
+                           "outcomes": [], "asked": time.time()}
+        return {"ok": True, "question": question_payload(session["quiz"])}
+    if command == "answer":
+        quiz = session["quiz"]
+        if quiz is None:
+            return {"ok": False, "error": "Nenhum quiz em andamento."}
+        answer = str(request.get("answer") or "").strip().upper()
+        if answer not in ("A", "B", "C", "D"):
+            return {"ok": False, "error": "Opção inválida! Escolha entre A, B, C ou D."}
+        expected = quiz["questions"][quiz["index"]]["correct"]
+        if answer == expected:
+            quiz["correct"] += 1
+        quiz["outcomes"].append((quiz["numbers"][quiz["index"]], answer, answer == expected, time.time() - quiz["asked"]))
+        quiz["asked"] = time.time()
+        quiz["index"] += 1
+        response = {"ok": True, "correct": answer == expected, "expected": expected}
+        if quiz["index"] < len(quiz["questions"]):
+            response["question"] = question_payload(quiz)
+            return response
+        elapsed_time = time.time() - quiz["started"]
+        quiz_stats = await run_data(
+            record_quiz_result, session["user"]["username"], quiz["id"], elapsed_time,
+            quiz["correct"], len(quiz["questions"])
+        )
+        attempt = (session["user"]["username"], quiz["id"], quiz["started"], quiz["outcomes"])
+        await run_data(log_quiz_attempts, [attempt])
+        await run_data(record_question_outcomes, [attempt])
+        session["quiz"] = None
+        response["result"] = {"correct_answers": quiz["correct"], "total": len(quiz["questions"]),
+                              "elapsed_time": elapsed_time, "average_time": quiz_stats["average_time"]}
+        return response
+    if command == "stats":
+        username = canonical_username(session["user"]["username"])
+        stats = await run_data(load_json_items, STATS_FILE, [username], {})
+        return {"ok": True, "stats": stats.get(username, {})}
+    return {"ok": False, "error": f"Comando desconhecido: {command}"}
+
+async def handle_connection(reader, writer):
+    """Atende uma conexão: cada linha recebida é um comando JSON e cada resposta é uma linha JSON."""
+    import json
+    peer = writer.get_extra_info("peername")
+    session = {"user": None, "quiz": None, "peer": peer[0] if peer else None}
+    server_stats["connections"] += 1
+    server_stats["active"] += 1
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            server_stats["requests"] += 1
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError
+            except ValueError:
+                request = {}
+                response = {"ok": False, "error": "Envie um objeto JSON por linha."}
+            else:
+                response = await handle_request(session, request)
+            writer.write((json.dumps(response, ensure_ascii=False) + "\n").encode('utf-8'))
+            await writer.drain()
+            if request.get("cmd") == "quit":
+                break
+    except ConnectionError:
+        pass
+    finally:
+        server_stats["active"] -= 1
+        writer.close()
+
+async def serve(host, port):
+    """Inicia o servidor TCP e atende as conexões até ser interrompido."""
+    import asyncio
+    server = await asyncio.start_server(handle_connection, host, port, backlog=4096)
+    print(f"Servidor da União Digital em {host}:{port} (Ctrl+C para encerrar)")
+    async with server:
+        await server.serve_forever()
+
+def cli(argv=None):
+    """Ponto de entrada: sem argumentos abre o menu interativo; com argumentos roda em modo headless."""
+    import argparse
+    parser = argparse.ArgumentParser(description="União Digital - plataforma educacional")
+    parser.add_argument("--profile", choices=PROFILE_MODES, default=os.environ.get("UNIAO_PROFILE") or None,
+                        help="liga a instrumentação (também via UNIAO_PROFILE)")
+    subcommands = parser.add_subparsers(dest="command")
+    batch_register = subcommands.add_parser("batch-register", help="cadastra usuários de um arquivo CSV/JSONL")
+    batch_register.add_argument("file", type=Path)
+    batch_quiz = subcommands.add_parser("batch-quiz", help="registra folhas de respostas de um arquivo CSV/JSONL")
+    batch_quiz.add_argument("file", type=Path)
+    subcommands.add_parser("profile-report", help="mostra os tempos acumulados da instrumentação")
+    subcommands.add_parser("rebuild-locations", help="refaz o índice de localidades a partir dos usuários")
+    subcommands.add_parser("migrate", help="atualiza os dados para a versão atual do esquema")
+    export = subcommands.add_parser("export", help="exporta usuários, estatísticas e localidades em blocos JSONL")
+    export.add_argument("output", type=Path, help="diretório de saída")
+    export.add_argument("--compress", choices=("gz", "zst"), help="comprime cada bloco (zst requer Python 3.14+)")
+    export.add_argument("--chunk-records", type=int, default=EXPORT_CHUNK_RECORDS, help="registros por bloco")
+    export.add_argument("--no-passwords", action="store_true", help="omite os hashes de senha (para análises)")
+    import_command = subcommands.add_parser("import", help="importa um diretório gerado pelo export")
+    import_command.add_argument("input", type=Path, help="diretório com o manifest.json")
+    import_command.add_argument("--workers", type=int, default=os.cpu_count(), help="processos de leitura")
+    snapshot = subcommands.add_parser("snapshot", help="tira um snapshot incremental e comprimido dos dados")
+    snapshot.add_argument("--list", action="store_true", help="lista os snapshots existentes")
+    restore = subcommands.add_parser("restore", help="restaura os dados de um snapshot (com as sessões encerradas)")
+    restore.add_argument("snapshot_id")
+    analytics = subcommands.add_parser("analytics", help="exporta o relatório analítico em CSV ou JSON")
+    analytics.add_argument("--format", choices=("json", "csv"), default="json")
+    analytics.add_argument("--output", type=Path, help="arquivo de saída (padrão: saída padrão)")
+    analytics.add_argument("--top", type=int, default=ANALYTICS_TOP_K, help="tamanho do ranking")
+    server = subcommands.add_parser("serve", help="atende várias sessões por TCP (uma linha JSON por comando)")
+    server.add_argument("--host", default="127.0.0.1")
+    server.add_argument("--port", type=int, default=5050)
+    args = parser.parse_args(argv)
+    enable_profiling(args.profile)
+    # Os dados são migrados antes de qualquer uso (snapshot e restore trabalham com a versão que estiver lá)
+    if args.command == "migrate" or (args.command not in ("profile-report", "snapshot", "restore")
+                                     and schema_version() < DATA_SCHEMA_VERSION):
+        for version, description, summary in migrate_schema():
+            print(f"✅ Migração {version} ({description}): {summary}")
+    if args.command == "profile-report":
+        show_cumulative_profile()
+    elif args.command == "snapshot":
+        if args.list:
+            for snapshot_id in list_snapshots():
+                manifest = load_snapshot(snapshot_id)
+                size = sum(entry["size"] for entry in manifest["files"].values())
+                print(f"{snapshot_id}  {len(manifest['files'])} arquivo(s), {size / 1024:.1f} KB")
+        else:
+            snapshot_id, totals = create_snapshot()
+            print(f"Snapshot {snapshot_id}: {totals['files']} arquivo(s) ({totals['reused_files']} sem alteração), "
+                  f"{totals['bytes_read'] / 1024:.1f} KB lidos, {totals['new_chunks']} bloco(s) novo(s), "
+                  f"{totals['bytes_written'] / 1024:.1f} KB gravados em {totals['seconds']:.2f} s")
+    elif args.command == "restore":
+        try:
+            safety_id = restore_snapshot(args.snapshot_id)
+        except KeyError as error:
+            sys.exit(f"❌ {error.args[0]}")
+        print(f"Dados restaurados do snapshot {args.snapshot_id} (estado anterior salvo em {safety_id}).")
+    elif args.command == "migrate":
+        print(f"Dados na versão {schema_version()} do esquema.")
+    elif args.command == "export":
+        if args.compress == "zst" and optional_module("compression.zstd") is None:
+            sys.exit("❌ A compressão zst requer o Python 3.14+.")
+        started = time.perf_counter()
+        manifest = export_data(args.output, args.compress, args.chunk_records, not args.no_passwords)
+        elapsed = time.perf_counter() - started
+        total = sum(manifest["records"].values())
+        print(", ".join(f"{count} {kind}" for kind, count in manifest["records"].items()) + f" exportados em {args.output}")
+        print(f"Tempo total: {elapsed:.2f} s | Vazão: {total / elapsed if elapsed else 0:.1f} registros/s")
+    elif args.command == "import":
+        started = time.perf_counter()
+        try:
+            totals, errors = import_data(args.input, args.workers)
+        except (OSError, ValueError) as error:
+            sys.exit(f"❌ {error}")
+        elapsed = time.perf_counter() - started
+        for location, error in errors[:20]:
+            print(f"❌ {location}: {error}")
+        if len(errors) > 20:
+            print(f"... e mais {len(errors) - 20} erro(s)")
+        for kind, counts in totals.items():
+            print(f"{kind}: {counts['records']} lido(s), {counts['imported']} importado(s)")
+        total = sum(counts["records"] for counts in totals.values())
+        print(f"Tempo total: {elapsed:.2f} s | Vazão: {total / elapsed if elapsed else 0:.1f} registros/s")
+    elif args.command == "rebuild-locations":
+        changed, total = rebuild_location_index()
+        print(f"Índice de localidades refeito: {total} localidade(s), {changed} usuário(s) com chave corrigida.")
+    elif args.command == "serve":
+        import asyncio
+        try:
+            asyncio.run(serve(args.host, args.port))
+        except KeyboardInterrupt:
+            print(f"Servidor encerrado. {server_stats} {auth_stats}")
+    elif args.command in ("batch-register", "batch-quiz"):
+        run_batch_command(args.command, args.file)
+    elif args.command == "analytics":
+        if optional_module("numpy") is None:
+            sys.exit("❌ O relatório analítico requer o NumPy (pip install numpy).")
+        report = analytics_report(args.top)
+        if args.output is None:
+            export_analytics(report, sys.stdout, args.format)
+        else:
+            with args.output.open('w', encoding='utf-8', newline='') as output:
+                export_analytics(report, output, args.format)
+    else:
+        main()
 
 if __name__ == "__main__":
-    main()
+    cli()
@@ -0,0 +1,23 @@
+"""Fixtures dos testes: cada teste usa um diretório de dados próprio."""
+import importlib
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+
+@pytest.fixture
+def main(tmp_path, monkeypatch):
+    """O main.py importado de novo, com UNIAO_DATA_DIR em um diretório temporário."""
+    monkeypatch.setenv("UNIAO_DATA_DIR", str(tmp_path / "data"))
+    monkeypatch.setenv("UNIAO_BCRYPT_ROUNDS", "4")
+    sys.modules.pop("main", None)
+    module = importlib.import_module("main")
+    yield module
+    conn = getattr(module._user_store, "conn", None)
+    if conn is not None:
+        conn.close()
+    sys.modules.pop("main", None)
@@ -0,0 +1,30 @@
+"""Testes da ordem adaptativa das questões."""
+import time
+
+
+def answer_wrong(main, number, times):
+    main.record_question_outcomes([("ana", "cyber_quiz", time.time(), [(number, "A", False, 1.0)] * times)])
+
+
+def test_priority_follows_the_journal_across_a_compaction(main, monkeypatch):
+    monkeypatch.setattr(main, "schedule_compaction", lambda file_path: None)  # Compacta só quando o teste pede
+    answer_wrong(main, 0, 1)
+    assert list(main.adaptive_question_order("cyber_quiz", "novo", 3)) == [0, 1, 2]
+    heap = main.question_priority("cyber_quiz", 3)["heap"]
+
+    answer_wrong(main, 2, 3)
+    main.compact_json(main.QUESTION_STATS_FILE)  # As linhas ainda não lidas foram para o arquivo principal
+    answer_wrong(main, 1, 5)
+
+    assert list(main.adaptive_question_order("cyber_quiz", "novo", 3)) == [1, 2, 0]
+    assert main.question_priority("cyber_quiz", 3)["heap"] is heap  # Sem refazer o heap
+
+
+def test_journal_reader_asks_for_reload_when_the_file_is_rewritten(main):
+    answer_wrong(main, 0, 1)
+    follower = main.follow_json_journal(main.QUESTION_STATS_FILE)
+    answer_wrong(main, 1, 1)
+    assert [change["path"] for change in main.read_journal_changes(main.QUESTION_STATS_FILE, follower)] == \
+        [["cyber_quiz", "1"]]
+    main.save_json(main.QUESTION_STATS_FILE, {})
+    assert main.read_journal_changes(main.QUESTION_STATS_FILE, follower) is None
@@ -0,0 +1,31 @@
+"""Testes do relatório analítico (NumPy)."""
+import pytest
+
+pytest.importorskip("numpy")
+
+
+def add_learner(main, username, age, location):
+    main.create_user(username, "hash", age, location, "user")
+
+
+def test_group_users_counts_each_user_once(main):
+    add_learner(main, "ana", 20, "SP")
+    add_learner(main, "bia", 21, "SP")
+    add_learner(main, "caio", 40, "RJ")
+    main.record_quiz_results([
+        ("ana", "cyber_quiz", 10.0, 3, 5),
+        ("ana", "python_quiz", 10.0, 4, 5),
+        ("ana", "redes_quiz", 10.0, 5, 5),
+        ("bia", "cyber_quiz", 10.0, 2, 5),
+        ("caio", "cyber_quiz", 10.0, 1, 5),
+        ("caio", "python_quiz", 10.0, 1, 5),
+    ])
+
+    report = main.analytics_report(top_k=0)
+
+    by_location = {row["group"]: row for row in report["by_location"]}
+    assert [by_location[label]["users"] for label in sorted(by_location)] == [1, 2]
+    assert sum(row["attempts"] for row in by_location.values()) == 6
+    by_quiz = {row["group"]: row["users"] for row in report["by_quiz"]}
+    assert by_quiz == {"cyber_quiz": 3, "python_quiz": 2, "redes_quiz": 1}
+    assert sum(row["users"] for row in report["by_age_band"]) == 3
@@ -0,0 +1,48 @@
+"""Testes do histórico binário de tentativas."""
+import json
+import time
+
+
+def log_attempt(main, username, quiz_name="cyber_quiz"):
+    main.log_quiz_attempts([(username, quiz_name, time.time(), [(0, "A", True, 1.0)])])
+
+
+def test_attempt_ids_parse_only_appended_lines(main, monkeypatch):
+    log_attempt(main, "ana")
+    log_attempt(main, "bia")
+    parsed = []
+    loads = json.loads
+
+    def counting_loads(line, *args, **kwargs):
+        parsed.append(line)
+        return loads(line, *args, **kwargs)
+
+    monkeypatch.setattr(json, "loads", counting_loads)
+    log_attempt(main, "caio", "python_quiz")
+    log_attempt(main, "ana")
+
+    assert len(parsed) == 2  # Só as linhas de caio e python_quiz
+    ids = main.load_attempt_ids()
+    assert ids["user"]["names"] == ["ana", "bia", "caio"]
+    assert ids["quiz"]["names"] == ["cyber_quiz", "python_quiz"]
+
+
+def test_attempt_ids_reloaded_when_file_is_replaced(main):
+    log_attempt(main, "ana")
+    log_attempt(main, "bia")
+    replacement = main.ATTEMPT_IDS_FILE.with_name("attempt_ids.new")
+    replacement.write_text(json.dumps({"kind": "user", "name": "bia"}) + "\n", encoding="utf-8")
+    replacement.replace(main.ATTEMPT_IDS_FILE)
+
+    assert main.load_attempt_ids()["user"]["names"] == ["bia"]
+    assert main.load_attempt_ids()["quiz"]["names"] == []
+
+
+def test_attempt_ids_written_after_an_interrupted_line(main):
+    log_attempt(main, "ana")
+    with main.ATTEMPT_IDS_FILE.open('ab') as file:
+        file.write(b'{"kind": "user", "na')  # Queda no meio de uma gravação
+    log_attempt(main, "bia")
+
+    assert main.load_attempt_ids()["user"]["names"] == ["ana", "bia"]
+    assert main.read_attempt_log()["user"][-1] == 1
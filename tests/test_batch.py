@@ -0,0 +1,17 @@
+"""Testes dos comandos em lote (batch-register e batch-quiz)."""
+import pytest
+
+
+@pytest.mark.parametrize("elapsed_time", [[1, 2], {"s": 3}, "rápido", -5, float("nan")])
+def test_quiz_batch_reports_invalid_elapsed_time(main, elapsed_time):
+    main.create_user("ana", "hash", 20, "SP", "user")
+    answers = ["A"] * len(main.load_course("cyber_quiz")["questions"])
+    records = [
+        {"username": "ana", "quiz": "cyber_quiz", "answers": answers, "elapsed_time": elapsed_time},
+        {"username": "ana", "quiz": "cyber_quiz", "answers": answers, "elapsed_time": None},
+    ]
+
+    results, errors = main.run_quiz_batch(records)
+
+    assert errors == [(1, "tempo inválido")]
+    assert [result[2] for result in results] == [0.0]
@@ -0,0 +1,25 @@
+"""Testes dos rankings por quiz e geral."""
+
+
+def play(main, username, correct_answers):
+    main.record_quiz_results([(username, "cyber_quiz", 10.0, correct_answers, 3)])
+
+
+def test_leaderboards_follow_the_journal_across_a_compaction(main, monkeypatch):
+    monkeypatch.setattr(main, "schedule_compaction", lambda file_path: None)  # Compacta só quando o teste pede
+    play(main, "ana", 1)
+    play(main, "bia", 2)
+    assert main.leaderboard_rank("ana") == (2, 2)
+
+    def no_rebuild(file_path, default_data):
+        raise AssertionError("ranking remontado do zero")
+
+    monkeypatch.setattr(main, "iter_json_items", no_rebuild)
+    play(main, "ana", 3)
+    main.compact_json(main.STATS_FILE)  # As linhas ainda não lidas foram para o arquivo principal
+    play(main, "caio", 3)
+    main.append_json_changes(main.STATS_FILE, [{"op": "delete", "path": ["bia"]}])  # Como outra sessão faria
+
+    top = [(position, username, accuracy) for position, username, accuracy, _ in main.leaderboard_top()]
+    assert top == [(1, "caio", 1.0), (2, "ana", 4 / 6)]
+    assert main.leaderboard_rank("bia", "cyber_quiz") is None
@@ -0,0 +1,92 @@
+"""Testes das migrações de esquema dos dados."""
+import pytest
+
+
+def quiet_progress(description):
+    return lambda done, total: None
+
+
+def legacy_users(count):
+    return [{"username": f"aluno{n}", "password": "hash", "age": 20, "location": "SP", "role": "user"}
+            for n in range(count)]
+
+
+def count_users(main):
+    return main.open_user_store().execute("SELECT count(*) FROM users").fetchone()[0]
+
+
+def test_legacy_import_interrupted_in_first_batch_resumes(main, monkeypatch):
+    main.write_json_atomic(main.USER_DATA_FILE, {"users": legacy_users(25)})
+    monkeypatch.setattr(main, "MIGRATION_BATCH_SIZE", 10)
+    add_users = main.add_users
+
+    def add_users_then_crash(users):
+        add_users(users)
+        raise RuntimeError("queda simulada")  # Depois de gravar o lote, antes do checkpoint
+
+    monkeypatch.setattr(main, "add_users", add_users_then_crash)
+    with pytest.raises(RuntimeError):
+        main.migrate_schema(quiet_progress)
+    assert main.USERS_DB_FILE.exists()
+    assert main.schema_version() == 0
+
+    monkeypatch.setattr(main, "add_users", add_users)
+    main.migrate_schema(quiet_progress)
+    assert count_users(main) == 25
+    assert main.schema_version() == main.DATA_SCHEMA_VERSION
+
+
+def test_legacy_import_skipped_when_users_db_predates_migration(main):
+    main.write_json_atomic(main.USER_DATA_FILE, {"users": legacy_users(3)})
+    main.add_users(legacy_users(1))  # users.db criado (e importado) por uma versão anterior
+    applied = main.migrate_schema(quiet_progress)
+    assert applied[0][2] == "nada a importar"
+    assert count_users(main) == 1
+
+
+def test_location_index_rebuilt_in_batches(main, monkeypatch):
+    monkeypatch.setattr(main, "MIGRATION_BATCH_SIZE", 2)
+    main.add_users([dict(user, location=location) for user, location in
+                    zip(legacy_users(5), ["SP", "sp", "São Paulo", "RJ", "rio de janeiro"])])
+    conn = main.open_user_store()
+    with conn:
+        conn.execute("UPDATE users SET location_key = location")  # Chaves de antes da normalização
+    assert main.rebuild_location_index() == (3, 2)
+    assert (main.location_count("SP"), main.location_count("RJ")) == (3, 2)
+
+
+def test_canonical_usernames_merge_stats_written_during_the_scan(main, monkeypatch):
+    main.record_quiz_results([(" ana", "cyber_quiz", 10.0, 2, 3), ("ana", "cyber_quiz", 10.0, 1, 3)])
+    iter_json_items = main.iter_json_items
+
+    def iter_then_write(file_path, default_data):
+        yield from iter_json_items(file_path, default_data)
+        main.record_quiz_results([(" ana", "cyber_quiz", 10.0, 3, 3)])  # Outra sessão grava sem esperar
+
+    monkeypatch.setattr(main, "iter_json_items", iter_then_write)
+    main.migrate_canonical_usernames({}, lambda **values: None, lambda done, total: None)
+
+    stats = main.load_json(main.STATS_FILE, {})
+    assert " ana" not in stats
+    assert (stats["ana"]["cyber_quiz"]["attempts"], stats["ana"]["cyber_quiz"]["correct_answers"]) == (3, 6)
+
+
+def test_legacy_stats_get_total_questions_and_rank_by_accuracy(main):
+    legacy = {"total_time": 5.0, "attempts": 1, "average_time": 5.0}
+    main.write_json_atomic(main.STATS_FILE, {
+        "angela": {"cyber_quiz": dict(legacy, correct_answers=3)},
+        "Danii": {"cyber_quiz": dict(legacy, correct_answers=3, total_time=2.0, average_time=2.0),
+                  "logic_quiz": dict(legacy, correct_answers=0)},
+    })
+    main.load_aggregates()  # Agregados criados antes da migração, sem a taxa de acerto dessas tentativas
+    assert main.leaderboard_rank("angela") == (2, 2)
+
+    main.migrate_schema(quiet_progress)
+
+    questions = len(main.load_course("cyber_quiz")["questions"])
+    assert main.load_json(main.STATS_FILE, {})["angela"]["cyber_quiz"]["total_questions"] == questions
+    assert main.leaderboard_rank("angela") == (1, 2)
+    platform = main.aggregate_summary(main.load_aggregates()["platform"])
+    assert platform["accuracy"] == 6 / (2 * questions + len(main.load_course("logic_quiz")["questions"]))
+    assert main.migrate_legacy_totals({}, lambda **values: None, quiet_progress("")) == \
+        "0 total(is) de questões completado(s)"
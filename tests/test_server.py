@@ -0,0 +1,29 @@
+"""Testes do modo servidor (protocolo JSON por linha)."""
+import asyncio
+
+
+def login(main, peer):
+    session = {"user": None, "quiz": None, "peer": peer}  # Uma conexão nova a cada tentativa
+    request = {"cmd": "login", "username": "ana", "password": "errada"}
+    return asyncio.run(main.handle_request(session, request))["error"]
+
+
+def test_login_limit_survives_reconnects(main):
+    errors = [login(main, "10.0.0.1") for _ in range(main.LOGIN_BURST + 1)]
+
+    assert all("incorretos" in error for error in errors[:-1])
+    assert "Muitas tentativas" in errors[-1]
+    assert "incorretos" in login(main, "10.0.0.2")  # Outro endereço tem o próprio balde
+
+
+def test_idle_peer_buckets_expire(main, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(main.time, "monotonic", lambda: now[0])
+    for _ in range(main.LOGIN_BURST):
+        main.take_token(main.peer_token_bucket("10.0.0.1"))
+    assert main.take_token(main.peer_token_bucket("10.0.0.1"))
+
+    now[0] += main.LOGIN_BURST * main.LOGIN_REFILL_SECONDS
+    main.peer_token_bucket("10.0.0.2")
+
+    assert list(main._peer_buckets) == ["10.0.0.2"]
@@ -0,0 +1,61 @@
+"""Testes das sessões com gravação em segundo plano (write-behind)."""
+import importlib
+import sys
+import time
+
+import pytest
+
+OUTCOMES = [(0, "A", True, 5.0), (1, "B", True, 5.0), (2, "C", False, 5.0)]
+
+
+def test_failed_flush_retries_only_unwritten_files(main, monkeypatch):
+    monkeypatch.setattr(main, "SESSION_DURABILITY", "sync")
+    session = main.open_session({"username": "ana"})
+    update_json = main.update_json
+    failing = [main.AGGREGATES_FILE]
+
+    def update_json_once_failing(file_path, *args, **kwargs):
+        if file_path in failing:
+            failing.remove(file_path)
+            raise OSError("disco cheio")  # Depois de o statistics.json já ter sido gravado
+        return update_json(file_path, *args, **kwargs)
+
+    monkeypatch.setattr(main, "update_json", update_json_once_failing)
+    with pytest.raises(OSError):
+        main.session_record_quiz(session, "cyber_quiz", time.time(), 15.0, OUTCOMES)
+    main.close_session(session)
+
+    stats = main.load_json(main.STATS_FILE, {})["ana"]["cyber_quiz"]
+    assert (stats["attempts"], stats["correct_answers"], stats["total_questions"]) == (1, 2, 3)
+    assert main.load_aggregates()["platform"]["attempts"] == 1
+    assert main.load_json(main.USER_AGGREGATES_FILE, {})["ana"]["attempts"] == 1
+    assert main.load_json(main.QUESTION_STATS_FILE, {})["cyber_quiz"]["0"][0] == 1
+
+
+def test_unknown_durability_mode_is_rejected(tmp_path, monkeypatch):
+    monkeypatch.setenv("UNIAO_DATA_DIR", str(tmp_path / "data"))
+    monkeypatch.setenv("UNIAO_DURABILITY", "sinc")
+    monkeypatch.delitem(sys.modules, "main", raising=False)
+    with pytest.raises(ValueError, match="UNIAO_DURABILITY"):
+        importlib.import_module("main")
+
+
+def test_session_stats_load_falls_back_when_the_flusher_fails(main, monkeypatch):
+    monkeypatch.setattr(main, "SESSION_DURABILITY", "exit")
+    main.record_quiz_results([("ana", "cyber_quiz", 10.0, 2, 3)])
+    load_json_items = main.load_json_items
+    failures = [RuntimeError("falha inesperada")]
+
+    def load_json_items_once_failing(*args):
+        if failures:
+            raise failures.pop()  # Na thread de gravação, ao carregar a sessão
+        return load_json_items(*args)
+
+    monkeypatch.setattr(main, "load_json_items", load_json_items_once_failing)
+    session = main.open_session({"username": "ana"})
+    assert session["loaded"].wait(5)
+
+    assert main.session_user_stats(session)["cyber_quiz"]["attempts"] == 1
+    assert main._flusher["thread"].is_alive()
+    main.close_session(session)
+    main.stop_session_flusher()
@@ -0,0 +1,65 @@
+"""Testes dos snapshots incrementais e da restauração."""
+import time
+
+OUTCOMES = [(0, "A", True, 5.0), (1, "B", False, 5.0)]
+
+
+def play_quiz(main, username):
+    session = main.open_session({"username": username})
+    main.session_record_quiz(session, "cyber_quiz", time.time(), 10.0, OUTCOMES)
+    main.close_session(session)
+
+
+def test_restore_brings_back_every_data_file(main, monkeypatch):
+    monkeypatch.setattr(main, "SESSION_DURABILITY", "sync")
+    play_quiz(main, "ana")
+    snapshot_id, _ = main.create_snapshot()
+    assert {main.QUESTION_STATS_FILE, main.LEARNER_STATS_FILE} <= set(main.SNAPSHOT_JSON_FILES)
+
+    play_quiz(main, "ana")
+    play_quiz(main, "bia")
+    main.restore_snapshot(snapshot_id)
+
+    assert main.load_json(main.QUESTION_STATS_FILE, {})["cyber_quiz"]["0"][0] == 1
+    assert set(main.load_json(main.LEARNER_STATS_FILE, {})) == {"ana"}
+    assert set(main.load_json(main.STATS_FILE, {})) == {"ana"}
+
+
+def record_quizzes(main, first, count):
+    main.record_quiz_results([(f"aluno{n}", "cyber_quiz", 10.0, 2, 3) for n in range(first, first + count)])
+
+
+def test_snapshot_after_compaction_keeps_the_new_journal(main, monkeypatch):
+    monkeypatch.setattr(main, "SNAPSHOT_CHUNK_BYTES", 256)
+    monkeypatch.setattr(main, "schedule_compaction", lambda file_path: None)  # Compacta só quando o teste pede
+    journal = main.journal_path(main.STATS_FILE)
+    record_quizzes(main, 0, 20)
+    main.create_snapshot()
+    main.compact_json(main.STATS_FILE)
+    assert not journal.exists()
+    record_quizzes(main, 20, 40)  # O novo diário é maior e pode receber o inode do antigo
+    snapshot_id, _ = main.create_snapshot()
+    live = {path: path.read_bytes() for path in (main.STATS_FILE, journal)}
+
+    record_quizzes(main, 60, 5)
+    main.restore_snapshot(snapshot_id)
+
+    assert {path: path.read_bytes() for path in live} == live
+
+
+def test_snapshot_rereads_a_different_file_with_the_same_inode(main, monkeypatch):
+    monkeypatch.setattr(main, "SNAPSHOT_CHUNK_BYTES", 256)
+    monkeypatch.setattr(main, "schedule_compaction", lambda file_path: None)
+    journal = main.journal_path(main.STATS_FILE)
+    record_quizzes(main, 0, 20)
+    main.create_snapshot()
+    with journal.open('r+b') as file:  # Mesmo inode, conteúdo novo e maior (como um diário recriado)
+        content = file.read()
+        file.seek(0)
+        file.write(content.replace(b"aluno", b"outro") + content)
+    live = journal.read_bytes()
+    snapshot_id, _ = main.create_snapshot()
+
+    main.restore_snapshot(snapshot_id)
+
+    assert journal.read_bytes() == live